@@ -0,0 +1,314 @@
+"""
+pipeline_benchmark.py
+This script benchmarks the pipeline end to end without network access or a Neo4j server.
+For every corpus size it generates a synthetic financial-news corpus, serves the articles as HTML pages from
+a local HTTP stand-in server and drives, against a local graph backend:
+    process_csv: fetching, parsing and summarizing every article URL of an uploaded CSV.
+    store_correlation_scores_stream: comparing every pair of articles and writing the correlation graph.
+    run_hierarchical_clustering: Ward linkage and dendrogram of the graph.
+    run_lda_clustering: LDA topic assignments and plot of the articles.
+The correlation stage compares every pair, so it only runs on the first --correlation-docs articles (all of
+the articles are still stored as nodes, so the clustering stages run on the full corpus).
+Every size runs in its own process so the peak memory figures do not carry over between sizes. The report is
+one JSON document with the throughput and latency percentiles (p50/p95/p99) of every stage, the peak resident
+memory a stage added on top of what the process held when it started, and the peak resident memory of the
+whole process per size, meant to be stored and compared across versions.
+The embedded backend keeps the graph in dense n x n matrices, so by default (--backend auto) sizes above
+EMBEDDED_MAX_DOCS run against the sparse stand-in of sparse_graph.py instead; with the dense matrices the
+figures for 10k articles would measure the backend rather than the pipeline. Every result names its backend.
+process_csv starts a task with its own HTTP client for every URL at once, so its memory grows by roughly
+0.85 MB per URL (1.7 GB for 2000 URLs); the 10k size needs a host with about 10 GB of memory. A size whose
+process dies (e.g. killed for running out of memory) is reported with its exit code.
+Usage:
+    python benchmarks/pipeline_benchmark.py --sizes 100 1000 10000 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+COMPANIES = ["Apex Capital", "Northwind Bank", "Helios Energy", "Quantum Semiconductors", "Blue Harbor Insurance",
+             "Granite Mining", "Vertex Pharma", "Silverline Retail", "Orion Motors", "Cobalt Telecom"]
+SECTORS = ["banking", "energy", "semiconductor", "insurance", "mining", "pharmaceutical", "retail",
+           "automotive", "telecom", "real estate"]
+EVENTS = ["reported quarterly earnings above expectations", "cut its full-year revenue guidance",
+          "announced a share buyback programme", "agreed to acquire a smaller rival",
+          "faced a regulatory investigation", "raised its dividend", "issued new corporate bonds",
+          "warned of supply chain disruptions", "replaced its chief executive", "expanded into Asian markets"]
+MARKET_LINES = ["Shares rose {pct}% in early trading as investors welcomed the news.",
+                "The stock fell {pct}% while the broader index was flat.",
+                "Analysts at several brokers raised their price targets by {pct}%.",
+                "Bond yields moved {pct} basis points higher after the central bank meeting.",
+                "Trading volume was {pct} times the monthly average.",
+                "The company said margins would recover in the second half of the year.",
+                "Inflation data released on Tuesday weighed on rate-sensitive {sector} stocks.",
+                "Peers in the {sector} sector traded mixed during the session."]
+
+# Deterministic synthetic article i: a title and a few paragraphs of financial news
+def make_article(i: int, seed: int = 0):
+    rng = random.Random(seed * 1_000_003 + i)
+    company, sector, event = rng.choice(COMPANIES), rng.choice(SECTORS), rng.choice(EVENTS)
+    title = f"{company} {event} ({i})"
+    paragraphs = [f"{company}, the {sector} group, {event} on {rng.choice(['Monday', 'Wednesday', 'Friday'])}."]
+    for _ in range(rng.randint(3, 6)):
+        lines = [rng.choice(MARKET_LINES).format(pct=rng.randint(1, 15), sector=sector)
+                 for _ in range(rng.randint(2, 4))]
+        paragraphs.append(" ".join(lines))
+    return title, paragraphs
+
+def render_article(i: int, seed: int = 0):
+    title, paragraphs = make_article(i, seed)
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+    return f"<html><head><title>{title}</title></head><body><h1>{title}</h1>{body}</body></html>".encode("utf-8")
+
+# Local stand-in for the news sites: /article/<i> renders synthetic article i
+class _ArticleHandler(BaseHTTPRequestHandler):
+    seed = 0
+
+    def do_GET(self):
+        try:
+            index = int(self.path.rstrip("/").rsplit("/", 1)[-1])
+        except ValueError:
+            self.send_error(404)
+            return
+        page = render_article(index, self.seed)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, *args):
+        pass
+
+def start_server(seed: int):
+    handler = type("ArticleHandler", (_ArticleHandler,), {"seed": seed})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Largest corpus the dense embedded graph handles comfortably (its matrices take about 9 * n^2 bytes)
+EMBEDDED_MAX_DOCS = 4000
+BACKENDS = ("auto", "embedded", "sparse")
+
+# Seconds between resident memory samples while a stage runs
+RSS_SAMPLE_INTERVAL = 0.005
+
+# Peak resident memory of the whole process so far
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 / 1024 / 1024 if sys.platform == "darwin" else 1 / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        # Without /proc only the process-wide peak is known, so a stage's delta is a lower bound
+        return peak_rss_mb()
+
+# Samples the resident memory in a background thread while a stage runs. ru_maxrss is a high-water mark of
+# the whole process, so it cannot tell how much memory a stage after a larger one used.
+class StageMemory:
+    def __enter__(self):
+        self.start = current_rss_mb()
+        self.peak = self.start
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+        return False
+
+    @property
+    def peak_delta_mb(self):
+        return self.peak - self.start
+
+# Run one stage and add the peak memory it used on top of what the process held before
+def run_stage(func, *args):
+    with StageMemory() as memory:
+        report = func(*args)
+    report["peak_rss_delta_mb"] = memory.peak_delta_mb
+    return report
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+    def at(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99)}
+
+def stage_report(items: int, seconds: float, latencies, **extra):
+    report = {"items": items, "seconds": seconds,
+              "throughput_per_s": items / seconds if seconds > 0 else None,
+              "latency_s": percentiles(latencies)}
+    report.update(extra)
+    return report
+
+# Upload a CSV of n article URLs; the latency of an article is the time until its progress update arrives
+def bench_process_csv(process_csv, base_url: str, n_docs: int):
+    contents = ("URL\n" + "".join(f"{base_url}/article/{i}\n" for i in range(n_docs))).encode("utf-8")
+
+    async def run():
+        latencies, last = [], None
+        start = time.perf_counter()
+        async for update in process_csv(contents):
+            last = json.loads(update)
+            if last.get("status") == "processing":
+                latencies.append(time.perf_counter() - start)
+        return time.perf_counter() - start, latencies, last
+
+    seconds, latencies, last = asyncio.run(run())
+    return stage_report(n_docs, seconds, latencies, errors=(last or {}).get("errors"),
+                        status=(last or {}).get("status"))
+
+# Compare every pair of the first correlation_docs articles; the latency of a pair is the gap between updates
+def bench_correlations(causal, titles, texts, dataset):
+    latencies, previous = [], None
+    start = time.perf_counter()
+    for update in causal.store_correlation_scores_stream(dataset, titles, texts):
+        now = time.perf_counter()
+        # One update per pair after the first "Processing" update, which follows the node writes
+        if json.loads(update)["current_status"] == "Processing":
+            if previous is not None:
+                latencies.append(now - previous)
+            previous = now
+    seconds = time.perf_counter() - start
+    return stage_report(len(latencies), seconds, latencies, docs=len(texts))
+
+def bench_call(func, n_docs: int, repeat: int):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return stage_report(n_docs * repeat, sum(latencies), latencies, runs=repeat)
+
+# Backend a size runs against: the dense embedded graph up to EMBEDDED_MAX_DOCS, the sparse stand-in beyond
+def resolve_backend(backend: str, n_docs: int):
+    if backend == "auto":
+        return "embedded" if n_docs <= EMBEDDED_MAX_DOCS else "sparse"
+    return backend
+
+# Benchmark one corpus size in this process, which must not have imported the pipeline yet
+def run_size(n_docs: int, correlation_docs: int, repeat: int, seed: int, backend: str = "embedded"):
+    os.environ["GRAPH_BACKEND"] = "embedded"
+    os.environ.pop("EMBEDDED_GRAPH_PATH", None)
+    # Every size starts without cached artifacts from an earlier run
+    workdir = tempfile.mkdtemp(prefix="pipeline_benchmark_")
+    os.environ["RENDER_CACHE_DIR"] = os.path.join(workdir, "render_cache")
+    os.environ["LDA_CACHE_DIR"] = os.path.join(workdir, "lda_cache")
+    os.environ["QUERY_CACHE_SIZE"] = "0"
+    os.environ["ARTIFACTS_DIR"] = os.path.join(workdir, "artifacts")
+    os.environ["SHARED_STORE_URI"] = "memory://"
+    os.chdir(workdir)
+    sys.path.insert(0, SRC_DIR)
+
+    from services import causal
+    from services.extractor import process_csv
+    from services.cluster import run_hierarchical_clustering, run_lda_clustering
+    from utils.graph_backend import DEFAULT_DATASET
+    from utils.query_cache import bump_graph_generation
+    if backend == "sparse":
+        from sparse_graph import SparseGraphConnector
+        # Every graph access of the pipeline goes through causal's connectors
+        causal.get_connector = SparseGraphConnector
+
+    server = start_server(seed)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    stages = {"process_csv": run_stage(bench_process_csv, process_csv, base_url, n_docs)}
+    server.shutdown()
+
+    # Downstream stages use the generated corpus, so they do not depend on the summarizer's resources
+    articles = [make_article(i, seed) for i in range(n_docs)]
+    titles = [title for title, _ in articles]
+    texts = ["\n".join(paragraphs) for _, paragraphs in articles]
+    subset = min(n_docs, correlation_docs)
+    stages["store_correlation_scores_stream"] = run_stage(bench_correlations, causal, titles[:subset],
+                                                          texts[:subset], DEFAULT_DATASET)
+    connector = causal.get_connector()
+    for i in range(subset, n_docs):
+        connector.create_corpus_node(i, titles[i], texts[i], DEFAULT_DATASET)
+    bump_graph_generation()
+    connector.close()
+
+    stages["run_hierarchical_clustering"] = run_stage(bench_call, lambda: run_hierarchical_clustering(), n_docs,
+                                                      repeat)
+    stages["run_lda_clustering"] = run_stage(bench_call, lambda: run_lda_clustering(n_topics=5), n_docs, repeat)
+    return {"n": n_docs, "backend": backend, "stages": stages, "peak_rss_mb": peak_rss_mb()}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=SRC_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="Corpus sizes; process_csv alone needs about 0.85 MB per URL, so 10000 needs about "
+                             "10 GB of memory")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto",
+                        help=f"Graph backend: the dense embedded graph, the sparse stand-in, or (auto) the embedded "
+                             f"graph up to {EMBEDDED_MAX_DOCS} articles and the sparse stand-in beyond")
+    parser.add_argument("--correlation-docs", type=int, default=100,
+                        help="Articles whose pairs are compared by the (quadratic) correlation stage")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each clustering stage")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_size(args.single, args.correlation_docs, args.repeat, args.seed,
+                                  resolve_backend(args.backend, args.single))))
+        return
+
+    results = []
+    for n_docs in args.sizes:
+        command = [sys.executable, os.path.abspath(__file__), "--single", str(n_docs),
+                   "--correlation-docs", str(args.correlation_docs), "--repeat", str(args.repeat),
+                   "--seed", str(args.seed), "--backend", resolve_backend(args.backend, n_docs)]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            # A negative exit code is the signal that killed the process, -9 usually means out of memory
+            results.append({"n": n_docs, "returncode": completed.returncode,
+                            "error": completed.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        print(f"n={n_docs} done", file=sys.stderr)
+
+    report = {"commit": _git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+              "timestamp": time.time(), "correlation_docs": args.correlation_docs, "results": results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
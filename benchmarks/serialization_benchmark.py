@@ -0,0 +1,110 @@
+"""
+serialization_benchmark.py
+This script measures the cost of the JSON response path of the API per endpoint: the time spent serializing
+the endpoint's payload with FastAPI's default path (jsonable_encoder + json.dumps) and with orjson, and the
+bytes sent on the wire without compression, with gzip and with brotli (when installed).
+It fills the embedded graph backend with a synthetic corpus, so no Neo4j server is needed.
+Usage:
+    python benchmarks/serialization_benchmark.py --docs 500 --repeat 5
+Prints one JSON object per endpoint.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# Run against the in-process graph without touching a snapshot on disk
+os.environ["GRAPH_BACKEND"] = "embedded"
+os.environ.pop("EMBEDDED_GRAPH_PATH", None)
+os.environ["SHARED_STORE_URI"] = "memory://"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from utils.graph_backend import get_connector
+from utils.neighbors import TopKNeighbors
+from utils.query_cache import bump_graph_generation
+from utils.responses import ORJSON_OPTIONS, brotli
+from app import app
+
+ENDPOINTS = {
+    "query-all-correlations": "/query-all-correlations/",
+    "query-pairwise-causal": "/query-pairwise-causal/",
+    "query-highest-correlation": "/query-highest-correlation/?limit=1000",
+    "hierarchical-clusters": "/hierarchical-clusters/?n_clusters=8",
+}
+
+# Fill the graph with n_docs corpora, every pair correlated, and their materialized neighbours
+def populate_graph(n_docs: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    titles = [f"Synthetic article {i}" for i in range(n_docs)]
+    connector = get_connector()
+    neighbors = TopKNeighbors()
+    for i, title in enumerate(titles):
+        connector.create_corpus_node(i, title, f"synthetic text {i}")
+    for i in range(n_docs):
+        for j in range(i + 1, n_docs):
+            correlation = float(rng.random())
+            connector.create_correlation_relationship(i, j, correlation)
+            neighbors.add(i, j, correlation)
+    for i in range(n_docs):
+        top = neighbors.top(i)
+        connector.store_neighbors(i, [other for other, _ in top], [titles[other] for other, _ in top],
+                                  [score for _, score in top])
+    bump_graph_generation()
+    connector.close()
+
+def _timed(func, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+# Decode the payload of an endpoint (NDJSON streams become a list of records)
+def _payload(client, path):
+    response = client.get(path, headers={"Accept-Encoding": "identity"})
+    if response.headers["content-type"].startswith("application/x-ndjson"):
+        return [json.loads(line) for line in response.text.splitlines()]
+    return response.json()
+
+# Size of the body as sent, before the client decodes the content encoding
+def _wire_bytes(client, path, encoding):
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return sum(len(chunk) for chunk in response.iter_raw())
+
+def benchmark(n_docs: int, repeat: int):
+    populate_graph(n_docs)
+    # Measure the endpoints, not the rate limiter
+    app.state.limiter.enabled = False
+    client = TestClient(app)
+    results = []
+    for name, path in ENDPOINTS.items():
+        payload = _payload(client, path)
+        result = {
+            "endpoint": name,
+            "docs": n_docs,
+            "default_serialize_s": _timed(lambda: json.dumps(jsonable_encoder(payload)).encode("utf-8"), repeat),
+            "orjson_serialize_s": _timed(lambda: orjson.dumps(payload, option=ORJSON_OPTIONS), repeat),
+            "request_s": _timed(lambda: client.get(path, headers={"Accept-Encoding": "identity"}), repeat),
+            "identity_bytes": _wire_bytes(client, path, "identity"),
+            "gzip_bytes": _wire_bytes(client, path, "gzip"),
+        }
+        if brotli is not None:
+            result["br_bytes"] = _wire_bytes(client, path, "br")
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark JSON serialization and compression per endpoint")
+    parser.add_argument("--docs", type=int, default=500, help="Number of synthetic articles")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per measurement (median reported)")
+    args = parser.parse_args()
+    benchmark(args.docs, args.repeat)
@@ -0,0 +1,129 @@
+"""
+api_client.py
+This module is the frontend's client of the API. Every request goes through one pooled keep-alive
+requests.Session shared by all Streamlit sessions, instead of a new connection (and thread) per call.
+Read endpoints are cached for API_CACHE_TTL seconds, keyed on the graph generation token of the backend
+(/graph-generation/), so a cached read is dropped as soon as the graph changes. Files (the data CSV and
+the clustering images) are revalidated with their ETag and only downloaded again when they changed.
+invalidate() drops every cached read and is called after uploads, clears and other writes.
+Functions:
+    get_session() -> requests.Session: Returns the shared pooled session.
+    graph_generation() -> Optional[int]: Returns the backend's graph generation token.
+    cached_get(path, params) -> Optional[dict]: Returns a read endpoint's JSON through the TTL cache.
+    get_file(path, params) -> Optional[bytes]: Returns a file endpoint's content, revalidated by ETag.
+    api_call(method, path, loading_text, **kwargs) -> Optional[dict]: Calls an endpoint and returns its JSON.
+    stream(method, path, **kwargs) -> requests.Response: Starts a streaming request.
+    invalidate(): Drops every cached read.
+"""
+import json
+import os
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+import streamlit as st
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+API_BASE_URL = os.getenv("API_BASE_URL")
+# Seconds a read stays cached while the graph generation is unchanged
+API_CACHE_TTL = float(os.getenv("API_CACHE_TTL", "60"))
+# Keep-alive connections kept open to the API
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "10"))
+# Seconds to wait for the API to accept a request and send its response headers
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "300"))
+
+# One session (and connection pool) for the whole Streamlit server, shared by every user session
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _url(path: str) -> str:
+    return f"{API_BASE_URL}{path}"
+
+# Decode a response: NDJSON streams become a list of records, other bodies JSON or a message
+def _parse(response):
+    if response.headers.get("content-type", "").startswith("application/x-ndjson"):
+        results = []
+        for line in response.iter_lines():
+            if line:
+                try:
+                    results.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return results
+    try:
+        return response.json()
+    except requests.exceptions.JSONDecodeError:
+        return {"message": response.text}
+
+def graph_generation():
+    try:
+        response = get_session().get(_url("/graph-generation/"), timeout=API_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["generation"]
+    except (requests.RequestException, KeyError, ValueError) as e:
+        # Without the token reads still expire after API_CACHE_TTL
+        logger.warning(f"Could not read the graph generation: {e}")
+        return None
+
+# The generation is part of the cache key, so reads of an older graph are never served
+@st.cache_data(ttl=API_CACHE_TTL, show_spinner=False)
+def _cached_get(path: str, params: tuple, generation):
+    response = get_session().get(_url(path), params=dict(params), timeout=API_TIMEOUT)
+    response.raise_for_status()
+    return _parse(response)
+
+def cached_get(path: str, params: dict = None, loading_text: str = "Loading..."):
+    with st.spinner(loading_text):
+        try:
+            return _cached_get(path, tuple(sorted((params or {}).items())), graph_generation())
+        except requests.RequestException as e:
+            st.error(f"Error: {e}")
+            return None
+
+# url -> (etag, content) of the files downloaded so far
+@st.cache_resource
+def _file_cache():
+    return {}, threading.Lock()
+
+def get_file(path: str, params: dict = None):
+    cache, lock = _file_cache()
+    key = (path, tuple(sorted((params or {}).items())))
+    with lock:
+        cached = cache.get(key)
+    headers = {"If-None-Match": cached[0]} if cached is not None else {}
+    response = get_session().get(_url(path), params=params, headers=headers, timeout=API_TIMEOUT)
+    if response.status_code == 304 and cached is not None:
+        return cached[1]
+    if response.status_code != 200:
+        return None
+    etag = response.headers.get("etag")
+    if etag:
+        with lock:
+            cache[key] = (etag, response.content)
+    return response.content
+
+# Call an endpoint and return its JSON, showing a spinner meanwhile and an error on failure
+def api_call(method: str, path: str, loading_text: str = "Processing...", **kwargs):
+    with st.spinner(loading_text):
+        try:
+            response = get_session().request(method, _url(path), timeout=API_TIMEOUT, **kwargs)
+            return _parse(response)
+        except requests.RequestException as e:
+            st.error(f"Error: {e}")
+            return None
+
+def stream(method: str, path: str, **kwargs):
+    return get_session().request(method, _url(path), stream=True, timeout=API_TIMEOUT, **kwargs)
+
+def invalidate():
+    _cached_get.clear()
@@ -1,80 +1,30 @@
 import streamlit as st
-import requests
 import pandas as pd
 import json
-import threading
-from queue import Queue
-from contextlib import contextmanager
-from dotenv import load_dotenv
-import os
 from io import BytesIO
 from PIL import Image
 import logging
-import networkx as nx
-import matplotlib.pyplot as plt
+import time
+import altair as alt
+from api_client import api_call, cached_get, get_file, stream, invalidate
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# Network charts hold one row per correlation, well above altair's default limit of 5000 rows
+alt.data_transformers.disable_max_rows()
 
-# Constants
-API_BASE_URL = os.getenv("API_BASE_URL")
-
-def make_async_request(queue, request_func, *args, **kwargs):
-    try:
-        response = request_func(*args, **kwargs)
-        
-        # Handle streaming response
-        if response.headers.get('content-type') == 'application/x-ndjson':
-            # Process streaming JSON
-            results = []
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        results.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        continue
-            queue.put(("success", results))
-        else:
-            # Handle regular JSON response
-            try:
-                queue.put(("success", response.json()))
-            except requests.exceptions.JSONDecodeError:
-                # If JSON parsing fails, return raw text
-                queue.put(("success", {"message": response.text}))
-    except Exception as e:
-        queue.put(("error", str(e)))
-
-@contextmanager
-def loading_spinner(text="Processing..."):
-    with st.spinner(text):
-        yield
-
-def async_api_call(request_func, *args, loading_text="Processing...", **kwargs):
-    queue = Queue()
-    thread = threading.Thread(
-        target=make_async_request,
-        args=(queue, request_func, *args),
-        kwargs=kwargs,
-        daemon=True
-    )
-    
-    with loading_spinner(loading_text):
-        thread.start()
-        thread.join()
-        status, result = queue.get()
-        
-        if status == "error":
-            st.error(f"Error: {result}")
-            return None
-        return result
+# Seconds between redraws of the table of completed articles during an upload
+ARTICLE_TABLE_REFRESH = 0.5
 
 def process_upload_stream(response):
     """Process streaming response and yield progress updates"""
     progress_bar = None
     status_container = st.empty()
+    # Articles arrive in completion order, the table shows them by their row in the CSV
+    articles = {}
+    table_container = None
+    last_table_update = 0.0
     
     try:
         for line in response.iter_lines():
@@ -92,6 +42,17 @@ def process_upload_stream(response):
                         if progress_bar is not None:
                             progress_bar.progress(progress)
                     
+                    if 'article' in data:
+                        article = data['article']
+                        articles[article['index']] = article
+                        if table_container is None:
+                            # Placed below the progress bar
+                            table_container = st.empty()
+                        # Redrawing the table for every article would dominate large uploads
+                        if time.monotonic() - last_table_update >= ARTICLE_TABLE_REFRESH:
+                            show_article_table(table_container, articles)
+                            last_table_update = time.monotonic()
+                    
                     # Show detailed status updates
                     status_text = [
                         f"Status: {data['status']}",
@@ -107,6 +68,8 @@ def process_upload_stream(response):
                     
                     # If complete, return final message
                     if data['status'] == 'complete':
+                        if table_container is not None:
+                            show_article_table(table_container, articles)
                         return data
                         
                 except json.JSONDecodeError as e:
@@ -116,6 +79,10 @@ def process_upload_stream(response):
         logger.error(f"Error processing stream: {e}")
         raise
 
+def show_article_table(container, articles):
+    df = pd.DataFrame([articles[index] for index in sorted(articles)])
+    container.dataframe(df.rename(columns=str.capitalize), hide_index=True)
+
 def main():
     st.title("AI-fin-alyser")
     st.sidebar.title("Navigation")
@@ -142,11 +109,7 @@ def main():
 def show_home():
     st.header("Welcome to AI driven financial analysis")
     if st.button("Test Connection"):
-        result = async_api_call(
-            requests.get,
-            f"{API_BASE_URL}/test-connection/",
-            loading_text="Testing connection..."
-        )
+        result = api_call("GET", "/test-connection/", loading_text="Testing connection...")
         if result:
             st.write(result)
 
@@ -158,14 +121,13 @@ def show_upload_page():
         
         with st.spinner("Initializing upload..."):
             try:
-                response = requests.post(
-                    f"{API_BASE_URL}/upload/",
-                    files=files,
-                    stream=True  # Enable streaming response
-                )
+                # Completed articles come with the progress updates, no CSV download is needed to see them
+                response = stream("POST", "/upload/", files=files, params={"include_articles": "true"})
                 
                 if response.status_code == 200:
                     final_result = process_upload_stream(response)
+                    # The data changed, cached reads of the previous upload are stale
+                    invalidate()
                     if final_result and final_result['status'] == 'complete':
                         st.success(final_result['message'])
                 else:
@@ -180,39 +142,38 @@ def show_view_data():
     if st.button("Show All Data"):
         with st.spinner("Loading data..."):
             try:
-                response = requests.get(f"{API_BASE_URL}/view-data/")
+                # Only downloaded again when the data changed since the last request
+                content = get_file("/view-data/")
                 
-                if response.status_code == 200:
-                    content_type = response.headers.get('content-type', '')
-                    
-                    if 'text/csv' in content_type:
-                        # Create a download button for the CSV
-                        st.download_button(
-                            label="📥 Download CSV",
-                            data=response.content,
-                            file_name="extracted_data.csv",
-                            mime="text/csv"
-                        )
-                        st.success("Data ready for download!")
-                    else:
-                        # Handle JSON response (likely an error message)
-                        result = response.json()
-                        st.write(result)
+                if content is not None:
+                    # Create a download button for the CSV
+                    st.download_button(
+                        label="📥 Download CSV",
+                        data=content,
+                        file_name="extracted_data.csv",
+                        mime="text/csv"
+                    )
+                    st.success("Data ready for download!")
                 else:
-                    st.error(f"Failed to load data. Status code: {response.status_code}")
+                    st.error("Failed to load data.")
                     
             except Exception as e:
                 st.error(f"Error loading data: {str(e)}")
 
+    st.subheader("Search Articles")
+    query = st.text_input("Search titles, summaries and content")
+    if query:
+        result = cached_get("/search/", {"q": query, "limit": 20}, loading_text="Searching...")
+        if result and "hits" in result:
+            if not result["hits"]:
+                st.info("No matching articles.")
+            for hit in result["hits"]:
+                st.markdown(f"**{hit['title']}**  \n{hit['snippet']}")
+
     st.subheader("Query by Title")
     title = st.text_input("Enter title to search")
     if title and st.button("Search"):
-        result = async_api_call(
-            requests.get,
-            f"{API_BASE_URL}/query-by-title/",
-            params={"title": title},
-            loading_text="Searching..."
-        )
+        result = cached_get("/query-by-title/", {"title": title}, loading_text="Searching...")
         if result:
             st.write(result)
 
@@ -225,7 +186,7 @@ def show_correlations():
         progress_bar = st.progress(0)
         with st.spinner("Calculating correlations..."):
             try:
-                response = requests.get(f"{API_BASE_URL}/calculate-correlation/", stream=True)
+                response = stream("GET", "/calculate-correlation/")
                 for line in response.iter_lines():
                     if line:
                         try:
@@ -239,32 +200,40 @@ def show_correlations():
                             progress_text.text(f"Status: {status} — {processed} of {total} pairs processed")
                             
                             if status == "Completed":
+                                invalidate()
                                 st.success("Correlation calculation completed!")
                         except Exception as e:
                             st.error(f"Error parsing update: {e}")
             except Exception as e:
                 st.error(f"Error during correlation calculation: {e}")
     
-    if st.button("Show Pairwise Causal Relations"):
-        result = async_api_call(
-            requests.get,
-            f"{API_BASE_URL}/query-pairwise-causal/",
-            loading_text="Loading causal relations..."
+    # The backend reduces the network and lays it out, the chart only draws the returned coordinates
+    st.subheader("Correlation Network")
+    col1, col2, col3 = st.columns(3)
+    top_k = col1.number_input("Neighbours per article", min_value=1, max_value=10, value=3)
+    threshold = col2.slider("Minimum correlation", min_value=0.0, max_value=1.0, value=0.0, key="network_threshold")
+    max_nodes = col3.number_input("Maximum articles", min_value=10, max_value=5000, value=1000, step=100)
+    if st.button("Show Correlation Network"):
+        network = cached_get(
+            "/correlation-network/",
+            {"top_k": top_k, "threshold": threshold, "max_nodes": max_nodes},
+            loading_text="Loading correlation network..."
         )
-        if result and result.get('result'):
-            st.subheader("Correlation Network Visualization")
-            image_buf = create_correlation_network(result['result'])
-            st.image(image_buf, caption="Correlation Network", use_container_width=True)
+        if network and "nodes" in network:
+            if not network["nodes"]["id"]:
+                st.info("No correlations above the threshold.")
+            else:
+                st.altair_chart(correlation_network_chart(network), use_container_width=True)
+                st.caption(f"{len(network['nodes']['id'])} of {network['total_nodes']} articles, "
+                           f"{len(network['edges']['source'])} correlations")
+        elif network:
+            st.error(network.get("error", "Failed to load the correlation network"))
     
     st.subheader("Highest Correlations")
     limit = st.number_input("Number of top correlations", min_value=1, value=1)
     if st.button("Get Highest Correlations"):
-        result = async_api_call(
-            requests.get,
-            f"{API_BASE_URL}/query-highest-correlation/",
-            params={"limit": limit},
-            loading_text="Finding highest correlations..."
-        )
+        result = cached_get("/query-highest-correlation/", {"limit": limit},
+                            loading_text="Finding highest correlations...")
         if result:
             st.write(result)
 
@@ -276,10 +245,22 @@ def show_database_operations():
     confirm = col1.checkbox("I understand this will clear all data permanently")
     
     if col2.button("Clear Database", disabled=not confirm):
+        progress_text = st.empty()
+        progress_bar = st.progress(0)
         try:
-            response = requests.delete(f"{API_BASE_URL}/clear-database/")
+            response = stream("DELETE", "/clear-database/", params={"stream": True})
             if response.status_code == 200:
-                st.success("Database cleared successfully!")
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    update = json.loads(line)
+                    if update["status"] == "clearing":
+                        total = update["total"]
+                        progress_bar.progress(update["deleted"] / total if total else 1.0)
+                        progress_text.text(f"Deleting {update['stage']}: {update['deleted']} of {total}")
+                    elif update["status"] == "complete":
+                        invalidate()
+                        st.success("Database cleared successfully!")
             else:
                 st.error(f"Failed to clear database: {response.text}")
         except Exception as e:
@@ -300,26 +281,46 @@ def show_clustering():
     tab1, tab2 = st.tabs(["Hierarchical Clustering", "LDA Clustering"])
     
     with tab1:
+        # Ward builds the full dendrogram; the scalable engines return flat labels for large corpora
+        method = st.selectbox(
+            "Clustering engine",
+            ["ward", "kmeans", "neighbors"],
+            format_func=lambda m: {
+                "ward": "Ward linkage (dendrogram)",
+                "kmeans": "Mini-batch k-means (large corpora)",
+                "neighbors": "Top-k neighbour graph (large corpora)",
+            }[m]
+        )
+        params = {"method": method}
+        if method == "kmeans":
+            params["n_clusters"] = st.number_input("Number of clusters", min_value=2, max_value=500, value=8)
+        elif method == "neighbors":
+            params["threshold"] = st.slider("Minimum correlation", min_value=0.0, max_value=1.0, value=0.0)
+
         col1, col2 = st.columns(2)
         # Hierarchical clustering controls
         if col1.button("Run Hierarchical Clustering"):
-            result = async_api_call(
-                requests.get,
-                f"{API_BASE_URL}/run-hierarchical-clustering/",
-                loading_text="Running hierarchical clustering..."
-            )
+            result = api_call("GET", "/run-hierarchical-clustering/", params=params,
+                              loading_text="Running hierarchical clustering...")
             if result and result.get("message") == "Hierarchical clustering completed.":
                 st.success("Clustering completed successfully!")
                 st.session_state.clustering_completed = True
+            elif result and "labels" in result:
+                st.success(f"{result['message']} {result['n_clusters']} clusters found.")
+                labels = pd.DataFrame(
+                    sorted(result["labels"].items(), key=lambda item: int(item[0])),
+                    columns=["Document ID", "Cluster"]
+                )
+                st.dataframe(labels, use_container_width=True)
             else:
                 st.error("Clustering failed")
                 st.session_state.clustering_completed = False
         
         if col2.button("View Hierarchical Results", disabled=not st.session_state.clustering_completed):
             with st.spinner("Loading clustering visualization..."):
-                response = requests.get(f"{API_BASE_URL}/download-hierarchical-clustering-image/")
-                if response.status_code == 200:
-                    image = Image.open(BytesIO(response.content))
+                content = get_file("/download-hierarchical-clustering-image/")
+                if content is not None:
+                    image = Image.open(BytesIO(content))
                     st.image(image, caption="Hierarchical Clustering Results", use_container_width=True)
                 else:
                     st.error("Failed to load clustering visualization")
@@ -330,12 +331,8 @@ def show_clustering():
         col3, col4 = st.columns(2)
         
         if col3.button("Run LDA Clustering"):
-            result = async_api_call(
-                requests.get,
-                f"{API_BASE_URL}/run-lda-clustering/",
-                params={"n_topics": n_topics},
-                loading_text="Running LDA clustering..."
-            )
+            result = api_call("GET", "/run-lda-clustering/", params={"n_topics": n_topics},
+                              loading_text="Running LDA clustering...")
             if result and "message" in result:
                 st.success(result["message"])
                 st.session_state.lda_completed = True
@@ -345,54 +342,33 @@ def show_clustering():
         
         if col4.button("View LDA Results", disabled=not st.session_state.lda_completed):
             with st.spinner("Loading LDA visualization..."):
-                response = requests.get(f"{API_BASE_URL}/download-lda-clustering-image/")
-                if response.status_code == 200:
-                    image = Image.open(BytesIO(response.content))
+                content = get_file("/download-lda-clustering-image/")
+                if content is not None:
+                    image = Image.open(BytesIO(content))
                     st.image(image, caption="LDA Clustering Results", use_container_width=True)
                 else:
                     st.error("Failed to load LDA visualization")
 
-def create_correlation_network(data):
-    # Create a new graph
-    G = nx.Graph()
-    
-    # Add edges with weights
-    for item in data:
-        source = item['corpusTitle'].replace(' - Wikipedia', '')
-        target = item['highestCorrelationCorpus'].replace(' - Wikipedia', '')
-        weight = item['highestCorrelation']
-        
-        # Add edge with weight
-        G.add_edge(source, target, weight=weight)
-    
-    # Create the plot
-    plt.figure(figsize=(15, 10))
-    
-    # Calculate layout (you can experiment with different layouts)
-    pos = nx.spring_layout(G, k=1, iterations=50)
-    
-    # Draw the network
-    nx.draw_networkx_nodes(G, pos, node_color='lightblue', 
-                          node_size=2000, alpha=0.7)
-    
-    # Draw edges with varying thickness based on correlation
-    edges = G.edges()
-    weights = [G[u][v]['weight'] * 2 for u, v in edges]  # Scale up weights for visibility
-    nx.draw_networkx_edges(G, pos, width=weights, alpha=0.5)
-    
-    # Add labels
-    labels = {node: node for node in G.nodes()}
-    nx.draw_networkx_labels(G, pos, labels, font_size=8, font_weight='bold')
-    
-    plt.title("Correlation Network", pad=20)
-    plt.axis('off')
-    
-    # Save to buffer
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight', dpi=300)
-    plt.close()
-    buf.seek(0)
-    return buf
+# Interactive chart of a /correlation-network/ payload: edges as lines, articles as points sized by
+# weighted degree with their titles as tooltips; pan and zoom with the mouse
+def correlation_network_chart(network):
+    nodes = pd.DataFrame(network["nodes"])
+    edges = pd.DataFrame(network["edges"])
+    edges = edges.assign(
+        x=nodes["x"].to_numpy()[edges["source"]], y=nodes["y"].to_numpy()[edges["source"]],
+        x2=nodes["x"].to_numpy()[edges["target"]], y2=nodes["y"].to_numpy()[edges["target"]],
+    )
+    axis = alt.Axis(labels=False, ticks=False, grid=False, title=None, domain=False)
+    edge_layer = alt.Chart(edges).mark_rule(opacity=0.3).encode(
+        x=alt.X("x:Q", axis=axis), y=alt.Y("y:Q", axis=axis), x2="x2:Q", y2="y2:Q",
+        strokeWidth=alt.StrokeWidth("weight:Q", scale=alt.Scale(range=[0.3, 3]), legend=None),
+    )
+    node_layer = alt.Chart(nodes).mark_circle(color="steelblue", opacity=0.8).encode(
+        x="x:Q", y="y:Q",
+        size=alt.Size("degree:Q", scale=alt.Scale(range=[20, 300]), legend=None),
+        tooltip=["title:N", "id:Q", "degree:Q"],
+    )
+    return (edge_layer + node_layer).properties(height=700).interactive()
 
 if __name__ == "__main__":
     main()
@@ -1,31 +1,78 @@
-from fastapi import FastAPI, UploadFile, File, Request
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
+from fastapi import FastAPI, UploadFile, File, Request, Body
+from fastapi.responses import FileResponse, Response
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from services.extractor import process_csv_sync, return_df_as_csv
-from services.causal import (read_csv_extract_corpora, store_correlation_scores,
-                     query_corpus_by_title, query_all_correlations, 
+from services.extractor import process_csv_sync, data_artifact_path
+from services.causal import (read_csv_extract_corpora,
+                     query_corpus_by_title,
                      query_pairwise_causal, query_highest_correlation,
-                     clear_correlation_database, test_db_connection, store_correlation_scores_stream)
-from services.cluster import run_hierarchical_clustering, run_lda_clustering
+                     clear_correlation_database, test_db_connection, store_correlation_scores_stream,
+                     ensure_db_schema, stream_all_correlations, query_neighbors,
+                     clear_correlation_database_stream, get_correlation_progress)
+from services.cluster import (run_hierarchical_clustering, run_lda_clustering,
+                              run_scalable_clustering, CLUSTERING_METHODS,
+                              hierarchical_cluster_labels, lda_cluster_labels, get_linkage_tree,
+                              TRUNCATE_MODES, DENDROGRAM_TRUNCATE_P, run_lda_topic_sweep)
+from services.export import stream_export, EXPORT_FORMATS, EXPORT_TABLES
+from services.network import get_correlation_network, NETWORK_MAX_NODES
+from services.graph_analytics import get_connected_components, get_centrality, get_communities
+from services.jobs import get_scheduler, JobQueueFullError, JOB_KINDS
+from utils.neighbors import NEIGHBOR_TOP_K
+from utils.graph_backend import DEFAULT_DATASET, CLEAR_BATCH_SIZE
+from utils.responses import FastJSONResponse, CompressionMiddleware, ndjson_stream
+from utils.metrics import MetricsMiddleware, render_metrics, mark_worker_stopped
+from utils.profiling import (StreamingResponse, ProfilingMiddleware, ProfilingRoute, PROFILING_ENABLED,
+                             profile_path, profile_summary, token_allowed)
+from utils.http_cache import cached_file_response
+from utils.search_index import search
+from utils.query_cache import graph_generation
+from utils.shared_store import (RATE_LIMIT_STORAGE_URI, get_progress, artifact_path,
+                                DENDROGRAM_ARTIFACT, LDA_PLOT_ARTIFACT)
+from typing import Optional
 import logging
-import math
 import os
 
+# Maximum number of topic counts fitted by one LDA topic sweep
+LDA_SWEEP_MAX_COUNTS = 16
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# orjson serializes responses; returning FastJSONResponse directly from the endpoints with large
+# bodies also skips FastAPI's Python-level jsonable_encoder pass
+app = FastAPI(default_response_class=FastJSONResponse)
+if PROFILING_ENABLED:
+    # Only installed when enabled, so unprofiled deployments have no per-request profiling checks
+    app.router.route_class = ProfilingRoute
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(CompressionMiddleware)
+# Added last so it is outermost and the latency includes compression
+app.add_middleware(MetricsMiddleware)
 
-# Initialize the rate limiter
-limiter = Limiter(key_func=get_remote_address)
+# Initialize the rate limiter; its counters live in shared storage so the limits hold across API workers
+limiter = Limiter(key_func=get_remote_address, storage_uri=RATE_LIMIT_STORAGE_URI)
 app.state.limiter = limiter
 
+# Bootstrap the graph schema (constraints and indexes) at startup
+@app.on_event("startup")
+def bootstrap_schema():
+    try:
+        ensure_db_schema()
+        logger.info("Neo4j schema constraints and indexes are online.")
+    except Exception as e:
+        # The database may not be up yet; bulk writes retry the bootstrap before writing
+        logger.warning(f"Could not bootstrap Neo4j schema at startup: {e}")
+
+# Drop the live gauges of this worker from the metrics aggregated over all workers
+@app.on_event("shutdown")
+def stop_worker_metrics():
+    mark_worker_stopped()
+
 # Add exception handler for rate limit exceeded
 @app.exception_handler(RateLimitExceeded)
 async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=429,
         content={"detail": "Rate limit exceeded. Please try again later."},
     )
@@ -35,77 +82,203 @@ async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
 def read_root(request: Request):
     return {"Hello": "World"}
 
-# Endpoint to upload CSV files and stream progress updates
+# Download the pstats file of a profiled request (X-Profile-Id), or format=text for the top functions
+@app.get("/profiles/{profile_id}")
+@limiter.limit("5/second")
+def get_profile(request: Request, profile_id: str, format: str = "pstats"):
+    if not PROFILING_ENABLED or not token_allowed(request.headers):
+        return FastJSONResponse(status_code=404, content={"error": "Profiling is not enabled"})
+    if format == "text":
+        summary = profile_summary(profile_id)
+        if summary is not None:
+            return Response(summary, media_type="text/plain")
+    else:
+        path = profile_path(profile_id)
+        if path is not None:
+            return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.pstats")
+    return FastJSONResponse(status_code=404, content={"error": f"Profile {profile_id} not found"})
+
+# Prometheus text exposition of the stage latencies, queue depths, cache hit rates and endpoint latencies
+@app.get("/metrics")
+def metrics(request: Request):
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+# Endpoint to upload CSV files and stream progress updates; include_articles=true adds every completed
+# article (index, title, summary, accessibility) to its progress update
 @app.post("/upload/")
 @limiter.limit("3/second")
-async def upload_csv(request: Request, file: UploadFile = File(...)):
+async def upload_csv(request: Request, file: UploadFile = File(...), include_articles: bool = False):
     try:
         # Check if the uploaded file is a CSV
         if file.filename.endswith('.csv'):
             contents = await file.read()
             
             # Stream the progress updates
-            return StreamingResponse(process_csv_sync(contents)(), media_type="text/plain")
+            return StreamingResponse(process_csv_sync(contents, include_articles=include_articles)(),
+                                     media_type="text/plain")
         else:
             return {"error": "File is not a CSV"}
     except Exception as e:
         logging.error(f"Error: {e}")
         return {"error": str(e)}
 
-# Endpoint to print the DataFrame to a .txt file
+# Endpoint to download the processed data as CSV; include_content=false leaves out the article content.
+# Served with an ETag (304 when unchanged) and byte range support
 @app.get("/view-data/")
 @limiter.limit("5/second")
-def print_data(request: Request):
-    result = return_df_as_csv()
-    return Response(result, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=output_data.csv"})
+def print_data(request: Request, include_content: bool = True):
+    path = data_artifact_path(include_content)
+    response = None if path is None else cached_file_response(request, path, "text/csv", "output_data.csv")
+    if response is None:
+        return Response("No data available to return", media_type="text/csv",
+                        headers={"Content-Disposition": "attachment; filename=output_data.csv"})
+    return response
 
 # Endpoint to find correlation between all available corpora
 @app.get("/calculate-correlation/")
 @limiter.limit("3/second")
-def calculate_correlation(request: Request):
-    # Ensure the file path is correctly referenced
-    file_path = "printed_data.csv"
-    read_csv_extract_corpora(file_path)
+def calculate_correlation(request: Request, dataset: str = DEFAULT_DATASET):
+    # Read the articles of the last upload from the data artifact
+    titles, corpus = read_csv_extract_corpora()
     # Return a streaming response with progress updates
-    return StreamingResponse(store_correlation_scores_stream(), media_type="text/plain")
+    return StreamingResponse(store_correlation_scores_stream(dataset, titles, corpus), media_type="text/plain")
+
+# Token that changes whenever the graph is written or cleared, clients key their caches of graph reads on it
+@app.get("/graph-generation/")
+@limiter.limit("50/second")
+def get_graph_generation(request: Request):
+    return {"generation": graph_generation()}
+
+# Latest upload and correlation progress, whichever API worker is running them
+@app.get("/progress/")
+@limiter.limit("10/second")
+def get_pipeline_progress(request: Request):
+    return {"upload": get_progress("upload"), "correlation": get_correlation_progress()}
 
 @app.get("/query-by-title/")
 @limiter.limit("5/second")
 def query_by_title(request: Request, title: str):
     result = query_corpus_by_title(title)
-    return {"result": result}
+    return FastJSONResponse({"result": result})
 
+# BM25 ranked full-text search over the titles, summaries and content of the uploaded articles
+@app.get("/search/")
+@limiter.limit("20/second")
+def search_articles(request: Request, q: str, limit: int = 10):
+    try:
+        hits = search(q, limit)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    return FastJSONResponse({"query": q, "hits": hits})
+
+# Streams every correlation as NDJSON; pass after_id1/after_id2 (the last record seen) and page_size to page
 @app.get("/query-all-correlations/")
 @limiter.limit("5/second")
-def query_all_correlations_endpoint(request: Request):
-    result = query_all_correlations()
-    # Sanitize correlation values as before
-    sanitized = []
-    for record in result:
-        corr = record.get("correlation")
-        if corr is not None and math.isfinite(corr):
-            corr = round(corr, 5)
-        if corr is None or not math.isfinite(corr):
-            record["correlation"] = None
-        sanitized.append(record)
-    return {"result": sanitized}
+def query_all_correlations_endpoint(request: Request, after_id1: Optional[int] = None,
+                                    after_id2: Optional[int] = None, page_size: Optional[int] = None):
+    if page_size is not None and page_size < 1:
+        return FastJSONResponse(status_code=400, content={"error": "page_size must be a positive integer"})
+    if after_id2 is not None and after_id1 is None:
+        return FastJSONResponse(status_code=400, content={"error": "after_id2 requires after_id1"})
+    records = stream_all_correlations(after_id1, after_id2, page_size)
+    return StreamingResponse(ndjson_stream(records), media_type="application/x-ndjson")
+
+# Streams the edge list or node table as Parquet or Arrow IPC for bulk consumers
+@app.get("/export-correlations/")
+@limiter.limit("1/second")
+def export_correlations(request: Request, table: str = "edges", format: str = "parquet"):
+    if table not in EXPORT_TABLES or format not in EXPORT_FORMATS:
+        return FastJSONResponse(
+            status_code=400,
+            content={"error": f"table must be one of {list(EXPORT_TABLES)} and format one of {list(EXPORT_FORMATS)}"}
+        )
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream_export(table, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=correlation_{table}.{extension}"}
+    )
 
 @app.get("/query-pairwise-causal/")
 @limiter.limit("5/second")
 def get_pairwise_causal(request: Request):
     result = query_pairwise_causal()
-    return {"result": result}
+    return FastJSONResponse({"result": result})
+
+# Returns the k most correlated articles of one corpus from its materialized neighbour list
+@app.get("/neighbors/{corpus_id}")
+@limiter.limit("10/second")
+def get_neighbors(request: Request, corpus_id: int, k: int = NEIGHBOR_TOP_K):
+    if k < 1:
+        return FastJSONResponse(status_code=400, content={"error": "k must be a positive integer"})
+    result = query_neighbors(corpus_id, k)
+    if result is None:
+        return FastJSONResponse(status_code=404, content={"error": f"Corpus {corpus_id} not found"})
+    return FastJSONResponse({"result": result})
+
+# Reduced correlation network (top_k neighbours per article with correlation >= threshold, at most
+# max_nodes articles) with server-side layout coordinates, cached until the graph changes
+@app.get("/correlation-network/")
+@limiter.limit("5/second")
+def correlation_network_endpoint(request: Request, top_k: int = 5, threshold: float = 0.0,
+                                 max_nodes: int = NETWORK_MAX_NODES, dataset: Optional[str] = None):
+    try:
+        network = get_correlation_network(top_k, threshold, max_nodes, dataset)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    return FastJSONResponse(network)
+
+# Connected themes of the articles correlated at >= threshold, largest first
+@app.get("/graph-analytics/components/")
+@limiter.limit("5/second")
+def graph_components(request: Request, threshold: float = 0.6, min_size: int = 2, limit: int = 10,
+                     dataset: Optional[str] = None):
+    try:
+        result = get_connected_components(threshold, min_size, limit, dataset)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    return FastJSONResponse(result)
+
+# Hub articles of the graph at >= threshold ranked by degree, weighted_degree or pagerank
+@app.get("/graph-analytics/centrality/")
+@limiter.limit("5/second")
+def graph_centrality(request: Request, threshold: float = 0.6, measure: str = "degree", limit: int = 10,
+                     dataset: Optional[str] = None):
+    try:
+        result = get_centrality(threshold, measure, limit, dataset)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    return FastJSONResponse(result)
+
+# Label propagation communities of the graph at >= threshold, largest first
+@app.get("/graph-analytics/communities/")
+@limiter.limit("5/second")
+def graph_communities(request: Request, threshold: float = 0.6, min_size: int = 2, limit: int = 10,
+                      dataset: Optional[str] = None):
+    try:
+        result = get_communities(threshold, min_size, limit, dataset)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    return FastJSONResponse(result)
 
 @app.get("/query-highest-correlation/")
 @limiter.limit("5/second")
 def get_highest_correlation(request: Request, limit: int = 1):
     result = query_highest_correlation(limit)
-    return {"result": result}
+    return FastJSONResponse({"result": result})
 
+# Clears the graph in bounded batches, optionally only one dataset; stream=true returns NDJSON progress
 @app.delete("/clear-database/")
 @limiter.limit("1/second")
-def clear_database(request: Request):
-    message = clear_correlation_database()
+def clear_database(request: Request, dataset: Optional[str] = None,
+                   batch_size: int = CLEAR_BATCH_SIZE, stream: bool = False):
+    if batch_size < 1:
+        return FastJSONResponse(status_code=400, content={"error": "batch_size must be a positive integer"})
+    if stream:
+        updates = clear_correlation_database_stream(dataset, batch_size)
+        return StreamingResponse(ndjson_stream(updates, batch_size=1), media_type="application/x-ndjson")
+    message = clear_correlation_database(dataset, batch_size)
     return {"message": message}
 
 @app.get("/test-connection/")
@@ -118,66 +291,200 @@ def test_connection(request: Request):
 ###### Cluster Analysis Endpoints ######
 ########################################
 
-# Endpoint to run hierarchical clustering
+# Endpoint to run hierarchical clustering; method=kmeans or method=neighbors returns flat labels
+# in near-linear time for corpora too large for Ward linkage
 @app.get("/run-hierarchical-clustering/")
 @limiter.limit("3/second")
-def hierarchical_clustering_endpoint(request: Request):
-    run_hierarchical_clustering()
+def hierarchical_clustering_endpoint(request: Request, method: str = "ward",
+                                     n_clusters: int = 8, threshold: float = 0.0,
+                                     dataset: Optional[str] = None, truncate_mode: Optional[str] = None,
+                                     p: int = DENDROGRAM_TRUNCATE_P):
+    if method not in CLUSTERING_METHODS:
+        return FastJSONResponse(
+            status_code=400,
+            content={"error": f"method must be one of {list(CLUSTERING_METHODS)}"}
+        )
+    if method != "ward":
+        if n_clusters < 1:
+            return FastJSONResponse(status_code=400, content={"error": "n_clusters must be a positive integer"})
+        return FastJSONResponse(run_scalable_clustering(method, n_clusters=n_clusters, threshold=threshold, dataset=dataset))
+    if truncate_mode is not None and truncate_mode not in TRUNCATE_MODES:
+        return FastJSONResponse(status_code=400, content={"error": f"truncate_mode must be one of {list(TRUNCATE_MODES)}"})
+    if p < 1:
+        return FastJSONResponse(status_code=400, content={"error": "p must be a positive integer"})
+    run_hierarchical_clustering(dataset, truncate_mode=truncate_mode, p=p)
     return {"message": "Hierarchical clustering completed."}
 
+# Full merge tree of the cached linkage as compact JSON or Newick, for client-side rendering
+@app.get("/hierarchical-clustering-tree/")
+@limiter.limit("5/second")
+def hierarchical_clustering_tree_endpoint(request: Request, format: str = "json", dataset: Optional[str] = None):
+    if format not in ("json", "newick"):
+        return FastJSONResponse(status_code=400, content={"error": "format must be json or newick"})
+    try:
+        tree = get_linkage_tree(format, dataset)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    if format == "newick":
+        return Response(content=tree, media_type="text/plain")
+    return FastJSONResponse(tree)
+
+# Flat cluster labels cut from the cached linkage for any n_clusters or distance threshold
+@app.get("/hierarchical-clusters/")
+@limiter.limit("10/second")
+def hierarchical_clusters_endpoint(request: Request, n_clusters: Optional[int] = None,
+                                   threshold: Optional[float] = None, dataset: Optional[str] = None):
+    if (n_clusters is None) == (threshold is None):
+        return FastJSONResponse(status_code=400, content={"error": "Provide exactly one of n_clusters or threshold"})
+    if n_clusters is not None and n_clusters < 1:
+        return FastJSONResponse(status_code=400, content={"error": "n_clusters must be a positive integer"})
+    try:
+        labels = hierarchical_cluster_labels(n_clusters=n_clusters, threshold=threshold, dataset=dataset)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    return FastJSONResponse({"n_clusters": len(set(labels.values())), "labels": labels})
+
 @app.get("/download-hierarchical-clustering-image/")
 @limiter.limit("5/second")
 def get_clustering_image(request: Request):
-    image_path = "hierarchical_clustering.png"
+    image_path = artifact_path(DENDROGRAM_ARTIFACT)
     abs_path = os.path.abspath(image_path)
     
     logger.debug(f"Looking for clustering image at: {abs_path}")
     
-    if os.path.exists(abs_path):
+    # ETag revalidation lets dashboards refresh the image without downloading it again
+    response = cached_file_response(request, abs_path, "image/png", "hierarchical_clustering.png")
+    if response is not None:
         logger.info(f"Found clustering image at: {abs_path}")
-        return FileResponse(abs_path, media_type="image/png", filename="hierarchical_clustering.png")
+        return response
     
     logger.error(f"Clustering image not found at: {abs_path}")
     logger.debug(f"Current working directory: {os.getcwd()}")
     logger.debug(f"Directory contents: {os.listdir('.')}")
     
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=404,
         content={"error": f"Clustering image not found at {abs_path}"}
     )
 
-# This endpoint will be used to run LDA clustering
+# This endpoint will be used to run LDA clustering; incremental=true folds newly ingested articles
+# into the saved topic model instead of retraining it on the whole corpus
 @app.get("/run-lda-clustering/")
 @limiter.limit("1/second")
-def lda_clustering_endpoint(request: Request, n_topics: int = 5):
+def lda_clustering_endpoint(request: Request, n_topics: int = 5, dataset: Optional[str] = None,
+                            incremental: bool = False):
     try:
-        run_lda_clustering(n_topics=n_topics)
+        run_lda_clustering(n_topics=n_topics, dataset=dataset, incremental=incremental)
         return {"message": "LDA clustering completed."}
     except Exception as e:
         logger.error(f"Error in LDA clustering: {e}")
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=500,
             content={"error": f"Error in LDA clustering: {e}"}
         )
 
+# Fits every topic count in topics (comma separated, e.g. 2,4,8) in parallel processes and keeps the
+# model with the lowest held-out perplexity
+@app.get("/lda-topic-sweep/")
+@limiter.limit("1/second")
+def lda_topic_sweep_endpoint(request: Request, topics: str = "2,4,6,8,10", dataset: Optional[str] = None):
+    try:
+        topic_counts = sorted({int(count) for count in topics.split(",") if count.strip()})
+    except ValueError:
+        return FastJSONResponse(status_code=400, content={"error": "topics must be comma separated integers"})
+    if not topic_counts or topic_counts[0] < 1 or len(topic_counts) > LDA_SWEEP_MAX_COUNTS:
+        return FastJSONResponse(
+            status_code=400,
+            content={"error": f"topics must hold between 1 and {LDA_SWEEP_MAX_COUNTS} positive integers"}
+        )
+    try:
+        return FastJSONResponse(run_lda_topic_sweep(topic_counts, dataset))
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+
+# Topic label per document from the cached LDA assignments
+@app.get("/lda-clusters/")
+@limiter.limit("5/second")
+def lda_clusters_endpoint(request: Request, n_topics: int = 5, dataset: Optional[str] = None,
+                          incremental: bool = False):
+    if n_topics < 1:
+        return FastJSONResponse(status_code=400, content={"error": "n_topics must be a positive integer"})
+    try:
+        labels = lda_cluster_labels(n_topics, dataset, incremental)
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    return FastJSONResponse({"n_topics": n_topics, "labels": labels})
+
 # This endpoint will return the png from lda clustering
 @app.get("/download-lda-clustering-image/")
 @limiter.limit("5/second")
 def get_lda_clustering_image(request: Request):
-    image_path = "lda_clusters.png"
+    image_path = artifact_path(LDA_PLOT_ARTIFACT)
     abs_path = os.path.abspath(image_path)
     
     logger.debug(f"Looking for clustering image at: {abs_path}")
     
-    if os.path.exists(abs_path):
+    response = cached_file_response(request, abs_path, "image/png", "lda_clusters.png")
+    if response is not None:
         logger.info(f"Found clustering image at: {abs_path}")
-        return FileResponse(abs_path, media_type="image/png", filename="lda_clusters.png")
+        return response
     
     logger.error(f"Clustering image not found at: {abs_path}")
     logger.debug(f"Current working directory: {os.getcwd()}")
     logger.debug(f"Directory contents: {os.listdir('.')}")
     
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=404,
         content={"error": f"Clustering image not found at {abs_path}"}
-    )
\ No newline at end of file
+    )
+
+########################################
+######## Background Job Endpoints ######
+########################################
+
+# Queue a long-running analysis (one of JOB_KINDS) and return its job id at once; the optional
+# JSON body holds the parameters of the matching synchronous endpoint
+@app.post("/jobs/{kind}")
+@limiter.limit("5/second")
+def submit_job(request: Request, kind: str, priority: int = 0, params: Optional[dict] = Body(None)):
+    try:
+        job = get_scheduler().submit(kind, params, priority)
+    except KeyError:
+        return FastJSONResponse(status_code=404, content={"error": f"Unknown job kind '{kind}', expected one of {list(JOB_KINDS)}"})
+    except ValueError as e:
+        return FastJSONResponse(status_code=400, content={"error": str(e)})
+    except JobQueueFullError as e:
+        return FastJSONResponse(status_code=503, content={"error": str(e)})
+    return FastJSONResponse(status_code=202, content=job.to_dict())
+
+@app.get("/jobs/")
+@limiter.limit("10/second")
+def list_jobs(request: Request):
+    return {"jobs": [job.to_dict() for job in get_scheduler().list()]}
+
+@app.get("/jobs/{job_id}")
+@limiter.limit("20/second")
+def get_job(request: Request, job_id: str):
+    job = get_scheduler().get(job_id)
+    if job is None:
+        return FastJSONResponse(status_code=404, content={"error": f"Job {job_id} not found"})
+    return job.to_dict()
+
+# Result of a completed job; 409 while the job is queued or running, or if it failed or was cancelled
+@app.get("/jobs/{job_id}/result")
+@limiter.limit("10/second")
+def get_job_result(request: Request, job_id: str):
+    job = get_scheduler().get(job_id)
+    if job is None:
+        return FastJSONResponse(status_code=404, content={"error": f"Job {job_id} not found"})
+    if job.status != "completed":
+        return FastJSONResponse(status_code=409, content={"status": job.status, "error": job.error})
+    return {"status": job.status, "result": job.result}
+
+@app.delete("/jobs/{job_id}")
+@limiter.limit("5/second")
+def cancel_job(request: Request, job_id: str):
+    job = get_scheduler().cancel(job_id)
+    if job is None:
+        return FastJSONResponse(status_code=404, content={"error": f"Job {job_id} not found"})
+    return job.to_dict()
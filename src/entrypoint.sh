@@ -0,0 +1,12 @@
+#!/bin/sh
+# Start the API with API_WORKERS uvicorn workers
+set -e
+
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    # Metric files of an earlier run would be added to the metrics of this one
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+# exec so uvicorn, not this shell, receives the signals sent to the container
+exec venv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 --workers "${API_WORKERS:-1}"
@@ -1,15 +1,18 @@
 import pandas as pd
 import json
+import math
 from utils.nlp_processor import compare_corpora
-from utils.neo4j_connector import Neo4jConnector
+from utils.graph_backend import get_connector, DEFAULT_DATASET, CLEAR_BATCH_SIZE
+from utils.neighbors import TopKNeighbors
+from utils.query_cache import cached_query, bump_graph_generation
+from utils.metrics import COMPARE_SECONDS
+from utils.shared_store import publish_progress, get_progress, artifact_path, DATA_ARTIFACT
 
-corpus = None
-titles = None
-
-# Read the CSV file and extract the titles and content
-def read_csv_extract_corpora(file_path: str):
-    global corpus, titles
+# Read the CSV file (by default the data artifact of the last upload) and return the titles and content
+def read_csv_extract_corpora(file_path: str = None):
     # Read the CSV file
+    if file_path is None:
+        file_path = artifact_path(DATA_ARTIFACT)
     df = pd.read_csv(file_path)
     
     # Drop rows with NaN values or blank cells
@@ -18,142 +21,224 @@ def read_csv_extract_corpora(file_path: str):
     # Extract the titles and content
     titles = df['Title'].tolist()
     corpus = df['Content'].tolist()
+    return titles, corpus
 
-# Add global variables for progress tracking
-progress_data = {
-    "total_pairs": 0,
-    "processed_pairs": 0,
-    "current_status": "Not started"
-}
+# Progress of the running correlation calculation, published to the shared store for every API worker
+def _new_progress():
+    return {"total_pairs": 0, "processed_pairs": 0, "current_status": "Not started"}
 
-# Store correlation scores between all pairs of corpora in the Neo4j database
-def store_correlation_scores():
-    global progress_data
-    connector = Neo4jConnector()
+# Materialize the top-k neighbour list of the corpus at position i on its node
+def _store_neighbors(connector, neighbors, i, titles, ids):
+    top = neighbors.top(i)
+    connector.store_neighbors(ids[i],
+                              [ids[j] for j, _ in top],
+                              [titles[j] for j, _ in top],
+                              [score for _, score in top])
 
-    if corpus is None or titles is None:
-        raise ValueError("Corpus or titles not initialized. Please call read_csv_extract_corpora() first.")
-    
-    try:
-        # First loop: Create all corpus nodes
-        for i in range(len(corpus)):
-            connector.create_corpus_node(i, titles[i], corpus[i])
-        
-        # Calculate total number of pairs
-        n = len(corpus)
-        progress_data["total_pairs"] = (n * (n - 1)) // 2
-        progress_data["processed_pairs"] = 0
-        progress_data["current_status"] = "Processing"
-        
-        # Second loop: Compute and store correlations as relationships between nodes
-        for i in range(len(corpus)):
-            for j in range(i + 1, len(corpus)):
-                correlation = compare_corpora(corpus[i], corpus[j])
-                if correlation is None:
-                    print(f"WARNING: Correlation is None for corpus {i} and {j}")
-                connector.create_correlation_relationship(i, j, correlation)
-                
-                # Update progress
-                progress_data["processed_pairs"] += 1
-                
-        progress_data["current_status"] = "Completed"
-        
-    except Exception as e:
-        progress_data["current_status"] = f"Error: {str(e)}"
-        raise
-    finally:
-        connector.close()
+# Corpus ids are unique across datasets, so calculating one dataset never overwrites the nodes of another.
+# Recalculating a dataset replaces it: its nodes are cleared and it takes the block of ids after the highest
+# id left in the graph.
+def _allocate_corpus_ids(connector, dataset: str, n: int):
+    for _ in connector.clear_database_batched(dataset=dataset):
+        pass
+    max_id = connector.max_corpus_id()
+    start = 0 if max_id is None else max_id + 1
+    return list(range(start, start + n))
+
+# Store correlation scores between all pairs of corpora in the graph database; titles and corpus
+# default to those of the data artifact
+def store_correlation_scores(dataset: str = DEFAULT_DATASET, titles=None, corpus=None):
+    for _ in store_correlation_scores_stream(dataset, titles, corpus):
+        pass
 
 # New generator function to stream progress updates
-def store_correlation_scores_stream():
-    global progress_data
-    connector = Neo4jConnector()
-    if corpus is None or titles is None:
-        raise ValueError("Corpus or titles not initialized. Please call read_csv_extract_corpora() first.")
+def store_correlation_scores_stream(dataset: str = DEFAULT_DATASET, titles=None, corpus=None):
+    if titles is None or corpus is None:
+        titles, corpus = read_csv_extract_corpora()
+    dataset = dataset or DEFAULT_DATASET
+    progress_data = _new_progress()
+    connector = get_connector()
     try:
+        # Make sure the id/title indexes are online so edge writes are index lookups
+        connector.ensure_schema()
+
+        ids = _allocate_corpus_ids(connector, dataset, len(corpus))
+
         # First loop: Create all corpus nodes
         for i in range(len(corpus)):
-            connector.create_corpus_node(i, titles[i], corpus[i])
+            connector.create_corpus_node(ids[i], titles[i], corpus[i], dataset)
+        bump_graph_generation()
         
         # Calculate total number of pairs
         n = len(corpus)
         progress_data["total_pairs"] = (n * (n - 1)) // 2
         progress_data["processed_pairs"] = 0
         progress_data["current_status"] = "Processing"
+        publish_progress("correlation", progress_data, force=True)
         yield json.dumps(progress_data) + "\n"
         
         # Second loop: Compute and store correlations as relationships between nodes
+        neighbors = TopKNeighbors()
         for i in range(len(corpus)):
             for j in range(i + 1, len(corpus)):
-                correlation = compare_corpora(corpus[i], corpus[j])
+                with COMPARE_SECONDS.time():
+                    correlation = compare_corpora(corpus[i], corpus[j])
                 if correlation is None:
                     print(f"WARNING: Correlation is None for corpus {i} and {j}")
-                connector.create_correlation_relationship(i, j, correlation)
+                connector.create_correlation_relationship(ids[i], ids[j], correlation)
+                neighbors.add(i, j, correlation)
                 
                 # Update progress after each pair processed
                 progress_data["processed_pairs"] += 1
+                publish_progress("correlation", progress_data)
                 yield json.dumps(progress_data) + "\n"
+
+            # Every pair involving corpus i has been seen, its neighbour list is final
+            _store_neighbors(connector, neighbors, i, titles, ids)
+            # Once per corpus rather than per relationship, cached queries see the graph grow row by row
+            bump_graph_generation()
         
         progress_data["current_status"] = "Completed"
+        publish_progress("correlation", progress_data, force=True)
         yield json.dumps(progress_data) + "\n"
     except Exception as e:
         progress_data["current_status"] = f"Error: {str(e)}"
+        publish_progress("correlation", progress_data, force=True)
         yield json.dumps(progress_data) + "\n"
         raise
     finally:
+        # Relationships written after the last bump, e.g. when the calculation stopped midway
+        bump_graph_generation()
         connector.close()
 
 def get_correlation_progress():
     """Get the current progress of correlation calculation"""
-    return progress_data
+    return get_progress("correlation") or _new_progress()
 
 # Wrapper function to query by title
 def query_corpus_by_title(title: str):
-    connector = Neo4jConnector()
+    return cached_query("query_by_title", _query_corpus_by_title, title)
+
+def _query_corpus_by_title(title: str):
+    connector = get_connector()
     result = connector.query_by_title(title)
     connector.close()
     return result
 
 # Wrapper function to query all correlations
 def query_all_correlations():
-    connector = Neo4jConnector()
+    connector = get_connector()
     result = connector.query_all_correlations()
     connector.close()
     return result
 
+# Round finite correlation values to 5 decimals and replace non-finite ones (NaN, inf) with None so the
+# record is JSON safe
+def sanitize_correlation_record(record):
+    corr = record.get("correlation")
+    if corr is None or not math.isfinite(corr):
+        record["correlation"] = None
+    else:
+        record["correlation"] = round(corr, 5)
+    return record
+
+# Generator streaming sanitized correlation records, optionally one page after an (id1, id2) cursor
+def stream_all_correlations(after_id1=None, after_id2=None, page_size=None):
+    connector = get_connector()
+    try:
+        for record in connector.stream_all_correlations(after_id1, after_id2, page_size):
+            yield sanitize_correlation_record(record)
+    finally:
+        connector.close()
+
+# Generator streaming (id1, id2, correlation) tuples of every correlation
+def stream_correlation_edges(dataset: str = None):
+    connector = get_connector()
+    try:
+        yield from connector.stream_correlation_edges(dataset)
+    finally:
+        connector.close()
+
+# Generator streaming (id, title) tuples of every corpus
+def stream_corpora(dataset: str = None):
+    connector = get_connector()
+    try:
+        yield from connector.stream_corpora(dataset)
+    finally:
+        connector.close()
+
+# Generator streaming (id, neighbor_ids, neighbor_scores) of every corpus with materialized neighbours
+def stream_neighbor_lists():
+    connector = get_connector()
+    try:
+        yield from connector.stream_neighbor_lists()
+    finally:
+        connector.close()
+
 # Wrapper function to query the pairwise highest correlations per corpus
 def query_pairwise_causal():
-    connector = Neo4jConnector()
+    return cached_query("query_pairwise_causal", _query_pairwise_causal)
+
+def _query_pairwise_causal():
+    connector = get_connector()
     result = connector.query_pairwise_causal()
     connector.close()
     return result
 
+# Wrapper function to query the materialized top-k neighbours of one corpus
+def query_neighbors(corpus_id: int, k: int = 10):
+    return cached_query("query_neighbors", _query_neighbors, int(corpus_id), int(k))
+
+def _query_neighbors(corpus_id: int, k: int):
+    connector = get_connector()
+    result = connector.query_neighbors(corpus_id, k)
+    connector.close()
+    return result
+
 # Wrapper function to query the top N highest correlation relationships
 def query_highest_correlation(n: int = 1):
-    connector = Neo4jConnector()
+    return cached_query("query_highest_correlation", _query_highest_correlation, int(n))
+
+def _query_highest_correlation(n: int):
+    connector = get_connector()
     result = connector.query_highest_correlation(n)
     connector.close()
     return result
 
 # Wrapper function to query all corpora (ids, titles, and texts)
-def query_all_corpora():
-    from utils.neo4j_connector import Neo4jConnector
-    connector = Neo4jConnector()
-    result = connector.query_all_corpora()
+def query_all_corpora(dataset: str = None):
+    connector = get_connector()
+    result = connector.query_all_corpora(dataset)
     connector.close()
     return result
 
+# Generator clearing the graph in bounded batches (optionally one dataset) and yielding progress
+def clear_correlation_database_stream(dataset: str = None, batch_size: int = CLEAR_BATCH_SIZE):
+    connector = get_connector()
+    try:
+        for update in connector.clear_database_batched(batch_size, dataset):
+            yield {"status": "clearing", **update}
+    finally:
+        connector.close()
+    yield {"status": "complete", "message": "Database cleared."}
+
 # Wrapper function to clear the correlations database
-def clear_correlation_database():
-    connector = Neo4jConnector()
-    connector.clear_database()
-    connector.close()
+def clear_correlation_database(dataset: str = None, batch_size: int = CLEAR_BATCH_SIZE):
+    for _ in clear_correlation_database_stream(dataset, batch_size):
+        pass
     return "Database cleared."
 
-# Wrapper function to test the Neo4j database connection
+# Wrapper function to create the constraints and indexes and wait for them to come online
+def ensure_db_schema():
+    connector = get_connector()
+    try:
+        connector.ensure_schema()
+    finally:
+        connector.close()
+
+# Wrapper function to test the graph database connection
 def test_db_connection():
-    from utils.neo4j_connector import Neo4jConnector  # local import if needed
-    connector = Neo4jConnector()
+    connector = get_connector()
     success = connector.test_connection()
     connector.close()
     return success
@@ -1,67 +1,214 @@
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
 import numpy as np
 from scipy.cluster.hierarchy import linkage, dendrogram, fcluster
+from scipy.spatial.distance import squareform
+import scipy.sparse as sp
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
 import matplotlib
 matplotlib.use('Agg')  # Set backend to non-interactive Agg
 import matplotlib.pyplot as plt
-from services.causal import query_all_correlations, query_all_corpora
-from utils.lda import LDA 
-import math
+from services.causal import (query_all_corpora, sanitize_correlation_record, stream_correlation_edges,
+                             stream_corpora, stream_neighbor_lists)
+from utils.lda import LDA, model_state_path, sweep_topic_counts
+from utils.query_cache import cached_query
+from utils.metrics import CLUSTERING_SECONDS, record_cache
+from utils.shared_store import writing_artifact, DENDROGRAM_ARTIFACT
 import logging
-import pandas as pd  # NEW: to read printed_data.csv for titles
 
 logger = logging.getLogger(__name__)
 
-# Convert correlations into distances
-def convert_to_distance_matrix(json_data):
-    result = json_data["result"]
-    n_docs = max(max(item['id1'], item['id2']) for item in result) + 1
+# Number of correlation records scattered into the distance vector at a time
+EDGE_CHUNK_SIZE = 1_000_000
+
+# Estimate the peak memory in bytes of Ward clustering n_docs documents from a condensed vector.
+# The condensed vector holds m = n(n-1)/2 float64 distances (8m bytes), SciPy's nearest-neighbour
+# chain works on its own float64 copy (another 8m) and the linkage matrix adds 32(n-1) bytes, so
+# the peak is about 16m bytes: 3.2 GB for 20k documents, versus more than 12 GB for the dense
+# n x n similarity and distance matrices, their triangle indices and the per-record dicts.
+def estimate_clustering_memory(n_docs: int, dtype=np.float64):
+    m = n_docs * (n_docs - 1) // 2
+    return m * np.dtype(dtype).itemsize + m * 8 + (n_docs - 1) * 4 * 8
+
+# Allocate the condensed similarity vector, pairs without a correlation have similarity 0
+def _empty_condensed(n_docs: int, dtype):
+    if n_docs < 2:
+        raise ValueError("At least two documents are needed for hierarchical clustering.")
+    return np.zeros(n_docs * (n_docs - 1) // 2, dtype=dtype)
 
-    # Initialize the similarity matrix
-    similarity_matrix = np.zeros((n_docs, n_docs))
+# Scatter correlation scores into the condensed vector with NumPy indexing
+def _scatter_similarities(similarity, n_docs, ids1, ids2, scores):
+    i = np.minimum(ids1, ids2)
+    j = np.maximum(ids1, ids2)
+    # Self pairs are not part of the condensed vector and non-finite scores count as missing
+    valid = (i != j) & np.isfinite(scores)
+    i, j = i[valid], j[valid]
+    # Position of (i, j), i < j, in the row-major upper triangle
+    index = n_docs * i - (i * (i + 1)) // 2 + (j - i - 1)
+    similarity[index] = scores[valid]
 
-    # Fill the similarity matrix
-    for item in result:
-        id1 = item["id1"]
-        id2 = item["id2"]
-        correlation = item["correlation"]
-        similarity_matrix[id1][id2] = correlation
-        similarity_matrix[id2][id1] = correlation
+# Convert similarities to distances sqrt(2 * (1 - similarity)) in place
+def _similarity_to_distance(similarity):
+    np.subtract(1, similarity, out=similarity)
+    np.multiply(similarity, 2, out=similarity)
+    # Guard against scores slightly above 1 producing NaN distances
+    np.maximum(similarity, 0, out=similarity)
+    np.sqrt(similarity, out=similarity)
+    return similarity
 
-    # Fill diagonal with ones (self-similarity)
-    np.fill_diagonal(similarity_matrix, 1)
+# Build the condensed distance vector (the upper triangle linkage expects) from id and score arrays.
+# float32 halves the vector where the consumer accepts it; SciPy's linkage works in float64 and would
+# convert a float32 vector with an extra copy, so Ward clustering builds float64 directly.
+def build_condensed_distances(ids1, ids2, scores, n_docs: int, dtype=np.float64):
+    similarity = _empty_condensed(n_docs, dtype)
+    _scatter_similarities(similarity, n_docs, np.asarray(ids1, dtype=np.int64),
+                          np.asarray(ids2, dtype=np.int64), np.asarray(scores, dtype=np.float64))
+    return _similarity_to_distance(similarity)
 
-    # Convert similarity to distance
-    distance_matrix = np.sqrt(2 * (1 - similarity_matrix))
-    return distance_matrix
+# Map corpus ids to their positions in the sorted doc_ids, dropping pairs with unknown ids
+def ids_to_positions(doc_ids, ids1, ids2, scores):
+    pos1 = np.minimum(np.searchsorted(doc_ids, ids1), len(doc_ids) - 1)
+    pos2 = np.minimum(np.searchsorted(doc_ids, ids2), len(doc_ids) - 1)
+    known = (doc_ids[pos1] == ids1) & (doc_ids[pos2] == ids2)
+    return pos1[known], pos2[known], scores[known]
+
+# Build the condensed distance vector from an iterator of (id1, id2, correlation) tuples,
+# scattering it chunk by chunk so the edge list is never materialized. With a sorted doc_ids
+# array the leaves are those documents in that order, otherwise the ids are used as positions.
+def condensed_distances_from_edges(edges, n_docs: int, dtype=np.float64, chunk_size: int = EDGE_CHUNK_SIZE,
+                                   doc_ids=None):
+    if doc_ids is not None:
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        n_docs = len(doc_ids)
+    similarity = _empty_condensed(n_docs, dtype)
+    while True:
+        chunk = list(itertools.islice(edges, chunk_size))
+        if not chunk:
+            break
+        count = len(chunk)
+        ids1 = np.fromiter((edge[0] for edge in chunk), dtype=np.int64, count=count)
+        ids2 = np.fromiter((edge[1] for edge in chunk), dtype=np.int64, count=count)
+        scores = np.fromiter((np.nan if edge[2] is None else edge[2] for edge in chunk),
+                             dtype=np.float64, count=count)
+        if doc_ids is not None:
+            ids1, ids2, scores = ids_to_positions(doc_ids, ids1, ids2, scores)
+        _scatter_similarities(similarity, n_docs, ids1, ids2, scores)
+    return _similarity_to_distance(similarity)
+
+# Convert correlations into a condensed distance vector
+def convert_to_distance_matrix(json_data, dtype=np.float64):
+    result = json_data["result"]
+    count = len(result)
+    ids1 = np.fromiter((item["id1"] for item in result), dtype=np.int64, count=count)
+    ids2 = np.fromiter((item["id2"] for item in result), dtype=np.int64, count=count)
+    scores = np.fromiter((np.nan if item["correlation"] is None else item["correlation"] for item in result),
+                         dtype=np.float64, count=count)
+    n_docs = int(max(ids1.max(), ids2.max())) + 1 if count else 0
+    return build_condensed_distances(ids1, ids2, scores, n_docs, dtype)
 
 # Perform hierarchical clustering using linkage
-def perform_hierarchical_clustering(distance_matrix):
-    # Use only the upper triangular part of the distance matrix for linkage
-    Z = linkage(distance_matrix[np.triu_indices_from(distance_matrix, k=1)], method="ward")
+def perform_hierarchical_clustering(distances):
+    # Accept a square distance matrix for backwards compatibility, linkage expects the condensed form
+    if distances.ndim == 2:
+        distances = squareform(distances, checks=False)
+    Z = linkage(distances, method="ward")
     return Z
 
-# Update visualize_dendrogram to exclude IDs with the title "No Title" from the legend
-def visualize_dendrogram(Z, id_title, output_path="hierarchical_clustering.png"):
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7), gridspec_kw={'width_ratios': [7, 3]})
+# Dendrograms with more leaves than this are truncated to their last DENDROGRAM_TRUNCATE_P merges
+# unless a truncation mode is requested explicitly
+MAX_FULL_DENDROGRAM_LEAVES = int(os.getenv("MAX_FULL_DENDROGRAM_LEAVES", "200"))
+DENDROGRAM_TRUNCATE_P = 30
+TRUNCATE_MODES = ("none", "lastp", "level")
+
+# The title legend is only drawn for up to this many documents
+MAX_LEGEND_ENTRIES = 60
+
+# Rendered dendrograms keyed by linkage and render options, the oldest beyond RENDER_CACHE_SIZE are pruned
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "render_cache")
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "32"))
+
+# Update visualize_dendrogram to exclude IDs with the title "No Title" from the legend.
+# truncate_mode "lastp" shows the last p merges, "level" the top p levels and "none" every leaf;
+# by default only dendrograms with more than MAX_FULL_DENDROGRAM_LEAVES leaves are truncated.
+def visualize_dendrogram(Z, id_title, output_path="hierarchical_clustering.png",
+                         truncate_mode=None, p=DENDROGRAM_TRUNCATE_P):
+    n_leaves = len(Z) + 1
+    if truncate_mode is None:
+        truncate_mode = "lastp" if n_leaves > MAX_FULL_DENDROGRAM_LEAVES else "none"
+
+    # One legend handle per document is only readable (and cheap to lay out) for small corpora
+    if n_leaves <= MAX_LEGEND_ENTRIES:
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7), gridspec_kw={'width_ratios': [7, 3]})
+    else:
+        # Size the figure to the leaves actually drawn instead of a fixed canvas
+        shown = n_leaves if truncate_mode == "none" else min(n_leaves, p if truncate_mode == "lastp" else 2 ** (p + 1))
+        fig, ax1 = plt.subplots(figsize=(min(40, max(14, shown * 0.2)), 7))
+        ax2 = None
     
     # Plot dendrogram on the left
-    dendrogram(Z, labels=list(id_title.keys())[:len(Z) + 1], ax=ax1)
+    dendrogram(Z, labels=list(id_title.keys())[:n_leaves], ax=ax1,
+               truncate_mode=None if truncate_mode == "none" else truncate_mode, p=p,
+               no_labels=truncate_mode == "none" and n_leaves > MAX_FULL_DENDROGRAM_LEAVES)
     ax1.set_title("Hierarchical Clustering Dendrogram")
-    ax1.set_xlabel("Document ID")
+    ax1.set_xlabel("Document ID" if truncate_mode == "none" else "Document ID (cluster size)")
     ax1.set_ylabel("Distance")
     
-    # Create a legend with titles on the right
-    handles = [plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='black', markersize=5, label=f"{i}: {title}") for i, title in id_title.items() if title != "No Title"]
-    ax2.legend(handles=handles, loc='center')
-    ax2.axis('off')
+    if ax2 is not None:
+        # Create a legend with titles on the right
+        handles = [plt.Line2D([0], [0], marker='o', color='w', markerfacecolor='black', markersize=5, label=f"{i}: {title}") for i, title in id_title.items() if title != "No Title"]
+        ax2.legend(handles=handles, loc='center')
+        ax2.axis('off')
     
     plt.tight_layout()
     plt.savefig(output_path)
-    plt.close()
+    plt.close(fig)
+
+# Hash of the linkage, leaf titles and render options identifying a rendered dendrogram
+def _render_cache_key(Z, id_title, truncate_mode, p):
+    digest = hashlib.sha1(np.ascontiguousarray(Z).tobytes())
+    digest.update(json.dumps([list(id_title.items()), truncate_mode, p], default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+def _prune_render_cache():
+    paths = sorted((os.path.join(RENDER_CACHE_DIR, name) for name in os.listdir(RENDER_CACHE_DIR)
+                    if name.startswith("dendrogram_") and name.endswith(".png")),
+                   key=os.path.getmtime)
+    for path in paths[:-RENDER_CACHE_SIZE]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Render the dendrogram through the render cache and copy it to output_path (by default the dendrogram artifact)
+def render_dendrogram(Z, id_title, output_path=None, truncate_mode=None, p=DENDROGRAM_TRUNCATE_P):
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    cached_path = os.path.join(RENDER_CACHE_DIR, f"dendrogram_{_render_cache_key(Z, id_title, truncate_mode, p)}.png")
+    hit = os.path.exists(cached_path)
+    record_cache("dendrogram", hit)
+    if hit:
+        logger.debug(f"Dendrogram render cache hit: {cached_path}")
+    else:
+        # Render to a private file first so concurrent renders never expose a partial image
+        tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.png"
+        visualize_dendrogram(Z, id_title, tmp_path, truncate_mode, p)
+        os.replace(tmp_path, cached_path)
+        _prune_render_cache()
+    if output_path is not None:
+        shutil.copyfile(cached_path, output_path)
+        return output_path
+    with writing_artifact(DENDROGRAM_ARTIFACT) as tmp_path:
+        shutil.copyfile(cached_path, tmp_path)
+    return DENDROGRAM_ARTIFACT
 
 # Extract flat clusters
 def extract_clusters(Z, threshold=None, n_clusters=None):
-    if threshold:
+    if threshold is not None:
         # Cut dendrogram at a specific distance threshold
         labels = fcluster(Z, t=threshold, criterion="distance")
     elif n_clusters:
@@ -74,35 +221,88 @@ def extract_clusters(Z, threshold=None, n_clusters=None):
 
 # Sanitize correlation values
 def sanitize_correlation(result):
-    # Sanitize correlation values as before
-    sanitized = []
-    for record in result:
-        corr = record.get("correlation")
-        if corr is not None and math.isfinite(corr):
-            corr = round(corr, 5)
-        if corr is None or not math.isfinite(corr):
-            record["correlation"] = None
-        sanitized.append(record)
-    return {"result": sanitized}
+    return {"result": [sanitize_correlation_record(record) for record in result]}
 
-# Main function to run clustering with custom leaf labeling
-def run_hierarchical_clustering():
-    try:
-        # Query data
-        json_data = sanitize_correlation(query_all_correlations())
+# Compute the Ward linkage of a dataset (None for every corpus) with the ids and titles of its leaves
+@CLUSTERING_SECONDS.labels("ward").time()
+def compute_hierarchical_linkage(dataset: str = None):
+    corpora = list(stream_corpora(dataset))
+    doc_ids = np.asarray([corpus_id for corpus_id, _ in corpora], dtype=np.int64)
+    logger.info(f"Clustering {len(doc_ids)} documents, estimated peak memory "
+                f"{estimate_clustering_memory(len(doc_ids)) / 1e9:.2f} GB")
+
+    # Stream the correlations straight into the condensed distance vector
+    distances = condensed_distances_from_edges(stream_correlation_edges(dataset), len(doc_ids), doc_ids=doc_ids)
 
-        # Convert correlations to distances
-        distance_matrix = convert_to_distance_matrix(json_data)
+    # Perform hierarchical clustering
+    Z = perform_hierarchical_clustering(distances)
+    return {"ids": doc_ids.tolist(), "titles": [title for _, title in corpora], "linkage": Z}
 
-        # Perform hierarchical clustering
-        Z = perform_hierarchical_clustering(distance_matrix)
+# Linkage of a dataset, cached until the graph changes (keyed by dataset and graph generation)
+def get_hierarchical_linkage(dataset: str = None):
+    return cached_query("hierarchical_linkage", compute_hierarchical_linkage, dataset)
 
-        # NEW: Build id_title mapping from printed_data.csv
-        df = pd.read_csv("printed_data.csv")
-        id_title = dict(enumerate(df["Title"].tolist()))
+# Flat cluster labels by corpus id, cut from the cached linkage
+def hierarchical_cluster_labels(n_clusters: int = None, threshold: float = None, dataset: str = None):
+    result = get_hierarchical_linkage(dataset)
+    labels = extract_clusters(result["linkage"], threshold=threshold, n_clusters=n_clusters)
+    return dict(zip(result["ids"], labels.tolist()))
+
+# Compact JSON form of the cached tree: the leaves and SciPy's merge list, where merge i creates
+# node n + i from two nodes (< n are leaves) at the given distance with the given leaf count
+def linkage_tree_json(dataset: str = None):
+    result = get_hierarchical_linkage(dataset)
+    return {
+        "leaves": [{"id": corpus_id, "title": title} for corpus_id, title in zip(result["ids"], result["titles"])],
+        "merges": [[int(left), int(right), distance, int(size)]
+                   for left, right, distance, size in result["linkage"].tolist()],
+    }
+
+# Newick form of the cached tree with corpus ids as leaf names and branch lengths from merge distances.
+# The tree is written with an explicit stack since its depth can exceed the recursion limit.
+def linkage_tree_newick(dataset: str = None):
+    result = get_hierarchical_linkage(dataset)
+    Z, ids = result["linkage"], result["ids"]
+    n = len(ids)
+    heights = np.concatenate([np.zeros(n), Z[:, 2]])
+    children = Z[:, :2].astype(np.int64)
+    separator = -1
+    parts = []
+    stack = [(2 * n - 2, None, False)]
+    while stack:
+        node, length, expanded = stack.pop()
+        if node == separator:
+            parts.append(",")
+            continue
+        suffix = "" if length is None else f":{length:.6g}"
+        if node < n:
+            parts.append(f"{ids[node]}{suffix}")
+        elif expanded:
+            parts.append(f"){suffix}")
+        else:
+            left, right = children[node - n]
+            parts.append("(")
+            stack.append((node, length, True))
+            stack.append((right, heights[node] - heights[right], False))
+            stack.append((separator, None, None))
+            stack.append((left, heights[node] - heights[left], False))
+    return "".join(parts) + ";"
+
+# Tree export of a dataset, cached until the graph changes
+def get_linkage_tree(fmt: str = "json", dataset: str = None):
+    export = linkage_tree_newick if fmt == "newick" else linkage_tree_json
+    return cached_query("linkage_tree", lambda fmt, dataset: export(dataset), fmt, dataset)
+
+# Main function to run clustering with custom leaf labeling
+def run_hierarchical_clustering(dataset: str = None, truncate_mode: str = None, p: int = DENDROGRAM_TRUNCATE_P):
+    try:
+        result = get_hierarchical_linkage(dataset)
+
+        # Label the leaves with the titles stored on the corpus nodes
+        id_title = dict(zip(result["ids"], result["titles"]))
         
-        # Call updated visualization with custom labels
-        visualize_dendrogram(Z, id_title)
+        # Call updated visualization with custom labels, reusing an identical earlier render
+        render_dendrogram(result["linkage"], id_title, truncate_mode=truncate_mode, p=p)
         
         logger.info("Hierarchical clustering completed.")
         return {"message": "Hierarchical clustering completed."}
@@ -111,14 +311,196 @@ def run_hierarchical_clustering():
         logger.error(f"Error in hierarchical clustering: {e}")
         raise
 
-def run_lda_clustering(n_topics: int = 5):
+########################################
+###### Scalable clustering engines #####
+########################################
+
+# Clustering engines selectable from /run-hierarchical-clustering/. Ward needs the O(n^2) condensed
+# distance vector; kmeans and neighbors return flat labels in near-linear time for 100k+ documents.
+CLUSTERING_METHODS = ("ward", "kmeans", "neighbors")
+
+# Relabel arbitrary cluster ids to consecutive labels starting at 1, like fcluster
+def _consecutive_labels(labels):
+    return np.unique(labels, return_inverse=True)[1] + 1
+
+# Mini-batch k-means over hashed TF-IDF vectors of the article texts
+def cluster_documents_kmeans(n_clusters: int = 8, batch_size: int = 4096, random_state: int = 42,
+                             dataset: str = None):
+    corpora = query_all_corpora(dataset)
+    ids = [doc["id"] for doc in corpora]
+    if not ids:
+        raise ValueError("No documents to cluster.")
+    # Hashing avoids holding a vocabulary, so vectorizing is a single streaming pass
+    vectorizer = HashingVectorizer(stop_words="english", alternate_sign=False, n_features=2 ** 18, norm=None)
+    vectors = TfidfTransformer().fit_transform(vectorizer.transform(doc["text"] or "" for doc in corpora))
+    model = MiniBatchKMeans(n_clusters=min(n_clusters, len(ids)), batch_size=batch_size,
+                            random_state=random_state, n_init=3)
+    labels = _consecutive_labels(model.fit_predict(vectors))
+    return dict(zip(ids, labels.tolist()))
+
+# Sparse symmetric adjacency between the corpora ids from their materialized neighbour lists, keeping
+# scores >= threshold and, if top_k is given, only the top_k best neighbours of every corpus
+def neighbor_adjacency(ids, threshold: float = 0.0, top_k: int = None):
+    index = {corpus_id: i for i, corpus_id in enumerate(ids)}
+    rows, cols, weights = [], [], []
+    for corpus_id, neighbor_ids, neighbor_scores in stream_neighbor_lists():
+        if corpus_id not in index:
+            continue
+        # The lists are stored best first
+        for other_id, score in itertools.islice(zip(neighbor_ids, neighbor_scores), top_k):
+            if score is not None and score >= threshold and other_id in index:
+                rows.append(index[corpus_id])
+                cols.append(index[other_id])
+                weights.append(score)
+    n = len(ids)
+    adjacency = sp.csr_matrix((np.asarray(weights, dtype=np.float64), (rows, cols)), shape=(n, n))
+    # Neighbour lists are directional (a may be in b's top-k but not vice versa), keep either direction
+    return adjacency.maximum(adjacency.T).tocsr()
+
+# Sparse symmetric adjacency of the materialized top-k neighbour graph, keeping scores >= threshold
+def build_neighbor_graph(threshold: float = 0.0, dataset: str = None):
+    ids = [corpus_id for corpus_id, _ in stream_corpora(dataset)]
+    return ids, neighbor_adjacency(ids, threshold)
+
+# Greedy colouring of the nodes in the given order: every node takes the smallest colour none of its
+# neighbours has, so nodes of one colour are never adjacent. A node of degree d gets a colour <= d.
+def _greedy_coloring(adjacency, order):
+    colors = np.full(adjacency.shape[0], -1, dtype=np.int64)
+    for node in order:
+        neighbor_colors = colors[adjacency.indices[adjacency.indptr[node]:adjacency.indptr[node + 1]]]
+        used = np.zeros(len(neighbor_colors) + 1, dtype=bool)
+        used[neighbor_colors[(neighbor_colors >= 0) & (neighbor_colors < len(used))]] = True
+        colors[node] = np.argmin(used)
+    return colors
+
+# Relabel the nodes (rows of the sparse matrix rows) with the heaviest label among their neighbours.
+# Relabelling the columns with the neighbours' labels and summing duplicates gives the weight every node
+# receives per label. A node keeps its label when it is among the heaviest, other ties are broken randomly.
+def _relabel(rows, nodes, labels, rng):
+    # copy=True since sum_duplicates works in place and would corrupt the shared adjacency arrays
+    votes = sp.csr_matrix((rows.data, labels[rows.indices], rows.indptr), shape=rows.shape, copy=True)
+    votes.sum_duplicates()
+    if votes.nnz == 0:
+        return
+    counts = np.diff(votes.indptr)
+    has_votes = counts > 0
+    vote_rows = np.repeat(np.arange(len(nodes)), counts)
+    row_max = np.maximum.reduceat(votes.data, votes.indptr[:-1][has_votes])
+    candidates = np.flatnonzero(votes.data >= np.repeat(row_max, counts[has_votes]))
+    candidate_rows = vote_rows[candidates]
+    candidate_labels = votes.indices[candidates]
+    priority = rng.random(len(candidates)) + (candidate_labels == labels[nodes[candidate_rows]])
+    order = np.lexsort((-priority, candidate_rows))
+    winner_rows, first = np.unique(candidate_rows[order], return_index=True)
+    labels[nodes[winner_rows]] = candidate_labels[order[first]]
+
+# Semi-synchronous label propagation over a sparse weighted adjacency matrix. The nodes are coloured
+# once so that no two neighbours share a colour; every round then relabels the colour classes one after
+# the other in a random order. A class is relabelled at once with vectorized NumPy code, which is the
+# same as updating its nodes one by one since they are not adjacent. Unlike synchronous rounds, where
+# every node reads the labels of the previous round, this cannot flip labels back and forth forever
+# on bipartite graphs. Propagation stops when a round ends with labels seen before, i.e. they stopped
+# changing or started cycling.
+def label_propagation(adjacency, max_iter: int = 30, seed: int = 42):
+    adjacency = sp.csr_matrix(adjacency, dtype=np.float64, copy=True)
+    # Self loops would vote for the node's own label and zero weights carry no vote
+    adjacency.setdiag(0)
+    adjacency.eliminate_zeros()
+    n = adjacency.shape[0]
+    rng = np.random.default_rng(seed)
+    labels = np.arange(n)
+    colors = _greedy_coloring(adjacency, rng.permutation(n))
+    by_color = np.argsort(colors, kind="stable")
+    bounds = np.searchsorted(colors[by_color], np.arange(colors.max() + 2)) if n else np.zeros(1, dtype=np.int64)
+    classes = [by_color[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+    class_rows = [adjacency[nodes] for nodes in classes]
+    # Digests of the labels after every round
+    seen = {hashlib.sha1(labels.tobytes()).digest()}
+    for _ in range(max_iter):
+        for color in rng.permutation(len(classes)):
+            _relabel(class_rows[color], classes[color], labels, rng)
+        state = hashlib.sha1(labels.tobytes()).digest()
+        if state in seen:
+            break
+        seen.add(state)
+    return _consecutive_labels(labels)
+
+# Communities of the sparse top-k neighbour graph
+def cluster_documents_neighbors(threshold: float = 0.0, dataset: str = None):
+    ids, adjacency = build_neighbor_graph(threshold, dataset)
+    if not ids:
+        raise ValueError("No documents to cluster.")
+    labels = label_propagation(adjacency)
+    return dict(zip(ids, labels.tolist()))
+
+# Run one of the scalable engines and summarize the flat labels
+def run_scalable_clustering(method: str, n_clusters: int = 8, threshold: float = 0.0, dataset: str = None):
+    if method not in ("kmeans", "neighbors"):
+        raise ValueError(f"Unknown clustering method '{method}', expected one of {CLUSTERING_METHODS}")
+    with CLUSTERING_SECONDS.labels(method).time():
+        if method == "kmeans":
+            labels = cluster_documents_kmeans(n_clusters, dataset=dataset)
+        else:
+            labels = cluster_documents_neighbors(threshold, dataset)
+    n_found = len(set(labels.values()))
+    logger.info(f"{method} clustering completed with {n_found} clusters.")
+    return {"message": f"{method} clustering completed.", "method": method,
+            "n_clusters": n_found, "labels": labels}
+
+# Fit LDA on the corpora of a dataset and assign every document its most probable topic
+# With incremental=True, documents not seen yet are folded into the saved model of the dataset
+# instead of refitting it on the whole corpus
+@CLUSTERING_SECONDS.labels("lda").time()
+def compute_lda_assignments(n_topics: int, dataset: str = None, incremental: bool = False):
     lda = LDA(n_topics=n_topics, max_iter=10, random_state=42)
     # Query data
-    corpora = query_all_corpora()
+    corpora = query_all_corpora(dataset)
     # Extract texts and ids using correct keys from neo4j query
     corpus = [doc["text"] for doc in corpora]
     ids = [doc["id"] for doc in corpora]
-    # Run LDA clustering
-    lda.run(corpus, ids)
+    if incremental:
+        clusters, _ = lda.partial_fit_transform(corpus, model_state_path(n_topics, dataset))
+    else:
+        clusters, _ = lda.fit_transform(corpus)
+    return {"ids": ids, "titles": [doc["title"] for doc in corpora], "topics": clusters.tolist()}
+
+# Topic assignments, cached until the graph changes (keyed by topic count, dataset, mode and graph generation)
+def get_lda_assignments(n_topics: int = 5, dataset: str = None, incremental: bool = False):
+    return cached_query("lda_assignments", compute_lda_assignments, int(n_topics), dataset, bool(incremental))
+
+# Topic label by corpus id
+def lda_cluster_labels(n_topics: int = 5, dataset: str = None, incremental: bool = False):
+    result = get_lda_assignments(n_topics, dataset, incremental)
+    return dict(zip(result["ids"], result["topics"]))
+
+def run_lda_clustering(n_topics: int = 5, dataset: str = None, incremental: bool = False):
+    result = get_lda_assignments(n_topics, dataset, incremental)
+    # Render the assignments
+    LDA(n_topics=n_topics).visualize_clusters(result["ids"], result["topics"], result["titles"])
     logger.info(f"LDA clustering completed with {n_topics} topics.")
-    return {"message": f"LDA clustering completed with {n_topics} topics."}
\ No newline at end of file
+    return {"message": f"LDA clustering completed with {n_topics} topics."}
+
+# Fit several topic counts in parallel and keep the model with the lowest held-out perplexity as the
+# saved (incremental) model of the dataset, returning every count's scores and the best labels
+def run_lda_topic_sweep(topic_counts, dataset: str = None):
+    corpora = query_all_corpora(dataset)
+    corpus = [doc["text"] for doc in corpora]
+    ids = [doc["id"] for doc in corpora]
+    if len(corpus) < 2:
+        raise ValueError("At least two documents are needed for an LDA topic sweep.")
+
+    start = time.perf_counter()
+    scores, best = sweep_topic_counts(corpus, topic_counts)
+    elapsed = time.perf_counter() - start
+    CLUSTERING_SECONDS.labels("lda_sweep").observe(elapsed)
+
+    lda = LDA(n_topics=best["n_topics"])
+    lda.model, lda.vocabulary = best["model"], best["vocabulary"]
+    # Only the training documents count as seen, so the next incremental update trains on the held-out ones
+    lda.save_state(model_state_path(best["n_topics"], dataset), [corpus[row] for row in best["train_rows"]])
+    topics = np.argmax(lda.model.transform(best["matrix"]), axis=1)
+
+    logger.info(f"LDA topic sweep over {list(topic_counts)} completed in {elapsed:.1f}s, "
+                f"best n_topics={best['n_topics']}.")
+    return {"best_n_topics": best["n_topics"], "wall_time": elapsed, "results": scores,
+            "labels": dict(zip(ids, topics.tolist()))}
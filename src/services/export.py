@@ -0,0 +1,107 @@
+"""
+export.py
+This module provides a columnar bulk export of the correlation graph for analytics consumers.
+The edge list (id1, id2, float32 correlation) and the node table (id, title) are read from the
+database cursor in record batches and written as Parquet or Arrow IPC stream bytes as they are
+produced, so neither the table nor the encoded file is ever held in memory in full.
+Functions:
+    stream_export(table, fmt, batch_size): Yields the encoded bytes of the requested table.
+"""
+import io
+import itertools
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from services.causal import stream_correlation_edges, stream_corpora
+
+# Number of rows per record batch (and per Parquet row group)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "65536"))
+
+EDGE_SCHEMA = pa.schema([("id1", pa.int64()), ("id2", pa.int64()), ("correlation", pa.float32())])
+NODE_SCHEMA = pa.schema([("id", pa.int64()), ("title", pa.string())])
+
+# Supported formats with their media types and file extensions
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+EXPORT_TABLES = ("edges", "nodes")
+
+# Write-only file object collecting the writer output until it is drained into the response
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+# Build record batches of the edge list, non-finite correlations become nulls
+def _edge_batches(batch_size):
+    edges = stream_correlation_edges()
+    while True:
+        chunk = list(itertools.islice(edges, batch_size))
+        if not chunk:
+            return
+        id1, id2, correlation = zip(*chunk)
+        scores = np.array([np.nan if c is None else c for c in correlation], dtype=np.float32)
+        yield pa.RecordBatch.from_arrays([
+            pa.array(np.asarray(id1, dtype=np.int64)),
+            pa.array(np.asarray(id2, dtype=np.int64)),
+            pa.array(scores, mask=~np.isfinite(scores)),
+        ], schema=EDGE_SCHEMA)
+
+# Build record batches of the node table
+def _node_batches(batch_size):
+    nodes = stream_corpora()
+    while True:
+        chunk = list(itertools.islice(nodes, batch_size))
+        if not chunk:
+            return
+        ids, titles = zip(*chunk)
+        yield pa.RecordBatch.from_arrays([
+            pa.array(np.asarray(ids, dtype=np.int64)),
+            pa.array(titles, type=pa.string()),
+        ], schema=NODE_SCHEMA)
+
+# Generator yielding the table encoded as Parquet or Arrow IPC, one chunk per record batch
+def stream_export(table: str = "edges", fmt: str = "parquet", batch_size: int = EXPORT_BATCH_SIZE):
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}', expected one of {EXPORT_TABLES}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {tuple(EXPORT_FORMATS)}")
+
+    if table == "edges":
+        schema, batches = EDGE_SCHEMA, _edge_batches(batch_size)
+    else:
+        schema, batches = NODE_SCHEMA, _node_batches(batch_size)
+
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    for batch in batches:
+        writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    # Closing writes the Parquet footer or the IPC end-of-stream marker
+    writer.close()
+    yield sink.drain()
@@ -6,24 +6,30 @@ Functions:
     parse_html_content(url: str, idx: int) -> str:
         Parses the HTML content of a given URL, extracts the title and meaningful content, and exports it to a .html file.
         Returns "Accessible" if the URL is processed successfully, otherwise returns "Not Accessible".
-    process_csv(contents: bytes) -> str:
+    process_csv(contents: bytes, include_articles: bool) -> str:
         Processes a CSV file containing URLs, extracts and exports the HTML content of each URL, and tracks the progress.
         Returns a string representation of the DataFrame with an added 'Accessibility' column indicating the status of each URL.
+        With include_articles, every progress update also carries the index, title, summary and accessibility of the
+        article that just completed.
 """
 import pandas as pd
 from io import StringIO
 import httpx
 from bs4 import BeautifulSoup
 from utils.nlp_processor import make_summary
+from utils.metrics import (FETCH_SECONDS, PARSE_SECONDS, SUMMARIZE_SECONDS, IN_FLIGHT_FETCHES,
+                           UPLOAD_PENDING_URLS)
+from utils.search_index import SearchIndexWriter
+from utils.responses import dumps_line
+from utils.shared_store import (publish_progress, artifact_path, writing_artifact, DATA_ARTIFACT,
+                                DATA_LIGHT_ARTIFACT)
+import os
 import asyncio
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-progress = {"total": 0, "processed": 0, "error_processed": 0}
-df_global = None  # Global variable to store the DataFrame
-
 # Function to extract the title and meaningful content from a BeautifulSoup object
 def extract_content(soup):
     title = soup.title.string if soup.title else "No Title"
@@ -40,20 +46,23 @@ async def parse_html_content(url: str, queue: asyncio.Queue, idx: int, ratio=0.1
     async with httpx.AsyncClient() as client:
         try:
             # Send a GET request to the URL
-            response = await client.get(url)
+            with IN_FLIGHT_FETCHES.track_inprogress(), FETCH_SECONDS.time():
+                response = await client.get(url)
             response.raise_for_status()
             
             # Check if response has content
             if not response.content:
                 raise ValueError("Empty response received")
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract title and content (will raise ValueError if empty)
-            title, non_title_content = extract_content(soup)
+            with PARSE_SECONDS.time():
+                soup = BeautifulSoup(response.content, 'html.parser')
+                
+                # Extract title and content (will raise ValueError if empty)
+                title, non_title_content = extract_content(soup)
             
             # Generate summary using make_summary
-            summary = make_summary(non_title_content, ratio, max_sentences)
+            with SUMMARIZE_SECONDS.time():
+                summary = make_summary(non_title_content, ratio, max_sentences)
             
             # Validate summary
             if not summary:
@@ -69,8 +78,10 @@ async def parse_html_content(url: str, queue: asyncio.Queue, idx: int, ratio=0.1
             await queue.put((idx, "No Title", "", "", "Not Accessible"))
 
 # Asynchronous function to process a CSV file containing URLs and yield progress updates
-async def process_csv(contents: bytes, ratio=0.1, max_sentences=10):
-    global df_global
+# With include_articles, each update also holds the completed article so clients can show it right away
+async def process_csv(contents: bytes, ratio=0.1, max_sentences=10, include_articles=False):
+    pending_urls = 0
+    index_writer = None
 
     try:
         # Check if the contents are empty
@@ -97,14 +108,25 @@ async def process_csv(contents: bytes, ratio=0.1, max_sentences=10):
         contents_list = [None] * total
         summaries = [None] * total
         
+        # The search index follows the data of the last upload and is filled as articles complete.
+        # Its SQLite writes block, so they run in a thread instead of on the event loop.
+        index_writer = SearchIndexWriter()
+        await asyncio.to_thread(index_writer.reset)
+
         # Create an asyncio.Queue to collect results
         queue = asyncio.Queue()
         
         # Create tasks to process each URL
-        tasks = [parse_html_content(url, queue, idx, ratio, max_sentences) for idx, url in enumerate(urls)]
+        tasks = [asyncio.create_task(parse_html_content(url, queue, idx, ratio, max_sentences))
+                 for idx, url in enumerate(urls)]
         
         # Process tasks as they complete
         pending_tasks = set(tasks)
+        pending_urls = total
+        UPLOAD_PENDING_URLS.inc(total)
+        # Shared with every API worker, the upload stream itself only reaches the uploading client
+        publish_progress("upload", {"status": "processing", "total": total, "processed": 0, "errors": 0},
+                         force=True)
         while pending_tasks:
             done, pending_tasks = await asyncio.wait(
                 pending_tasks, 
@@ -112,25 +134,40 @@ async def process_csv(contents: bytes, ratio=0.1, max_sentences=10):
             )
             
             for completed_task in done:
+                article = None
                 try:
                     await completed_task
                     idx, title, content, summary, accessibility_status = await queue.get()
+                    article = {"index": idx, "title": title, "summary": summary,
+                               "accessibility": accessibility_status}
                     titles[idx] = title
                     contents_list[idx] = content
                     summaries[idx] = summary
                     accessibility[idx] = accessibility_status
                     if accessibility_status != "Accessible":
                         error_processed += 1
+                    else:
+                        index_writer.buffer(idx, title, summary, content)
+                        if index_writer.full:
+                            await asyncio.to_thread(index_writer.flush)
                 except Exception as e:
                     logging.error(f"Error during processing task: {e}")
                     error_processed += 1
                 finally:
                     processed += 1
+                    pending_urls -= 1
+                    UPLOAD_PENDING_URLS.dec()
                     update_message = (
                         f'{{"status": "processing", "total": {total}, '
                         f'"processed": {processed}, "errors": {error_processed}}}\n'
                     )
                     logging.info(update_message)
+                    publish_progress("upload", {"status": "processing", "total": total,
+                                                "processed": processed, "errors": error_processed})
+                    if include_articles and article is not None:
+                        # Titles and summaries need proper JSON escaping, unlike the counters
+                        update_message = dumps_line({"status": "processing", "total": total, "processed": processed,
+                                                     "errors": error_processed, "article": article}).decode()
                     yield update_message
         
         # Add new columns to the DataFrame
@@ -139,9 +176,6 @@ async def process_csv(contents: bytes, ratio=0.1, max_sentences=10):
         df['Summary'] = summaries
         df['Accessibility'] = accessibility
         
-        # Store the DataFrame in the global variable
-        df_global = df
-        
         # Generate completion message
         completion_message = (
             f'{{"status": "complete", "message": "Processing complete", '
@@ -149,38 +183,57 @@ async def process_csv(contents: bytes, ratio=0.1, max_sentences=10):
         )
         logging.info(completion_message.strip())
         
-        # Call print_data_to_file after completion
-        print_result = print_data_to_file()
+        # Call print_data_to_file after completion, writing the CSVs off the event loop as well
+        print_result = await asyncio.to_thread(print_data_to_file, df)
+        publish_progress("upload", {"status": "complete", "total": total, "processed": processed,
+                                    "errors": error_processed}, force=True)
         final_message = completion_message.rstrip('\n')[:-1] + f', "file_status": "{print_result}"' + '}\n'
         
         yield final_message
 
     except asyncio.CancelledError:
+        publish_progress("upload", {"status": "cancelled"}, force=True)
         yield '{"status": "cancelled", "message": "Processing was cancelled"}\n'
     except Exception as e:
         error_message = f'{{"status": "error", "message": "Error during processing: {str(e)}"}}\n'
         logging.error(error_message)
+        publish_progress("upload", {"status": "error", "message": f"Error during processing: {e}"}, force=True)
         yield error_message
+    finally:
+        # URLs of an upload that failed or was cancelled midway are no longer pending
+        UPLOAD_PENDING_URLS.dec(pending_urls)
+        # Articles completed so far stay searchable, even if the upload did not finish
+        if index_writer is not None:
+            await asyncio.to_thread(index_writer.flush)
 
 # Wrapper function to run the asynchronous process_csv function
-def process_csv_sync(contents: bytes, ratio=0.1, max_sentences=10):
+def process_csv_sync(contents: bytes, ratio=0.1, max_sentences=10, include_articles=False):
     async def async_process():
-        async for update in process_csv(contents, ratio, max_sentences):
+        async for update in process_csv(contents, ratio, max_sentences, include_articles):
             yield update
     return async_process
 
-# Function to print the DataFrame to a .csv file
-def print_data_to_file():
-    global df_global
-    if df_global is not None:
-        df_global.to_csv("printed_data.csv", index=False, encoding="utf-8")
-        return "Data printed to printed_data.csv"
-    else:
-        return "No data available to print"
-    
-def return_df_as_csv():
-    global df_global
-    if df_global is not None:
-        return df_global.to_csv(index=False, encoding="utf-8")
-    else:
-        return "No data available to return"
\ No newline at end of file
+# Function to print the DataFrame to the data artifacts, which every API worker reads
+def print_data_to_file(df):
+    with writing_artifact(DATA_ARTIFACT) as tmp_path:
+        df.to_csv(tmp_path, index=False, encoding="utf-8")
+    # Lightweight variant for views that do not need the full article content
+    with writing_artifact(DATA_LIGHT_ARTIFACT) as tmp_path:
+        df.drop(columns=["Content"], errors="ignore").to_csv(tmp_path, index=False, encoding="utf-8")
+    return f"Data printed to {DATA_ARTIFACT}"
+
+# Path of the serialized data of the last upload (without the Content column unless include_content),
+# or None if nothing has been uploaded yet
+def data_artifact_path(include_content: bool = True):
+    path = artifact_path(DATA_ARTIFACT)
+    if not os.path.exists(path):
+        return None
+    if include_content:
+        return path
+    light_path = artifact_path(DATA_LIGHT_ARTIFACT)
+    # Artifacts written before the lightweight variant existed, or by hand, get it derived once
+    if not os.path.exists(light_path) or os.path.getmtime(light_path) < os.path.getmtime(path):
+        df = pd.read_csv(path)
+        with writing_artifact(DATA_LIGHT_ARTIFACT) as tmp_path:
+            df.drop(columns=["Content"], errors="ignore").to_csv(tmp_path, index=False, encoding="utf-8")
+    return light_path
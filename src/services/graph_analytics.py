@@ -0,0 +1,231 @@
+"""
+graph_analytics.py
+This module answers graph questions over the full correlation matrix: which articles form connected themes
+above a correlation threshold, which articles are hubs, and which communities the graph falls apart into.
+The correlation edges of a dataset are read once per threshold into a symmetric scipy.sparse matrix (float32
+scores) that is cached until the graph changes; every analysis then runs vectorized SciPy/NumPy code on it
+instead of a query over the whole graph. The matrix only keeps the correlations >= threshold that are among
+the GRAPH_ANALYTICS_TOP_K strongest of either of their articles, so the cached matrix of every API worker
+holds O(n * top_k) instead of O(n^2) correlations. As in sanitize_correlation, non-finite scores count as
+missing and never become edges.
+Functions:
+    top_k_edges(rows, cols, scores, n, top_k) -> tuple: Keeps the pairs among the top_k best of either article.
+    correlation_matrix(dataset, threshold) -> dict: Returns the cached ids, titles and sparse correlation matrix.
+    pagerank(adjacency, damping, tol, max_iter) -> np.ndarray: Weighted PageRank by power iteration.
+    modularity(adjacency, labels) -> float: Newman modularity of a partition of a weighted graph.
+    get_connected_components(threshold, min_size, limit, dataset) -> dict: Connected components, largest first.
+    get_centrality(threshold, measure, limit, dataset) -> dict: Articles ranked by a centrality measure.
+    get_communities(threshold, min_size, limit, dataset) -> dict: Label propagation communities, largest first.
+"""
+import itertools
+import os
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from services.causal import stream_corpora, stream_correlation_edges
+from services.cluster import EDGE_CHUNK_SIZE, label_propagation, ids_to_positions
+from utils.query_cache import cached_query
+import logging
+
+logger = logging.getLogger(__name__)
+
+CENTRALITY_MEASURES = ("degree", "weighted_degree", "pagerank")
+
+# Strongest correlations kept per article, 0 keeps every correlation >= threshold
+GRAPH_ANALYTICS_TOP_K = int(os.getenv("GRAPH_ANALYTICS_TOP_K", "50"))
+
+# Keep the pairs (rows < cols) that are among the top_k best scores of either of their nodes, dropping
+# duplicate pairs. Every node contributes at most top_k pairs, so at most n * top_k are kept.
+def top_k_edges(rows, cols, scores, n: int, top_k: int):
+    _, first = np.unique(rows * n + cols, return_index=True)
+    rows, cols, scores = rows[first], cols[first], scores[first]
+    if top_k <= 0:
+        return rows, cols, scores
+    m = len(rows)
+    nodes = np.concatenate([rows, cols])
+    # Rank every pair among the pairs of each of its two nodes, best first
+    order = np.lexsort((-np.concatenate([scores, scores]), nodes))
+    sorted_nodes = nodes[order]
+    rank = np.empty(2 * m, dtype=np.int64)
+    rank[order] = np.arange(2 * m) - np.searchsorted(sorted_nodes, sorted_nodes)
+    keep = (rank[:m] < top_k) | (rank[m:] < top_k)
+    return rows[keep], cols[keep], scores[keep]
+
+# Read the correlation edges of a dataset chunk by chunk into a symmetric sparse matrix over its corpora,
+# ordered by corpus id, keeping the correlations >= threshold among the top_k best of either article
+def _load_correlation_matrix(dataset: str = None, threshold: float = -1.0, top_k: int = GRAPH_ANALYTICS_TOP_K):
+    corpora = sorted(stream_corpora(dataset))
+    doc_ids = np.asarray([corpus_id for corpus_id, _ in corpora], dtype=np.int64)
+    n = len(doc_ids)
+    rows = cols = np.empty(0, dtype=np.int64)
+    scores = np.empty(0, dtype=np.float32)
+    # Without corpora no edge can be placed, so the edges are not read at all
+    edges = stream_correlation_edges(dataset) if n else iter(())
+    while True:
+        chunk = list(itertools.islice(edges, EDGE_CHUNK_SIZE))
+        if not chunk:
+            break
+        count = len(chunk)
+        ids1 = np.fromiter((edge[0] for edge in chunk), dtype=np.int64, count=count)
+        ids2 = np.fromiter((edge[1] for edge in chunk), dtype=np.int64, count=count)
+        values = np.fromiter((np.nan if edge[2] is None else edge[2] for edge in chunk),
+                             dtype=np.float64, count=count)
+        pos1, pos2, values = ids_to_positions(doc_ids, ids1, ids2, values)
+        # Self pairs are no edges and non-finite scores are missing, as in sanitize_correlation
+        valid = (pos1 != pos2) & np.isfinite(values) & (values >= threshold)
+        rows = np.concatenate([rows, np.minimum(pos1, pos2)[valid]])
+        cols = np.concatenate([cols, np.maximum(pos1, pos2)[valid]])
+        scores = np.concatenate([scores, values[valid].astype(np.float32)])
+        # Prune once more pairs are held than the top-k graph can keep, so memory stays O(n * top_k + chunk).
+        # A pair pruned here can never get back into the top_k of its nodes.
+        if top_k > 0 and len(rows) > 2 * n * top_k:
+            rows, cols, scores = top_k_edges(rows, cols, scores, n, top_k)
+
+    # Also keeps one score of a pair stored in both directions, which the CSR conversion would sum
+    rows, cols, scores = top_k_edges(rows, cols, scores, n, top_k)
+    matrix = sp.csr_matrix((np.concatenate([scores, scores]), (np.concatenate([rows, cols]),
+                                                              np.concatenate([cols, rows]))), shape=(n, n))
+    logger.info(f"Loaded the correlation matrix of {n} articles with {len(scores)} correlations >= {threshold}.")
+    return {
+        "ids": doc_ids.tolist(),
+        "titles": [title for _, title in corpora],
+        "matrix": matrix,
+    }
+
+# Sparse correlation matrix of a dataset at a threshold, read once and cached until the graph changes.
+# Explicit entries are edges, so a correlation of exactly 0 stays an edge when the threshold allows it.
+def correlation_matrix(dataset: str = None, threshold: float = -1.0):
+    return cached_query("correlation_matrix", _load_correlation_matrix, dataset, float(threshold),
+                        GRAPH_ANALYTICS_TOP_K)
+
+# Weighted PageRank by power iteration on the sparse matrix. Negative correlations transfer no rank, and
+# the rank of articles without an edge is spread evenly over all articles.
+def pagerank(adjacency, damping: float = 0.85, tol: float = 1e-8, max_iter: int = 100):
+    weights = sp.csr_matrix(adjacency, dtype=np.float64)
+    weights.data = np.maximum(weights.data, 0)
+    n = weights.shape[0]
+    if n == 0:
+        return np.empty(0)
+    out_weight = np.asarray(weights.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    # Row-stochastic transition matrix, transposed once so every step is a single sparse product
+    inverse = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+    transition = (sp.diags(inverse) @ weights).T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        updated = damping * (transition @ rank + rank[dangling].sum() / n) + (1 - damping) / n
+        if np.abs(updated - rank).sum() < n * tol:
+            return updated
+        rank = updated
+    return rank
+
+# Newman modularity Q = sum over communities of (internal weight / 2m) - (total degree / 2m)^2
+def modularity(adjacency, labels):
+    weights = sp.coo_matrix(adjacency)
+    data = np.maximum(weights.data, 0)
+    two_m = data.sum()
+    if two_m == 0:
+        return 0.0
+    labels = np.asarray(labels)
+    internal = np.bincount(labels[weights.row], data * (labels[weights.row] == labels[weights.col]))
+    total = np.bincount(labels[weights.row], data)
+    return float((internal / two_m - (total / two_m) ** 2).sum())
+
+# Groups of node positions per label, largest first, ignoring groups below min_size
+def _groups(labels, min_size: int):
+    order = np.argsort(labels, kind="stable")
+    _, starts, sizes = np.unique(labels[order], return_index=True, return_counts=True)
+    ranked = np.argsort(-sizes, kind="stable")
+    return [order[starts[g]:starts[g] + sizes[g]] for g in ranked if sizes[g] >= min_size]
+
+# Mean correlation of the edges inside a group of nodes
+def _mean_correlation(adjacency, members):
+    sub = adjacency[members][:, members]
+    return round(float(sub.data.mean()), 4) if sub.nnz else None
+
+def _describe_groups(graph, adjacency, groups, limit: int):
+    ids, titles = graph["ids"], graph["titles"]
+    return [{
+        "size": len(members),
+        "mean_correlation": _mean_correlation(adjacency, members),
+        "ids": [ids[i] for i in members],
+        "titles": [titles[i] for i in members],
+    } for members in groups[:limit]]
+
+def compute_connected_components(threshold: float, min_size: int = 2, limit: int = 10, dataset: str = None):
+    graph = correlation_matrix(dataset, threshold)
+    adjacency = graph["matrix"]
+    n_components, labels = connected_components(adjacency, directed=False)
+    groups = _groups(labels, min_size)
+    return {
+        "threshold": threshold,
+        "total_nodes": len(graph["ids"]),
+        "n_components": n_components,
+        "isolated": int((np.diff(adjacency.indptr) == 0).sum()),
+        "components": _describe_groups(graph, adjacency, groups, limit),
+    }
+
+def compute_centrality(threshold: float, measure: str = "degree", limit: int = 10, dataset: str = None):
+    graph = correlation_matrix(dataset, threshold)
+    adjacency = graph["matrix"]
+    n = adjacency.shape[0]
+    degree = np.diff(adjacency.indptr)
+    if measure == "degree":
+        # Share of the other articles an article is correlated with
+        scores = degree / max(n - 1, 1)
+    elif measure == "weighted_degree":
+        scores = np.asarray(adjacency.sum(axis=1), dtype=np.float64).ravel()
+    else:
+        scores = pagerank(adjacency)
+    top = np.argsort(-scores, kind="stable")[:limit]
+    ids, titles = graph["ids"], graph["titles"]
+    return {
+        "threshold": threshold,
+        "measure": measure,
+        "total_nodes": n,
+        "ranking": [{"id": ids[i], "title": titles[i], "score": round(float(scores[i]), 6),
+                     "degree": int(degree[i])} for i in top],
+    }
+
+def compute_communities(threshold: float, min_size: int = 2, limit: int = 10, dataset: str = None):
+    graph = correlation_matrix(dataset, threshold)
+    adjacency = graph["matrix"]
+    # Negative correlations are no votes for a shared community
+    weights = adjacency.copy()
+    weights.data = np.maximum(weights.data, 0)
+    labels = label_propagation(weights)
+    groups = _groups(labels, min_size)
+    return {
+        "threshold": threshold,
+        "total_nodes": len(graph["ids"]),
+        "n_communities": len(groups),
+        "modularity": round(modularity(weights, labels), 6),
+        "communities": _describe_groups(graph, adjacency, groups, limit),
+    }
+
+def _validate(threshold: float, min_size: int = 1, limit: int = 1):
+    if not -1.0 <= threshold <= 1.0:
+        raise ValueError("threshold must be between -1 and 1")
+    if min_size < 1:
+        raise ValueError("min_size must be a positive integer")
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+
+# Connected components of the articles correlated at >= threshold, cached until the graph changes
+def get_connected_components(threshold: float, min_size: int = 2, limit: int = 10, dataset: str = None):
+    _validate(threshold, min_size, limit)
+    return cached_query("connected_components", compute_connected_components,
+                        float(threshold), int(min_size), int(limit), dataset)
+
+# Top articles by a centrality measure of the graph at >= threshold, cached until the graph changes
+def get_centrality(threshold: float, measure: str = "degree", limit: int = 10, dataset: str = None):
+    _validate(threshold, limit=limit)
+    if measure not in CENTRALITY_MEASURES:
+        raise ValueError(f"Unknown centrality measure '{measure}', expected one of {CENTRALITY_MEASURES}")
+    return cached_query("centrality", compute_centrality, float(threshold), measure, int(limit), dataset)
+
+# Label propagation communities of the graph at >= threshold, cached until the graph changes
+def get_communities(threshold: float, min_size: int = 2, limit: int = 10, dataset: str = None):
+    _validate(threshold, min_size, limit)
+    return cached_query("communities", compute_communities,
+                        float(threshold), int(min_size), int(limit), dataset)
@@ -0,0 +1,283 @@
+"""
+jobs.py
+This module runs the long analysis tasks (correlation calculation, hierarchical and LDA clustering, LDA
+topic sweeps) as background jobs, so the API returns a job id at once instead of holding a server worker
+for minutes.
+Jobs wait in a bounded priority queue drained by a fixed pool of worker threads. Generator tasks report
+their latest progress update and are cancelled cooperatively between updates; other tasks can only be
+cancelled while queued.
+Every job record is mirrored to the shared store, so any API worker can report on, list or cancel a job
+run by another worker; a cancellation requested through another worker is picked up by the owning
+worker at the next progress update or before the job starts.
+Classes:
+    Job: State, progress and result of one submitted job.
+    JobScheduler: Bounded priority queue with its worker threads.
+Functions:
+    get_scheduler() -> JobScheduler: Returns the process-wide scheduler, starting its workers on first use.
+"""
+from collections import OrderedDict
+import inspect
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import logging
+from services.causal import store_correlation_scores_stream
+from services.cluster import (run_hierarchical_clustering, run_lda_clustering, run_scalable_clustering,
+                              run_lda_topic_sweep, CLUSTERING_METHODS, DENDROGRAM_TRUNCATE_P)
+from utils.graph_backend import DEFAULT_DATASET
+from utils.metrics import JOB_QUEUE_DEPTH
+from utils.shared_store import get_store, PROGRESS_PUBLISH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Number of jobs running at the same time
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Number of jobs that can wait in the queue before submissions are rejected
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+# Number of jobs kept for status queries, the oldest finished jobs are forgotten first
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "200"))
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+class JobQueueFullError(RuntimeError):
+    pass
+
+# Compute and store the correlations of the uploaded articles, yielding the progress updates
+def _calculate_correlation_job(dataset: str = DEFAULT_DATASET):
+    for update in store_correlation_scores_stream(dataset):
+        yield json.loads(update)
+
+# Render the Ward dendrogram, or return the flat labels of a scalable engine
+def _hierarchical_clustering_job(method: str = "ward", n_clusters: int = 8, threshold: float = 0.0,
+                                 dataset: str = None, truncate_mode: str = None, p: int = DENDROGRAM_TRUNCATE_P):
+    if method not in CLUSTERING_METHODS:
+        raise ValueError(f"Unknown clustering method '{method}', expected one of {CLUSTERING_METHODS}")
+    if method != "ward":
+        return run_scalable_clustering(method, n_clusters=n_clusters, threshold=threshold, dataset=dataset)
+    return run_hierarchical_clustering(dataset, truncate_mode=truncate_mode, p=p)
+
+def _lda_clustering_job(n_topics: int = 5, dataset: str = None, incremental: bool = False):
+    return run_lda_clustering(n_topics=n_topics, dataset=dataset, incremental=incremental)
+
+def _lda_topic_sweep_job(topics: list, dataset: str = None):
+    return run_lda_topic_sweep(topics, dataset)
+
+# Job kinds and the functions running them, called with the job parameters as keyword arguments
+JOB_KINDS = {
+    "calculate-correlation": _calculate_correlation_job,
+    "hierarchical-clustering": _hierarchical_clustering_job,
+    "lda-clustering": _lda_clustering_job,
+    "lda-topic-sweep": _lda_topic_sweep_job,
+}
+
+class Job:
+    def __init__(self, kind: str, params: dict, priority: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.status = "queued"
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    # Rebuild a job of another worker from its shared record
+    @classmethod
+    def from_record(cls, record: dict):
+        job = cls.__new__(cls)
+        job.__dict__.update(record)
+        job.cancel_event = threading.Event()
+        return job
+
+    # Status summary and result, as stored for the other workers
+    def to_record(self):
+        return {**self.to_dict(), "result": self.result}
+
+    # Status summary without the result
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobScheduler:
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE,
+                 history_size: int = JOB_HISTORY_SIZE):
+        self._queue = queue.PriorityQueue(maxsize=queue_size)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._history_size = history_size
+        self._workers = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    # Queue a job, higher priorities run first and equal priorities in submission order
+    def submit(self, kind: str, params: dict = None, priority: int = 0) -> Job:
+        if kind not in JOB_KINDS:
+            raise KeyError(kind)
+        params = params or {}
+        try:
+            inspect.signature(JOB_KINDS[kind]).bind(**params)
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for {kind} job: {e}")
+
+        job = Job(kind, params, priority)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            self._queue.put_nowait((-priority, next(self._sequence), job))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFullError(f"The job queue is full ({self._queue.maxsize} jobs waiting)")
+        JOB_QUEUE_DEPTH.inc()
+        self._publish(job)
+        return job
+
+    # Jobs of this worker are live, jobs of other workers are read from their shared records
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = get_store().get(f"job:{job_id}")
+        return None if record is None else Job.from_record(record)
+
+    def list(self):
+        with self._lock:
+            local = dict(self._jobs)
+        jobs = {record["id"]: Job.from_record(record) for _, record in get_store().items("job:")}
+        jobs.update(local)
+        return sorted(jobs.values(), key=lambda job: job.submitted_at)
+
+    # Cancel a job: queued jobs never start, running generator jobs stop at their next progress update
+    def cancel(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status not in FINISHED_STATUSES:
+                job.cancel_event.set()
+                if job.status == "queued":
+                    job.status = "cancelled"
+                    job.finished_at = time.time()
+        if job is not None:
+            self._publish(job)
+            return job
+        # A job of another worker: flag it, the owning worker cancels it at its next check
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED_STATUSES:
+            get_store().set(f"job_cancel:{job_id}", True)
+        return job
+
+    # Number of jobs waiting for a worker
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            JOB_QUEUE_DEPTH.dec()
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    # Store the job record for the other workers
+    def _publish(self, job: Job):
+        try:
+            get_store().set(f"job:{job.id}", job.to_record())
+        except TypeError as e:
+            logger.warning(f"Result of job {job.id} ({job.kind}) cannot be shared: {e}")
+            get_store().set(f"job:{job.id}", {**job.to_dict(), "result": None})
+
+    # Pick up a cancellation requested through another worker
+    def _check_cancel_request(self, job: Job):
+        if get_store().get(f"job_cancel:{job.id}"):
+            job.cancel_event.set()
+        return job.cancel_event.is_set()
+
+    def _run(self, job: Job):
+        cancelled = self._check_cancel_request(job)
+        with self._lock:
+            # Jobs cancelled while queued stay in the queue until a worker skips them here
+            if job.status == "queued" and cancelled:
+                job.status = "cancelled"
+                job.finished_at = time.time()
+            if job.status != "queued":
+                return
+            job.status = "running"
+            job.started_at = time.time()
+        self._publish(job)
+
+        status, result, error = "completed", None, None
+        try:
+            output = JOB_KINDS[job.kind](**job.params)
+            if inspect.isgenerator(output):
+                published = time.monotonic()
+                try:
+                    for update in output:
+                        job.progress = update
+                        if job.cancel_event.is_set():
+                            break
+                        # Share the progress and look for remote cancellations without a write per update
+                        if time.monotonic() - published >= PROGRESS_PUBLISH_INTERVAL:
+                            published = time.monotonic()
+                            self._publish(job)
+                            if self._check_cancel_request(job):
+                                break
+                finally:
+                    # Closing runs the generator's cleanup, e.g. closing its database connector
+                    output.close()
+                result = job.progress
+            else:
+                result = output
+            if job.cancel_event.is_set():
+                status, result = "cancelled", None
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            status, error = "failed", str(e)
+
+        with self._lock:
+            job.status, job.result, job.error = status, result, error
+            job.finished_at = time.time()
+        self._publish(job)
+        get_store().delete(f"job_cancel:{job.id}")
+        logger.info(f"Job {job.id} ({job.kind}) {status}.")
+
+    # Forget the oldest finished jobs beyond the history size
+    def _prune(self):
+        excess = len(self._jobs) - self._history_size
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATUSES]
+        for job_id in finished[:excess]:
+            del self._jobs[job_id]
+            get_store().delete(f"job:{job_id}")
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> JobScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler()
+        return _scheduler
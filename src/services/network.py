@@ -0,0 +1,123 @@
+"""
+network.py
+This module builds the reduced correlation network drawn by the frontend's network view.
+Instead of every correlation, the network keeps the top_k best materialized neighbours of every article
+with a correlation of at least threshold, and at most max_nodes articles (those with the heaviest
+weighted degree). The node positions are computed on the server with a force-directed layout, and the
+whole network is cached until the graph changes, so the frontend only draws the returned coordinates.
+Functions:
+    force_layout(adjacency, iterations, seed, samples) -> np.ndarray: Force-directed 2D positions of the nodes.
+    compute_correlation_network(top_k, threshold, max_nodes, dataset) -> dict: Builds and lays out the network.
+    get_correlation_network(top_k, threshold, max_nodes, dataset) -> dict: Cached compute_correlation_network.
+"""
+import os
+import numpy as np
+import scipy.sparse as sp
+from services.causal import stream_corpora
+from services.cluster import neighbor_adjacency
+from utils.neighbors import NEIGHBOR_TOP_K
+from utils.query_cache import cached_query
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Largest network the endpoint lays out
+NETWORK_MAX_NODES = int(os.getenv("NETWORK_MAX_NODES", "5000"))
+NETWORK_LAYOUT_ITERATIONS = int(os.getenv("NETWORK_LAYOUT_ITERATIONS", "50"))
+# Nodes sampled per iteration for the repulsive forces, networks up to this size are laid out exactly
+NETWORK_LAYOUT_SAMPLES = int(os.getenv("NETWORK_LAYOUT_SAMPLES", "256"))
+
+# Fruchterman-Reingold layout in the unit square. The attractive forces run over the sparse edges; the
+# repulsion of all n^2 node pairs is estimated from a fresh random sample of nodes every iteration
+# (scaled up by n / samples), which keeps an iteration at O(n * samples + edges) so 5k nodes take about
+# a second instead of the minutes of networkx's spring_layout.
+def force_layout(adjacency, iterations: int = NETWORK_LAYOUT_ITERATIONS, seed: int = 42,
+                 samples: int = NETWORK_LAYOUT_SAMPLES):
+    adjacency = sp.csr_matrix(adjacency)
+    n = adjacency.shape[0]
+    rng = np.random.default_rng(seed)
+    x, y = rng.random(n), rng.random(n)
+    if n < 2:
+        return np.column_stack([x, y])
+    # Optimal distance between nodes
+    k2 = 1.0 / n
+    k = np.sqrt(k2)
+    # The temperature caps every step and cools linearly to zero
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    edges = sp.triu(adjacency, 1).tocoo()
+    src, dst, weight = edges.row, edges.col, edges.data
+    m = min(samples, n)
+    for _ in range(iterations):
+        sample = rng.choice(n, m, replace=False) if m < n else np.arange(n)
+        dx = x[:, None] - x[sample][None, :]
+        dy = y[:, None] - y[sample][None, :]
+        dist2 = dx * dx + dy * dy
+        np.maximum(dist2, 1e-9, out=dist2)
+        repulsion = (n / m) * k2 / dist2
+        disp_x = (dx * repulsion).sum(axis=1)
+        disp_y = (dy * repulsion).sum(axis=1)
+
+        ex, ey = x[src] - x[dst], y[src] - y[dst]
+        attraction = np.sqrt(ex * ex + ey * ey) * weight / k
+        pull_x, pull_y = ex * attraction, ey * attraction
+        disp_x += np.bincount(dst, pull_x, minlength=n) - np.bincount(src, pull_x, minlength=n)
+        disp_y += np.bincount(dst, pull_y, minlength=n) - np.bincount(src, pull_y, minlength=n)
+
+        length = np.maximum(np.sqrt(disp_x * disp_x + disp_y * disp_y), 0.01)
+        x += disp_x * temperature / length
+        y += disp_y * temperature / length
+        temperature -= cooling
+    return np.column_stack([x, y])
+
+# Scale positions into [-1, 1] keeping the aspect ratio
+def _normalize(positions):
+    if len(positions) == 0:
+        return positions
+    positions = positions - positions.mean(axis=0)
+    extent = np.abs(positions).max()
+    return positions / extent if extent > 0 else positions
+
+def compute_correlation_network(top_k: int = 5, threshold: float = 0.0, max_nodes: int = NETWORK_MAX_NODES,
+                                dataset: str = None):
+    corpora = list(stream_corpora(dataset))
+    ids = [corpus_id for corpus_id, _ in corpora]
+    adjacency = neighbor_adjacency(ids, threshold, top_k)
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+
+    # Articles without a kept edge carry no information in the network view
+    keep = np.flatnonzero(np.diff(adjacency.indptr) > 0)
+    if len(keep) > max_nodes:
+        keep = np.sort(keep[np.argsort(-degree[keep], kind="stable")[:max_nodes]])
+    sub = adjacency[keep][:, keep]
+
+    positions = _normalize(force_layout(sub))
+    edges = sp.triu(sub, 1).tocoo()
+    logger.info(f"Correlation network with {len(keep)} of {len(ids)} articles and {edges.nnz} edges laid out.")
+
+    # Columnar arrays keep the payload compact; edges refer to node positions in the node arrays
+    return {
+        "total_nodes": len(ids),
+        "nodes": {
+            "id": [ids[i] for i in keep],
+            "title": [corpora[i][1] for i in keep],
+            "x": np.round(positions[:, 0], 4),
+            "y": np.round(positions[:, 1], 4),
+            "degree": np.round(degree[keep], 4),
+        },
+        "edges": {
+            "source": edges.row,
+            "target": edges.col,
+            "weight": np.round(edges.data, 4),
+        },
+    }
+
+# Network of a dataset, cached until the graph changes
+def get_correlation_network(top_k: int = 5, threshold: float = 0.0, max_nodes: int = NETWORK_MAX_NODES,
+                            dataset: str = None):
+    if not 1 <= top_k <= NEIGHBOR_TOP_K:
+        raise ValueError(f"top_k must be between 1 and {NEIGHBOR_TOP_K} (the materialized neighbours per article)")
+    if not 1 <= max_nodes <= NETWORK_MAX_NODES:
+        raise ValueError(f"max_nodes must be between 1 and {NETWORK_MAX_NODES}")
+    return cached_query("correlation_network", compute_correlation_network,
+                        int(top_k), float(threshold), int(max_nodes), dataset)
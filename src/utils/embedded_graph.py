@@ -0,0 +1,350 @@
+"""
+embedded_graph.py
+This module provides an in-process graph backend implementing the same interface as Neo4jConnector.
+Corpus nodes are kept in Python lists and the CORRELATED relationships in a dense NumPy adjacency
+structure (a float64 weight matrix and a boolean presence matrix indexed by node row), so the graph
+queries run as vectorized NumPy operations without a network round trip. It is meant for small
+deployments, tests and benchmarks of up to a few thousand documents.
+The graph is shared by every connector in the process. When EMBEDDED_GRAPH_PATH is set the graph is
+loaded from that snapshot on first use and written back (atomically) when a connector that changed
+it is closed.
+Classes:
+    EmbeddedGraphStore: The in-memory graph and its snapshot persistence.
+    EmbeddedGraphConnector: GraphConnector over the shared EmbeddedGraphStore.
+"""
+import json
+import os
+import threading
+import numpy as np
+from utils.graph_backend import GraphConnector, DEFAULT_DATASET, CLEAR_BATCH_SIZE
+from utils.query_cache import bump_graph_generation
+
+# Optional .npz snapshot of the embedded graph
+EMBEDDED_GRAPH_PATH = os.getenv("EMBEDDED_GRAPH_PATH")
+
+# Initial node capacity of the adjacency matrices, doubled whenever it is exhausted
+INITIAL_CAPACITY = 64
+
+class EmbeddedGraphStore:
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.dirty = False
+        self._reset()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def _reset(self, capacity=INITIAL_CAPACITY):
+        self.ids = []          # corpus id of every node row
+        self.titles = []
+        self.texts = []
+        self.datasets = []
+        self.row_of = {}       # corpus id -> node row
+        self.neighbors = {}    # corpus id -> materialized (ids, titles, scores)
+        self.weights = np.full((capacity, capacity), np.nan, dtype=np.float64)
+        self.present = np.zeros((capacity, capacity), dtype=bool)
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    def _grow(self):
+        capacity = self.weights.shape[0] * 2
+        weights = np.full((capacity, capacity), np.nan, dtype=np.float64)
+        present = np.zeros((capacity, capacity), dtype=bool)
+        n = self.size
+        weights[:n, :n] = self.weights[:n, :n]
+        present[:n, :n] = self.present[:n, :n]
+        self.weights, self.present = weights, present
+
+    def add_node(self, corpus_id, title, text, dataset=DEFAULT_DATASET):
+        row = self.row_of.get(corpus_id)
+        if row is None:
+            if self.size == self.weights.shape[0]:
+                self._grow()
+            row = self.size
+            self.row_of[corpus_id] = row
+            self.ids.append(corpus_id)
+            self.titles.append(title)
+            self.texts.append(text)
+            self.datasets.append(dataset)
+        else:
+            self.titles[row] = title
+            self.texts[row] = text
+            self.datasets[row] = dataset
+        self.dirty = True
+
+    # Remove the nodes of the given rows and their relationships, compacting the matrices
+    def remove_rows(self, rows):
+        remove = set(rows)
+        keep = [row for row in range(self.size) if row not in remove]
+        removed_ids = {self.ids[row] for row in remove}
+        n = len(keep)
+        capacity = self.weights.shape[0]
+        weights = np.full((capacity, capacity), np.nan, dtype=np.float64)
+        present = np.zeros((capacity, capacity), dtype=bool)
+        weights[:n, :n] = self.weights[np.ix_(keep, keep)]
+        present[:n, :n] = self.present[np.ix_(keep, keep)]
+        self.weights, self.present = weights, present
+        self.ids = [self.ids[row] for row in keep]
+        self.titles = [self.titles[row] for row in keep]
+        self.texts = [self.texts[row] for row in keep]
+        self.datasets = [self.datasets[row] for row in keep]
+        self.row_of = {corpus_id: row for row, corpus_id in enumerate(self.ids)}
+        self.neighbors = {corpus_id: lists for corpus_id, lists in self.neighbors.items()
+                          if corpus_id not in removed_ids}
+        self.dirty = True
+
+    def add_edge(self, corpus_id1, corpus_id2, correlation):
+        row1 = self.row_of.get(corpus_id1)
+        row2 = self.row_of.get(corpus_id2)
+        # Like the Cypher MATCH, an edge to a missing node is silently not created
+        if row1 is None or row2 is None:
+            return
+        self.weights[row1, row2] = np.nan if correlation is None else correlation
+        self.present[row1, row2] = True
+        self.dirty = True
+
+    # Row/column indices of every edge, ordered by (id1, id2)
+    def edge_rows(self):
+        n = self.size
+        rows1, rows2 = np.nonzero(self.present[:n, :n])
+        ids = np.asarray(self.ids, dtype=np.int64)
+        order = np.lexsort((ids[rows2], ids[rows1]))
+        return rows1[order], rows2[order]
+
+    def correlation_at(self, row1, row2):
+        value = self.weights[row1, row2]
+        return None if np.isnan(value) else float(value)
+
+    def clear(self):
+        self._reset()
+        self.dirty = True
+
+    def load(self, path):
+        with np.load(path, allow_pickle=False) as snapshot:
+            nodes = json.loads(str(snapshot["nodes"]))
+            n = len(nodes["ids"])
+            capacity = INITIAL_CAPACITY
+            while capacity < n:
+                capacity *= 2
+            self._reset(capacity)
+            self.ids = nodes["ids"]
+            self.titles = nodes["titles"]
+            self.texts = nodes["texts"]
+            self.datasets = nodes.get("datasets", [DEFAULT_DATASET] * n)
+            self.row_of = {corpus_id: row for row, corpus_id in enumerate(self.ids)}
+            # JSON object keys are strings, restore the integer corpus ids
+            self.neighbors = {int(corpus_id): tuple(lists) for corpus_id, lists in nodes.get("neighbors", {}).items()}
+            self.weights[:n, :n] = snapshot["weights"]
+            self.present[:n, :n] = snapshot["present"]
+        self.dirty = False
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        n = self.size
+        nodes = json.dumps({"ids": self.ids, "titles": self.titles, "texts": self.texts,
+                            "datasets": self.datasets,
+                            "neighbors": self.neighbors})
+        # Write to a temporary file first so a crash never leaves a truncated snapshot
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, nodes=np.array(nodes),
+                            weights=self.weights[:n, :n], present=self.present[:n, :n])
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+_store = None
+_store_lock = threading.Lock()
+
+# Return the process-wide embedded graph, loading the snapshot on first use
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddedGraphStore(EMBEDDED_GRAPH_PATH)
+        return _store
+
+class EmbeddedGraphConnector(GraphConnector):
+    def __init__(self, store=None):
+        self.store = store or get_store()
+
+    def close(self):
+        with self.store.lock:
+            if self.store.dirty:
+                self.store.save()
+
+    def test_connection(self):
+        return True
+
+    def ensure_schema(self):
+        # Nodes are looked up through the id -> row dictionary, nothing to create
+        pass
+
+    def create_corpus_node(self, corpus_id, title, text, dataset=DEFAULT_DATASET):
+        with self.store.lock:
+            self.store.add_node(corpus_id, title, text, dataset)
+
+    def create_correlation_relationship(self, corpus_id1, corpus_id2, correlation):
+        with self.store.lock:
+            self.store.add_edge(corpus_id1, corpus_id2, correlation)
+
+    def max_corpus_id(self):
+        with self.store.lock:
+            return max(self.store.ids, default=None)
+
+    def query_by_title(self, title):
+        store = self.store
+        with store.lock:
+            return [{"id": store.ids[row], "title": store.titles[row], "text": store.texts[row]}
+                    for row in range(store.size) if store.titles[row] == title]
+
+    def query_all_correlations(self):
+        return list(self.stream_all_correlations())
+
+    def stream_all_correlations(self, after_id1=None, after_id2=None, page_size=None):
+        store = self.store
+        with store.lock:
+            rows1, rows2 = store.edge_rows()
+            ids = np.asarray(store.ids, dtype=np.int64)
+            if after_id1 is not None:
+                after_id2 = -1 if after_id2 is None else after_id2
+                id1, id2 = ids[rows1], ids[rows2]
+                keep = (id1 > after_id1) | ((id1 == after_id1) & (id2 > after_id2))
+                rows1, rows2 = rows1[keep], rows2[keep]
+            if page_size is not None:
+                rows1, rows2 = rows1[:page_size], rows2[:page_size]
+            records = [{
+                "id1": store.ids[row1], "title1": store.titles[row1],
+                "id2": store.ids[row2], "title2": store.titles[row2],
+                "correlation": store.correlation_at(row1, row2),
+            } for row1, row2 in zip(rows1.tolist(), rows2.tolist())]
+        yield from records
+
+    def stream_correlation_edges(self, dataset=None):
+        store = self.store
+        with store.lock:
+            rows1, rows2 = store.edge_rows()
+            if dataset is not None:
+                in_dataset = np.asarray(store.datasets, dtype=object) == dataset
+                keep = in_dataset[rows1] & in_dataset[rows2]
+                rows1, rows2 = rows1[keep], rows2[keep]
+            edges = [(store.ids[row1], store.ids[row2], store.correlation_at(row1, row2))
+                     for row1, row2 in zip(rows1.tolist(), rows2.tolist())]
+        yield from edges
+
+    def stream_corpora(self, dataset=None):
+        store = self.store
+        with store.lock:
+            corpora = sorted((corpus_id, title)
+                             for corpus_id, title, node_dataset in zip(store.ids, store.titles, store.datasets)
+                             if dataset is None or node_dataset == dataset)
+        yield from corpora
+
+    def store_neighbors(self, corpus_id, neighbor_ids, neighbor_titles, neighbor_scores):
+        with self.store.lock:
+            if corpus_id in self.store.row_of:
+                self.store.neighbors[corpus_id] = (list(neighbor_ids), list(neighbor_titles), list(neighbor_scores))
+                self.store.dirty = True
+
+    def query_neighbors(self, corpus_id, k: int):
+        store = self.store
+        with store.lock:
+            row = store.row_of.get(corpus_id)
+            if row is None:
+                return None
+            ids, titles, scores = store.neighbors.get(corpus_id, ([], [], []))
+            return {
+                "id": corpus_id,
+                "title": store.titles[row],
+                "neighbors": [{"id": other_id, "title": title, "correlation": score}
+                              for other_id, title, score in zip(ids[:k], titles[:k], scores[:k])],
+            }
+
+    def stream_neighbor_lists(self):
+        with self.store.lock:
+            lists = [(corpus_id, list(ids), list(scores))
+                     for corpus_id, (ids, _, scores) in sorted(self.store.neighbors.items())]
+        yield from lists
+
+    def query_pairwise_causal(self):
+        store = self.store
+        with store.lock:
+            if not store.neighbors:
+                # Snapshots saved before the neighbour lists were materialized only have the relationships
+                return self._pairwise_causal_from_edges()
+            return [{
+                "corpusTitle": store.titles[store.row_of[corpus_id]],
+                "highestCorrelationCorpus": titles[0],
+                "highestCorrelation": scores[0],
+            } for corpus_id, (ids, titles, scores) in sorted(store.neighbors.items())
+                if ids and corpus_id in store.row_of]
+
+    # Best correlated other corpus of every corpus, over the relationships in both directions
+    def _pairwise_causal_from_edges(self):
+        store = self.store
+        size = store.size
+        scores = store.weights[:size, :size]
+        valid = store.present[:size, :size] & np.isfinite(scores)
+        both = np.where(valid, scores, -np.inf)
+        both = np.maximum(both, both.T)
+        best = both.argmax(axis=1) if size else np.empty(0, dtype=np.int64)
+        rows = [row for row in np.argsort(store.ids, kind="stable") if np.isfinite(both[row, best[row]])]
+        return [{
+            "corpusTitle": store.titles[row],
+            "highestCorrelationCorpus": store.titles[best[row]],
+            "highestCorrelation": float(both[row, best[row]]),
+        } for row in rows]
+
+    def query_highest_correlation(self, n: int = 1):
+        store = self.store
+        with store.lock:
+            size = store.size
+            scores = store.weights[:size, :size]
+            valid = store.present[:size, :size] & np.isfinite(scores)
+            flat = np.flatnonzero(valid)
+            n = min(int(n), flat.size)
+            if n <= 0:
+                return []
+            values = scores.ravel()[flat]
+            # Partial selection of the top n, then sort only those
+            top = np.argpartition(-values, n - 1)[:n]
+            top = top[np.argsort(-values[top], kind="stable")]
+            rows1, rows2 = np.unravel_index(flat[top], (size, size))
+            return [{
+                "corpus1": store.titles[row1],
+                "corpus2": store.titles[row2],
+                "correlation": store.correlation_at(row1, row2),
+            } for row1, row2 in zip(rows1.tolist(), rows2.tolist())]
+
+    def clear_database(self):
+        with self.store.lock:
+            self.store.clear()
+        bump_graph_generation()
+
+    def clear_database_batched(self, batch_size=CLEAR_BATCH_SIZE, dataset=None):
+        # Deleting from memory is cheap, the graph is cleared in one step. The progress is only
+        # yielded after the lock is released since the generator may resume on another thread.
+        store = self.store
+        with store.lock:
+            n = store.size
+            rows = [row for row in range(n) if dataset is None or store.datasets[row] == dataset]
+            untouched = np.ones(n, dtype=bool)
+            untouched[rows] = False
+            present = store.present[:n, :n]
+            edges = int(present.sum() - present[np.ix_(untouched, untouched)].sum())
+            if dataset is None:
+                store.clear()
+            else:
+                store.remove_rows(rows)
+        bump_graph_generation()
+        yield {"stage": "edges", "deleted": edges, "total": edges}
+        yield {"stage": "nodes", "deleted": len(rows), "total": len(rows)}
+
+    def query_all_corpora(self, dataset=None):
+        store = self.store
+        with store.lock:
+            return [{"id": corpus_id, "title": title, "text": text}
+                    for corpus_id, title, text, node_dataset in zip(store.ids, store.titles, store.texts, store.datasets)
+                    if dataset is None or node_dataset == dataset]
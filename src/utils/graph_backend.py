@@ -0,0 +1,108 @@
+"""
+graph_backend.py
+This module defines the storage-backend interface shared by the graph connectors and selects
+the backend configured with the GRAPH_BACKEND environment variable.
+Backends:
+    neo4j (default): Neo4jConnector, a Neo4j server reached over bolt.
+    embedded: EmbeddedGraphConnector, an in-process graph with optional on-disk snapshots.
+Functions:
+    get_connector() -> GraphConnector: Returns a connector for the configured backend.
+"""
+from abc import ABC, abstractmethod
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+GRAPH_BACKENDS = ("neo4j", "embedded")
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j").lower()
+
+# Dataset tag given to corpus nodes when none is specified
+DEFAULT_DATASET = "default"
+
+# Number of relationships or nodes deleted per transaction when clearing the graph
+CLEAR_BATCH_SIZE = int(os.getenv("CLEAR_BATCH_SIZE", "10000"))
+
+# Node, relationship and neighbour list writes do not bump the graph generation themselves, a bump is a
+# shared store transaction and a calculation makes O(n^2) writes. Writers call bump_graph_generation()
+# once per batch of writes instead; the clear methods bump once per clear.
+class GraphConnector(ABC):
+    # Release the resources held by this connector
+    @abstractmethod
+    def close(self): ...
+
+    @abstractmethod
+    def test_connection(self): ...
+
+    # Create the constraints and indexes the queries rely on
+    @abstractmethod
+    def ensure_schema(self): ...
+
+    @abstractmethod
+    def create_corpus_node(self, corpus_id, title, text, dataset=DEFAULT_DATASET): ...
+
+    # Create the relationship, or update its correlation if it already exists
+    @abstractmethod
+    def create_correlation_relationship(self, corpus_id1, corpus_id2, correlation): ...
+
+    # Highest corpus id in the graph, or None if it is empty
+    @abstractmethod
+    def max_corpus_id(self): ...
+
+    @abstractmethod
+    def query_by_title(self, title): ...
+
+    @abstractmethod
+    def query_all_correlations(self): ...
+
+    # Yield correlation records ordered by (id1, id2), optionally after a cursor and limited to a page
+    @abstractmethod
+    def stream_all_correlations(self, after_id1=None, after_id2=None, page_size=None): ...
+
+    # Yield (id1, id2, correlation) tuples, optionally only between corpora of one dataset
+    @abstractmethod
+    def stream_correlation_edges(self, dataset=None): ...
+
+    # Yield (id, title) tuples ordered by id, optionally only of one dataset
+    @abstractmethod
+    def stream_corpora(self, dataset=None): ...
+
+    # Materialize the best-first neighbour lists of a corpus
+    @abstractmethod
+    def store_neighbors(self, corpus_id, neighbor_ids, neighbor_titles, neighbor_scores): ...
+
+    # Return the corpus with its first k materialized neighbours, or None if it does not exist
+    @abstractmethod
+    def query_neighbors(self, corpus_id, k: int): ...
+
+    # Yield (id, neighbor_ids, neighbor_scores) of every corpus with materialized neighbours
+    @abstractmethod
+    def stream_neighbor_lists(self): ...
+
+    @abstractmethod
+    def query_pairwise_causal(self): ...
+
+    @abstractmethod
+    def query_highest_correlation(self, n: int = 1): ...
+
+    @abstractmethod
+    def clear_database(self): ...
+
+    # Delete relationships and then nodes in bounded batches, optionally only those of one dataset,
+    # yielding {"stage", "deleted", "total"} progress after every batch
+    @abstractmethod
+    def clear_database_batched(self, batch_size=CLEAR_BATCH_SIZE, dataset=None): ...
+
+    @abstractmethod
+    def query_all_corpora(self, dataset=None): ...
+
+# Return a connector for the backend selected by GRAPH_BACKEND
+def get_connector() -> GraphConnector:
+    if GRAPH_BACKEND == "embedded":
+        from utils.embedded_graph import EmbeddedGraphConnector
+        return EmbeddedGraphConnector()
+    if GRAPH_BACKEND == "neo4j":
+        from utils.neo4j_connector import Neo4jConnector
+        return Neo4jConnector()
+    raise ValueError(f"Unknown GRAPH_BACKEND '{GRAPH_BACKEND}', expected one of {GRAPH_BACKENDS}")
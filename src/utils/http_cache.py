@@ -0,0 +1,65 @@
+"""
+http_cache.py
+This module serves artifact files with HTTP validation caching.
+Every response carries a strong ETag computed from the content hash of the file, a matching If-None-Match
+request is answered with 304 Not Modified and no body, and byte range requests (Range, If-Range) of large
+files are answered with 206 Partial Content by FileResponse.
+Content hashes are cached per file path, size and modification time, so an unchanged artifact is only
+hashed once per worker no matter how often it is requested.
+Functions:
+    content_etag(path, stat_result) -> str: Returns the ETag of a file from its cached content hash.
+    etag_matches(if_none_match, etag) -> bool: Weak comparison of an If-None-Match header with an ETag.
+    cached_file_response(request, path, media_type, filename) -> Optional[Response]: Returns the file as a
+        cacheable response, 304 when the client's copy is current, or None when the file does not exist.
+"""
+import hashlib
+import os
+import threading
+from fastapi.responses import FileResponse, Response
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Clients may keep a copy but must revalidate it, artifacts are replaced in place under the same URL
+ARTIFACT_CACHE_CONTROL = "no-cache"
+
+_lock = threading.Lock()
+# path -> (mtime_ns, size, etag)
+_etags = {}
+
+def content_etag(path: str, stat_result: os.stat_result) -> str:
+    signature = (stat_result.st_mtime_ns, stat_result.st_size)
+    with _lock:
+        entry = _etags.get(path)
+        if entry is not None and entry[:2] == signature:
+            return entry[2]
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    etag = f'"{digest.hexdigest()}"'
+
+    with _lock:
+        _etags[path] = (*signature, etag)
+    return etag
+
+# Weak comparison (RFC 9110): compressed responses carry the weakened W/ form of the same ETag
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+def cached_file_response(request, path: str, media_type: str, filename: str = None):
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    etag = content_etag(path, stat_result)
+    headers = {"ETag": etag, "Cache-Control": ARTIFACT_CACHE_CONTROL}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    # FileResponse keeps the ETag given here and uses it for If-Range
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers, stat_result=stat_result)
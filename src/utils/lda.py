@@ -1,39 +1,212 @@
+"""
+lda.py
+This module clusters documents into topics with Latent Dirichlet Allocation.
+The cleaned document-term matrix of a corpus is persisted as a sparse .npz matrix with its vocabulary,
+keyed by a hash of the documents, so refitting with another topic count skips cleaning and
+vectorizing. Topic models can be saved and updated online with partial_fit, folding newly ingested
+documents into the existing topics instead of retraining on the full corpus.
+Classes:
+    LDA: Fits, updates and visualizes a topic model.
+Functions:
+    cached_document_term_matrix(corpus, vocabulary) -> Tuple[str, csr_matrix, List[str]]:
+        Returns the path, matrix and vocabulary of the (cached) document-term matrix of a corpus.
+    model_state_path(n_topics, name) -> str: Returns where the incremental topic model of a corpus is saved.
+    sweep_topic_counts(corpus, topic_counts) -> Tuple[List[dict], dict]:
+        Fits several topic counts in parallel processes and returns their scores and the best fit.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import multiprocessing
+import json
+import os
 import re
+import time
 import logging
+import joblib
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse as sp
 from sklearn.decomposition import LatentDirichletAllocation
 from sklearn.feature_extraction.text import CountVectorizer
+from utils.metrics import record_cache
+from utils.shared_store import writing_artifact, LDA_PLOT_ARTIFACT
+
+# Directory holding the cached document-term matrices and the saved topic models
+LDA_CACHE_DIR = os.getenv("LDA_CACHE_DIR", "lda_cache")
+# Number of document-term matrices kept, the least recently used are pruned
+LDA_CACHE_SIZE = int(os.getenv("LDA_CACHE_SIZE", "8"))
+
+# Maximum number of processes fitting topic counts at the same time in a sweep
+LDA_SWEEP_WORKERS = int(os.getenv("LDA_SWEEP_WORKERS", str(os.cpu_count() or 1)))
+# Share of the documents held out to score the perplexity of each topic count in a sweep
+LDA_SWEEP_HOLDOUT = float(os.getenv("LDA_SWEEP_HOLDOUT", "0.1"))
+
+_NON_ALPHA = re.compile(r'[^a-z\s]')
+
+def clean_text(text):
+    # lowercasing and remove non-alphabet characters
+    return _NON_ALPHA.sub('', text.lower())
+
+def _document_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# Hash of the documents and, for a matrix over a fixed vocabulary, of that vocabulary
+def _corpus_key(corpus, vocabulary=None):
+    digest = hashlib.sha1()
+    if vocabulary is not None:
+        digest.update(json.dumps(vocabulary).encode("utf-8"))
+    for doc in corpus:
+        digest.update(doc.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _prune_matrix_cache():
+    paths = sorted((os.path.join(LDA_CACHE_DIR, name) for name in os.listdir(LDA_CACHE_DIR)
+                    if name.startswith("dtm_") and name.endswith(".npz")),
+                   key=os.path.getmtime)
+    for path in paths[:-LDA_CACHE_SIZE]:
+        for stale in (path, path[:-len(".npz")] + ".json"):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+# Return (path, matrix, vocabulary) of the document-term matrix of a corpus, cleaning and vectorizing
+# it only if it is not cached yet. A vocabulary fixes the columns, e.g. to those of a saved model.
+def cached_document_term_matrix(corpus, vocabulary=None):
+    os.makedirs(LDA_CACHE_DIR, exist_ok=True)
+    key = _corpus_key(corpus, vocabulary)
+    matrix_path = os.path.join(LDA_CACHE_DIR, f"dtm_{key}.npz")
+    vocabulary_path = os.path.join(LDA_CACHE_DIR, f"dtm_{key}.json")
+    hit = os.path.exists(matrix_path) and os.path.exists(vocabulary_path)
+    record_cache("lda_matrix", hit)
+    if hit:
+        # Touch the entry so pruning drops the least recently used matrices
+        os.utime(matrix_path)
+        with open(vocabulary_path) as f:
+            return matrix_path, sp.load_npz(matrix_path).tocsr(), json.load(f)
+
+    vectorizer = CountVectorizer(stop_words='english', vocabulary=vocabulary)
+    matrix = vectorizer.fit_transform([clean_text(doc) for doc in corpus]).tocsr()
+    vocabulary = vectorizer.get_feature_names_out().tolist()
+
+    # Write to private files first so concurrent runs never load a partial entry
+    suffix = f"{os.getpid()}.tmp"
+    with open(f"{vocabulary_path}.{suffix}", "w") as f:
+        json.dump(vocabulary, f)
+    os.replace(f"{vocabulary_path}.{suffix}", vocabulary_path)
+    sp.save_npz(f"{matrix_path}.{suffix}.npz", matrix)
+    os.replace(f"{matrix_path}.{suffix}.npz", matrix_path)
+    _prune_matrix_cache()
+    return matrix_path, matrix, vocabulary
+
+# Where the incremental topic model with n_topics topics of a named corpus (e.g. a dataset) is saved
+def model_state_path(n_topics, name=None):
+    tag = hashlib.sha1(str(name).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(LDA_CACHE_DIR, f"lda_model_{n_topics}_{tag}.joblib")
+
+# Split the rows of the matrix into training and held-out rows; tiny corpora are scored on the training rows
+def _holdout_split(n_docs, random_state):
+    n_holdout = int(n_docs * LDA_SWEEP_HOLDOUT)
+    if n_holdout < 1 or n_docs - n_holdout < 2:
+        rows = np.arange(n_docs)
+        return rows, rows
+    rows = np.random.default_rng(random_state).permutation(n_docs)
+    return np.sort(rows[n_holdout:]), np.sort(rows[:n_holdout])
+
+# Fit one topic count on the cached matrix at matrix_path; runs in a sweep worker process, which
+# loads the shared matrix from disk instead of receiving a pickled copy
+def _fit_topic_count(matrix_path, n_topics, max_iter, random_state):
+    matrix = sp.load_npz(matrix_path).tocsr()
+    train_rows, holdout_rows = _holdout_split(matrix.shape[0], random_state)
+    start = time.perf_counter()
+    model = LatentDirichletAllocation(n_components=n_topics, max_iter=max_iter, random_state=random_state)
+    model.fit(matrix[train_rows])
+    fit_time = time.perf_counter() - start
+    return {"n_topics": n_topics, "perplexity": float(model.perplexity(matrix[holdout_rows])),
+            "fit_time": fit_time}, model
+
+# Fit every topic count concurrently in a process pool sharing one cached document-term matrix.
+# Returns the per-count scores (held-out perplexity, lower is better, and fit time in seconds) and the
+# best fit as {"n_topics", "model", "vocabulary", "matrix", "train_rows"}, where train_rows are the rows
+# of the corpus the models were fitted on.
+def sweep_topic_counts(corpus, topic_counts, max_iter=10, random_state=42, max_workers=LDA_SWEEP_WORKERS):
+    matrix_path, matrix, vocabulary = cached_document_term_matrix(corpus)
+    # Spawned workers do not inherit the locks of the server's threads, which forked ones could
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, min(len(topic_counts), max_workers)), mp_context=context) as pool:
+        futures = [pool.submit(_fit_topic_count, matrix_path, n_topics, max_iter, random_state)
+                   for n_topics in topic_counts]
+        fits = [future.result() for future in futures]
+    scores = [score for score, _ in fits]
+    best_score, best_model = min(fits, key=lambda fit: fit[0]["perplexity"])
+    # Every worker splits the rows the same way
+    train_rows, _ = _holdout_split(matrix.shape[0], random_state)
+    return scores, {"n_topics": best_score["n_topics"], "model": best_model,
+                    "vocabulary": vocabulary, "matrix": matrix, "train_rows": train_rows}
 
 class LDA:
     def __init__(self, n_topics=5, max_iter=10, random_state=42):
         self.n_topics = n_topics
         self.max_iter = max_iter
         self.random_state = random_state
-        self.vectorizer = CountVectorizer(stop_words='english')
+        self.vocabulary = None
         self.model = LatentDirichletAllocation(n_components=n_topics,
                                                max_iter=max_iter,
                                                random_state=random_state)
         self.logger = logging.getLogger(__name__)
 
     def clean_text(self, text):
-        # lowercasing and remove non-alphabet characters
-        text = text.lower()
-        text = re.sub(r'[^a-z\s]', '', text)
-        return text
+        return clean_text(text)
 
     def fit_transform(self, corpus):
-        # Clean the corpus
-        cleaned_corpus = [self.clean_text(doc) for doc in corpus]
-        # Convert texts to document-term matrix
-        dt_matrix = self.vectorizer.fit_transform(cleaned_corpus)
+        # Reuse the cleaned document-term matrix of an earlier run on the same corpus
+        _, dt_matrix, self.vocabulary = cached_document_term_matrix(corpus)
         # Compute topic distributions using LDA
         topic_distribution = self.model.fit_transform(dt_matrix)
         # Assign each document to the topic with highest probability
         clusters = np.argmax(topic_distribution, axis=1)
         return clusters, topic_distribution
 
-    def visualize_clusters(self, ids, clusters, output_path="lda_clusters.png"):
+    # Fold the documents the model saved at model_path has not seen into it with an online update
+    # (fitting and saving a new model on the full corpus if there is none) and return the topic
+    # assignments of every document. Documents are recognised by content, since corpus ids are
+    # reused across uploads; words outside the saved model's vocabulary are ignored.
+    def partial_fit_transform(self, corpus, model_path):
+        state = joblib.load(model_path) if os.path.exists(model_path) else None
+        if state is None or state["model"].n_components != self.n_topics:
+            clusters, topic_distribution = self.fit_transform(corpus)
+            seen, trained = set(), corpus
+        else:
+            self.model, self.vocabulary, seen = state["model"], state["vocabulary"], state["documents"]
+            _, dt_matrix, _ = cached_document_term_matrix(corpus, self.vocabulary)
+            new_rows = [row for row, doc in enumerate(corpus) if _document_hash(doc) not in seen]
+            trained = [corpus[row] for row in new_rows]
+            if new_rows:
+                # Weight the online update by the size of the whole corpus
+                self.model.set_params(total_samples=max(len(corpus), len(seen) + len(new_rows)))
+                self.model.partial_fit(dt_matrix[new_rows])
+                self.logger.info(f"Folded {len(new_rows)} new documents into the LDA model.")
+            topic_distribution = self.model.transform(dt_matrix)
+            clusters = np.argmax(topic_distribution, axis=1)
+
+        self.save_state(model_path, trained, seen)
+        return clusters, topic_distribution
+
+    # Save the model and vocabulary for partial_fit_transform with the hashes of the documents it was
+    # trained on: those of corpus and the earlier seen ones. Documents the model was not fitted on, such
+    # as the held-out documents of a sweep, must not be passed, or later updates would skip them.
+    def save_state(self, model_path, corpus, seen=None):
+        seen = set(seen or ())
+        seen.update(_document_hash(doc) for doc in corpus)
+        os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+        tmp_path = f"{model_path}.{os.getpid()}.tmp"
+        joblib.dump({"model": self.model, "vocabulary": self.vocabulary, "documents": seen}, tmp_path)
+        os.replace(tmp_path, model_path)
+
+    # Plot the topic of every document to output_path, by default the LDA plot artifact. The legend
+    # labels the corpus ids with the titles stored on their corpus nodes.
+    def visualize_clusters(self, ids, clusters, titles=None, output_path=None):
         # Create a figure with two subplots in 70:30 ratio
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7), gridspec_kw={'width_ratios': [7, 3]})
         
@@ -43,10 +216,8 @@ class LDA:
         ax1.set_ylabel("Topic Cluster")
         ax1.set_title("LDA Topic Clustering")
         
-        # Get titles from printed_data.csv
-        import pandas as pd
-        df = pd.read_csv("printed_data.csv")
-        id_title = dict(enumerate(df["Title"].tolist()))
+        # Corpus ids are not row positions of the uploaded CSV, so the titles come with the ids
+        id_title = dict(zip(ids, titles)) if titles is not None else {}
         
         # Create legend handles on the right
         handles = [plt.Line2D([0], [0], marker='o', color='w', 
@@ -60,12 +231,16 @@ class LDA:
         ax2.axis('off')
         
         plt.tight_layout()
-        plt.savefig(output_path)
+        if output_path is not None:
+            plt.savefig(output_path)
+        else:
+            with writing_artifact(LDA_PLOT_ARTIFACT) as tmp_path:
+                plt.savefig(tmp_path)
         plt.close()
 
-    def run(self, corpus, ids):
+    def run(self, corpus, ids, titles=None):
         clusters, _ = self.fit_transform(corpus)
-        self.visualize_clusters(ids, clusters)
+        self.visualize_clusters(ids, clusters, titles)
         self.logger.info("LDA clustering completed.")
         # Return a mapping from document id to its cluster label
         return dict(zip(ids, clusters))
@@ -0,0 +1,92 @@
+"""
+metrics.py
+This module defines the Prometheus metrics of the API and the pipeline: latency histograms of the fetch,
+parse, summarize, compare and Neo4j write stages and of the clustering runs, gauges of in-flight fetches
+and queue depths, cache hit and miss counters, and per-endpoint request latency.
+Histogram counts double as throughput (rate of observations per stage). The metrics are exposed in the
+Prometheus text format by the /metrics endpoint.
+Every uvicorn worker process has its own metrics, so with several workers a scrape would only show the
+worker that answered it. When PROMETHEUS_MULTIPROC_DIR names an empty directory, every worker writes its
+metrics to files there and /metrics aggregates the files of all workers.
+Classes:
+    MetricsMiddleware: Records the latency of every request by method, route template and status.
+Functions:
+    render_metrics() -> Tuple[bytes, str]: Returns the exposition of every metric and its content type.
+    mark_worker_stopped(): Drops the live gauges of this worker from the aggregated metrics.
+"""
+import os
+import time
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+
+# Set before the workers start (and emptied between runs) to aggregate the metrics of several workers
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Buckets from 1 ms to 10 minutes, covering single comparisons as well as whole clustering runs
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Latency of one call of a pipeline stage",
+                          ["stage"], buckets=LATENCY_BUCKETS)
+# Children bound once, the stage timers run in the hot loops of the pipeline
+FETCH_SECONDS = STAGE_SECONDS.labels("fetch")
+PARSE_SECONDS = STAGE_SECONDS.labels("parse")
+SUMMARIZE_SECONDS = STAGE_SECONDS.labels("summarize")
+COMPARE_SECONDS = STAGE_SECONDS.labels("compare")
+
+NEO4J_WRITE_SECONDS = Histogram("neo4j_write_seconds", "Latency of one Neo4j write transaction",
+                                ["operation"], buckets=LATENCY_BUCKETS)
+
+CLUSTERING_SECONDS = Histogram("clustering_seconds", "Duration of one clustering run",
+                               ["method"], buckets=LATENCY_BUCKETS)
+
+# Gauges are summed over the running workers when the metrics of several workers are aggregated
+IN_FLIGHT_FETCHES = Gauge("in_flight_fetches", "URLs currently being fetched", multiprocess_mode="livesum")
+UPLOAD_PENDING_URLS = Gauge("upload_pending_urls", "URLs of running uploads that are not processed yet",
+                            multiprocess_mode="livesum")
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Background jobs waiting for a worker", multiprocess_mode="livesum")
+
+# Hit rate of a cache: rate(cache_requests_total{result="hit"}) / rate(cache_requests_total)
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+
+REQUEST_SECONDS = Histogram("http_request_seconds", "Latency of API requests until the response is sent",
+                            ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def render_metrics():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+# Called when a worker shuts down, so the live gauges no longer count its last values
+def mark_worker_stopped():
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Label by the route template (e.g. /neighbors/{corpus_id}) so ids do not create new series
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(time.perf_counter() - start)
@@ -0,0 +1,39 @@
+"""
+neighbors.py
+This module keeps the top-k most correlated neighbours of every corpus while correlations are written.
+Each corpus has a bounded min-heap of (score, neighbour id), so adding a correlation is O(log k) and
+the final lists can be materialized on the corpus nodes instead of being recomputed by sorting every
+relationship in the graph at query time.
+Classes:
+    TopKNeighbors: Accumulates correlations and returns the k best neighbours per corpus.
+"""
+from collections import defaultdict
+import heapq
+import math
+import os
+
+# Number of neighbours materialized per corpus
+NEIGHBOR_TOP_K = int(os.getenv("NEIGHBOR_TOP_K", "10"))
+
+class TopKNeighbors:
+    def __init__(self, k: int = NEIGHBOR_TOP_K):
+        self.k = k
+        self._heaps = defaultdict(list)
+
+    def _push(self, corpus_id, other_id, score):
+        heap = self._heaps[corpus_id]
+        if len(heap) < self.k:
+            heapq.heappush(heap, (score, other_id))
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, (score, other_id))
+
+    # Record an (undirected) correlation, missing and non-finite scores are ignored
+    def add(self, corpus_id1, corpus_id2, correlation):
+        if correlation is None or not math.isfinite(correlation):
+            return
+        self._push(corpus_id1, corpus_id2, correlation)
+        self._push(corpus_id2, corpus_id1, correlation)
+
+    # Return the (neighbour id, score) pairs of a corpus, best first
+    def top(self, corpus_id):
+        return [(other_id, score) for score, other_id in sorted(self._heaps.get(corpus_id, ()), reverse=True)]
@@ -1,11 +1,33 @@
 from neo4j import GraphDatabase
 import os
 from dotenv import load_dotenv
+from utils.graph_backend import GraphConnector, DEFAULT_DATASET, CLEAR_BATCH_SIZE
+from utils.query_cache import bump_graph_generation
+from utils.metrics import NEO4J_WRITE_SECONDS
 
 # Load environment variables from .env file
 load_dotenv()
 
-class Neo4jConnector:
+# Seconds to wait for the schema indexes to come online before bulk writes
+SCHEMA_AWAIT_TIMEOUT = int(os.getenv("NEO4J_SCHEMA_AWAIT_TIMEOUT", "300"))
+
+# Constraints and indexes backing the corpus lookups. Corpus.id is matched on every
+# relationship write, Corpus.title by title queries and CORRELATED.correlation by ORDER BY.
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT corpus_id_unique IF NOT EXISTS "
+    "FOR (c:Corpus) REQUIRE c.id IS UNIQUE",
+    "CREATE INDEX corpus_title_index IF NOT EXISTS "
+    "FOR (c:Corpus) ON (c.title)",
+    "CREATE INDEX corpus_dataset_index IF NOT EXISTS "
+    "FOR (c:Corpus) ON (c.dataset)",
+    "CREATE INDEX correlated_correlation_index IF NOT EXISTS "
+    "FOR ()-[r:CORRELATED]-() ON (r.correlation)",
+]
+
+class Neo4jConnector(GraphConnector):
+    # Set once the schema has been created and verified online in this process
+    _schema_ready = False
+
     def __init__(self):
         uri = os.getenv("NEO4J_URI")
         user = os.getenv("NEO4J_USER")
@@ -15,19 +37,40 @@ class Neo4jConnector:
     def close(self):
         self.driver.close()
 
+    def ensure_schema(self, timeout: int = SCHEMA_AWAIT_TIMEOUT):
+        # Create the constraints and indexes (idempotent) and block until they are online
+        if Neo4jConnector._schema_ready:
+            return
+        with self.driver.session() as session:
+            # Schema commands cannot share a transaction with data writes, run them auto-commit
+            for statement in SCHEMA_STATEMENTS:
+                session.run(statement).consume()
+            session.run("CALL db.awaitIndexes($timeout)", timeout=int(timeout)).consume()
+            offline = session.run(
+                "SHOW INDEXES YIELD name, state WHERE state <> 'ONLINE' RETURN name, state"
+            ).data()
+        if offline:
+            raise RuntimeError(f"Neo4j indexes are not online: {offline}")
+        Neo4jConnector._schema_ready = True
+
     def test_connection(self):
         with self.driver.session() as session:
             result = session.run("RETURN 1")
             return result.single()[0] == 1
 
-    def create_corpus_node(self, corpus_id, title, text):
-        with self.driver.session() as session:
-            session.execute_write(self._create_and_return_corpus, corpus_id, title, text)
+    def create_corpus_node(self, corpus_id, title, text, dataset=DEFAULT_DATASET):
+        with self.driver.session() as session, NEO4J_WRITE_SECONDS.labels("create_corpus").time():
+            session.execute_write(self._create_and_return_corpus, corpus_id, title, text, dataset)
 
     def create_correlation_relationship(self, corpus_id1, corpus_id2, correlation):
-        with self.driver.session() as session:
+        with self.driver.session() as session, NEO4J_WRITE_SECONDS.labels("create_correlation").time():
             session.execute_write(self._create_and_return_relationship, corpus_id1, corpus_id2, correlation)
 
+    def max_corpus_id(self):
+        with self.driver.session() as session:
+            # Answered from the unique id constraint's index
+            return session.run("MATCH (c:Corpus) RETURN max(c.id) AS max_id").single()["max_id"]
+
     def query_by_title(self, title):
         with self.driver.session() as session:
             result = session.execute_read(self._query_by_title, title)
@@ -38,9 +81,65 @@ class Neo4jConnector:
             result = session.execute_read(self._query_all_correlations)
             return result
         
+    def stream_all_correlations(self, after_id1=None, after_id2=None, page_size=None):
+        # Yield correlation records straight off the result cursor, ordered by (id1, id2)
+        # so that the last record of a page is the cursor for the next one
+        with self.driver.session() as session:
+            result = session.run(
+                self._stream_all_correlations_query(after_id1 is not None, page_size is not None),
+                after_id1=after_id1, after_id2=after_id2 if after_id2 is not None else -1,
+                page_size=page_size,
+            )
+            for record in result:
+                yield record.data()
+
+    def stream_correlation_edges(self, dataset=None):
+        # Yield (id1, id2, correlation) tuples without titles for bulk consumers
+        with self.driver.session() as session:
+            result = session.run(
+                "MATCH (c1:Corpus)-[r:CORRELATED]->(c2:Corpus) "
+                "WHERE $dataset IS NULL OR (c1.dataset = $dataset AND c2.dataset = $dataset) "
+                "RETURN c1.id AS id1, c2.id AS id2, r.correlation AS correlation",
+                dataset=dataset
+            )
+            for record in result:
+                yield record["id1"], record["id2"], record["correlation"]
+
+    def stream_corpora(self, dataset=None):
+        # Yield (id, title) tuples of every corpus node
+        with self.driver.session() as session:
+            result = session.run(
+                "MATCH (c:Corpus) WHERE $dataset IS NULL OR c.dataset = $dataset "
+                "RETURN c.id AS id, c.title AS title ORDER BY id",
+                dataset=dataset
+            )
+            for record in result:
+                yield record["id"], record["title"]
+
+    def store_neighbors(self, corpus_id, neighbor_ids, neighbor_titles, neighbor_scores):
+        with self.driver.session() as session, NEO4J_WRITE_SECONDS.labels("store_neighbors").time():
+            session.execute_write(self._store_neighbors, corpus_id, neighbor_ids, neighbor_titles, neighbor_scores)
+
+    def query_neighbors(self, corpus_id, k: int):
+        with self.driver.session() as session:
+            return session.execute_read(self._query_neighbors, corpus_id, int(k))
+
+    def stream_neighbor_lists(self):
+        with self.driver.session() as session:
+            result = session.run(
+                "MATCH (c:Corpus) WHERE c.neighbor_ids IS NOT NULL "
+                "RETURN c.id AS id, c.neighbor_ids AS ids, c.neighbor_scores AS scores"
+            )
+            for record in result:
+                yield record["id"], record["ids"], record["scores"]
+
     def query_pairwise_causal(self):
         with self.driver.session() as session:
-            return session.execute_read(self._query_pairwise_causal)
+            result = session.execute_read(self._query_pairwise_causal)
+            if not result:
+                # Graphs calculated before the neighbour lists were materialized only have the relationships
+                result = session.execute_read(self._query_pairwise_causal_from_edges)
+            return result
 
     def query_highest_correlation(self, n: int = 1):
         with self.driver.session() as session:
@@ -48,21 +147,44 @@ class Neo4jConnector:
             return result
 
     def clear_database(self):
-        with self.driver.session() as session:
-            session.execute_write(self._clear_database)
+        # A single DETACH DELETE can exceed the transaction memory limit on large graphs
+        for _ in self.clear_database_batched():
+            pass
 
-    def query_all_corpora(self):
+    def clear_database_batched(self, batch_size=CLEAR_BATCH_SIZE, dataset=None):
+        try:
+            with self.driver.session() as session:
+                for stage in ("edges", "nodes"):
+                    total = session.execute_read(self._count_for_clear, stage, dataset)
+                    deleted = 0
+                    yield {"stage": stage, "deleted": deleted, "total": total}
+                    while True:
+                        # Every batch is its own transaction so memory use stays bounded
+                        with NEO4J_WRITE_SECONDS.labels("clear_batch").time():
+                            count = session.execute_write(self._clear_batch, stage, dataset, int(batch_size))
+                        if count == 0:
+                            break
+                        deleted += count
+                        yield {"stage": stage, "deleted": deleted, "total": max(total, deleted)}
+        finally:
+            # Once for the whole clear, also when it stops midway
+            bump_graph_generation()
+
+    def query_all_corpora(self, dataset=None):
         with self.driver.session() as session:
-            result = session.execute_read(self._query_all_corpora)
+            result = session.execute_read(self._query_all_corpora, dataset)
             return result
 
     @staticmethod
-    def _create_and_return_corpus(tx, corpus_id, title, text):
+    def _create_and_return_corpus(tx, corpus_id, title, text, dataset):
+        # Corpus ids are unique across datasets (see store_correlation_scores_stream), MERGE on the id so
+        # re-running a calculation updates instead of violating the constraint
         query = (
-            "CREATE (c:Corpus {id: $corpus_id, title: $title, text: $text}) "
+            "MERGE (c:Corpus {id: $corpus_id}) "
+            "SET c.title = $title, c.text = $text, c.dataset = $dataset "
             "RETURN c"
         )
-        result = tx.run(query, corpus_id=corpus_id, title=title, text=text)
+        result = tx.run(query, corpus_id=corpus_id, title=title, text=text, dataset=dataset)
         return result.single()
 
     @staticmethod
@@ -70,6 +192,8 @@ class Neo4jConnector:
         query = (
             "MATCH (c1:Corpus {id: $corpus_id1}) "
             "MATCH (c2:Corpus {id: $corpus_id2}) "
+            # The dataset is cleared before it is recalculated, so no relationship between its corpora
+            # exists yet and CREATE skips MERGE's scan of the relationships of c1
             "CREATE (c1)-[r:CORRELATED {correlation: $correlation}]->(c2) "
             "RETURN r"
         )
@@ -83,12 +207,13 @@ class Neo4jConnector:
 
     @staticmethod
     def _query_by_title(tx, title):
+        # Plain properties instead of the node, which the orjson responses cannot serialize
         query = (
             "MATCH (c:Corpus {title: $title}) "
-            "RETURN c"
+            "RETURN c.id AS id, c.title AS title, c.text AS text"
         )
         result = tx.run(query, title=title)
-        return [record["c"] for record in result]
+        return [{"id": record["id"], "title": record["title"], "text": record["text"]} for record in result]
 
     @staticmethod
     def _query_all_correlations(tx):
@@ -99,13 +224,70 @@ class Neo4jConnector:
         result = tx.run(query)
         return [record.data() for record in result]
 
+    @staticmethod
+    def _stream_all_correlations_query(has_cursor: bool, has_limit: bool):
+        query = "MATCH (c1:Corpus)-[r:CORRELATED]->(c2:Corpus) "
+        if has_cursor:
+            query += (
+                "WHERE c1.id > $after_id1 OR (c1.id = $after_id1 AND c2.id > $after_id2) "
+            )
+        query += (
+            "RETURN c1.id AS id1, c1.title AS title1, c2.id AS id2, c2.title AS title2, r.correlation AS correlation "
+            "ORDER BY id1, id2"
+        )
+        if has_limit:
+            query += " LIMIT $page_size"
+        return query
+
+    @staticmethod
+    def _store_neighbors(tx, corpus_id, neighbor_ids, neighbor_titles, neighbor_scores):
+        query = (
+            "MATCH (c:Corpus {id: $corpus_id}) "
+            "SET c.neighbor_ids = $neighbor_ids, c.neighbor_titles = $neighbor_titles, "
+            "c.neighbor_scores = $neighbor_scores"
+        )
+        tx.run(query, corpus_id=corpus_id, neighbor_ids=neighbor_ids,
+               neighbor_titles=neighbor_titles, neighbor_scores=neighbor_scores)
+
+    @staticmethod
+    def _query_neighbors(tx, corpus_id, k: int):
+        query = (
+            "MATCH (c:Corpus {id: $corpus_id}) "
+            "RETURN c.id AS id, c.title AS title, coalesce(c.neighbor_ids, [])[..$k] AS ids, "
+            "coalesce(c.neighbor_titles, [])[..$k] AS titles, coalesce(c.neighbor_scores, [])[..$k] AS scores"
+        )
+        record = tx.run(query, corpus_id=corpus_id, k=k).single()
+        if record is None:
+            return None
+        return {
+            "id": record["id"],
+            "title": record["title"],
+            "neighbors": [{"id": other_id, "title": title, "correlation": score}
+                          for other_id, title, score in zip(record["ids"], record["titles"], record["scores"])],
+        }
+
     @staticmethod
     def _query_pairwise_causal(tx):
+        # Reads the head of the materialized neighbour lists instead of sorting every relationship
         query = (
-            "MATCH (c:Corpus)-[r:CORRELATED]->(other:Corpus) " 
-            "WITH c, r, other ORDER BY r.correlation DESC " 
-            "WITH c, head(collect({otherTitle: other.title, correlation: r.correlation})) AS bestRel " 
-            "RETURN c.title AS corpusTitle, bestRel.otherTitle AS highestCorrelationCorpus, bestRel.correlation AS highestCorrelation"
+            "MATCH (c:Corpus) WHERE size(c.neighbor_ids) > 0 "
+            "RETURN c.title AS corpusTitle, c.neighbor_titles[0] AS highestCorrelationCorpus, "
+            "c.neighbor_scores[0] AS highestCorrelation "
+            "ORDER BY c.id"
+        )
+        result = tx.run(query)
+        return [record.data() for record in result]
+
+    @staticmethod
+    def _query_pairwise_causal_from_edges(tx):
+        # Both directions, like the neighbour lists
+        query = (
+            "MATCH (c:Corpus)-[r:CORRELATED]-(other:Corpus) "
+            "WITH c, r, other ORDER BY r.correlation DESC "
+            "WITH c, head(collect({otherTitle: other.title, correlation: r.correlation})) AS bestRel "
+            "RETURN c.title AS corpusTitle, bestRel.otherTitle AS highestCorrelationCorpus, "
+            "bestRel.correlation AS highestCorrelation "
+            "ORDER BY c.id"
         )
         result = tx.run(query)
         return [record.data() for record in result]
@@ -121,16 +303,40 @@ class Neo4jConnector:
         result = tx.run(query, n=n)
         return [record.data() for record in result]
 
+    # Queries matching the relationships or nodes to clear, scoped to a dataset when one is given
+    @staticmethod
+    def _clear_match(stage, dataset):
+        # A directed pattern matches every relationship once, so no DISTINCT (which would hold all of them in
+        # memory) is needed. Relationships only connect corpora of the same dataset, so matching them from
+        # their start node finds all of a dataset's; DETACH DELETE in the nodes stage catches any other.
+        if stage == "edges":
+            if dataset is None:
+                return "MATCH ()-[r]->() WITH r AS item "
+            return "MATCH (:Corpus {dataset: $dataset})-[r]->() WITH r AS item "
+        if dataset is None:
+            return "MATCH (n) WITH n AS item "
+        return "MATCH (n:Corpus {dataset: $dataset}) WITH n AS item "
+
+    @staticmethod
+    def _count_for_clear(tx, stage, dataset):
+        query = Neo4jConnector._clear_match(stage, dataset) + "RETURN count(item) AS total"
+        return tx.run(query, dataset=dataset).single()["total"]
+
     @staticmethod
-    def _clear_database(tx):
-        query = "MATCH (n) DETACH DELETE n"
-        tx.run(query)
+    def _clear_batch(tx, stage, dataset, batch_size):
+        # Relationships are already gone by the nodes stage, DETACH only guards against concurrent writes
+        delete = "DELETE item" if stage == "edges" else "DETACH DELETE item"
+        query = (
+            Neo4jConnector._clear_match(stage, dataset) +
+            f"LIMIT $batch_size {delete} RETURN count(*) AS deleted"
+        )
+        return tx.run(query, dataset=dataset, batch_size=batch_size).single()["deleted"]
 
     @staticmethod
-    def _query_all_corpora(tx):
+    def _query_all_corpora(tx, dataset=None):
         query = (
-            "MATCH (c:Corpus) "
+            "MATCH (c:Corpus) WHERE $dataset IS NULL OR c.dataset = $dataset "
             "RETURN c.id AS id, c.title AS title, c.text AS text"
         )
-        result = tx.run(query)
+        result = tx.run(query, dataset=dataset)
         return [record.data() for record in result]
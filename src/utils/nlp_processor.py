@@ -81,8 +81,8 @@ def compare_corpora(corpus1, corpus2) -> float:
     if not isinstance(corpus2, str):
         corpus2 = str(corpus2)
 
-    logging.info(f"Comparing corpora: {corpus1[:100]}... and {corpus2[:100]}...")
-    logging.info(f"Type of corpus1: {type(corpus1)}, Type of corpus2: {type(corpus2)}")
+    # Called once per pair, so only format the message when debug logging is enabled
+    logging.debug("Comparing corpora: %.100s... and %.100s...", corpus1, corpus2)
 
     # Write the corpora to temporary files to ensure compatibility with the corpus similarity module
     with tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as temp1, tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as temp2:
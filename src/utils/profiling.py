@@ -0,0 +1,188 @@
+"""
+profiling.py
+This module provides opt-in cProfile profiling of single requests.
+Profiling is only installed when PROFILING_ENABLED is set, so unprofiled deployments pay nothing. A request is
+profiled when it sends the X-Profile: 1 header or the profile=1 query flag (and, if PROFILING_TOKEN is set, the
+matching X-Profile-Token header). The profiler runs around the endpoint call and around every step of a
+streaming response body, in whichever thread executes it, and the stats are saved as a .pstats file named
+after the profile id returned in the X-Profile-Id response header.
+Classes:
+    ProfilingMiddleware: Starts a profile session for requests that ask for one.
+    ProfilingRoute: API route profiling the endpoint call of a profiled request.
+    StreamingResponse: Streaming response profiling each step of its body iterator in a profiled request.
+Functions:
+    profile_path(profile_id) -> Optional[str]: Returns the path of a saved profile, or None.
+    profile_summary(profile_id, limit) -> Optional[str]: Returns the top functions of a saved profile as text.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import cProfile
+import functools
+import hmac
+import inspect
+import io
+import os
+import pstats
+import re
+import uuid
+import logging
+from fastapi.routing import APIRoute
+from fastapi.responses import StreamingResponse as _StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# When set, only requests sending this value in X-Profile-Token are profiled or may download profiles
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Number of saved profiles kept, the oldest are pruned
+PROFILE_RETENTION = int(os.getenv("PROFILE_RETENTION", "50"))
+
+_PROFILE_ID = re.compile(r"[0-9a-f]{32}")
+
+class _ProfileSession:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.profiler = cProfile.Profile()
+
+    # Profile the calling thread for the duration of the block
+    @contextmanager
+    def active(self):
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiler is active in this thread (e.g. a nested request), run unprofiled
+            yield
+            return
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+
+    def save(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{self.id}.pstats")
+        tmp_path = f"{path}.tmp"
+        self.profiler.dump_stats(tmp_path)
+        os.replace(tmp_path, path)
+        _prune_profiles()
+        return path
+
+_session = ContextVar("profile_session", default=None)
+
+def _prune_profiles():
+    paths = sorted((os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR)
+                    if name.endswith(".pstats")), key=os.path.getmtime)
+    for path in paths[:-PROFILE_RETENTION]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def token_allowed(headers) -> bool:
+    if not PROFILING_TOKEN:
+        return True
+    return hmac.compare_digest(headers.get("x-profile-token", ""), PROFILING_TOKEN)
+
+def _wants_profile(scope) -> bool:
+    headers = Headers(scope=scope)
+    requested = (headers.get("x-profile", "").lower() in ("1", "true")
+                 or QueryParams(scope.get("query_string", b"")).get("profile") in ("1", "true"))
+    return requested and token_allowed(headers)
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        session = _ProfileSession()
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Id"] = session.id
+            await send(message)
+
+        token = _session.set(session)
+        try:
+            # Returns once the whole response, including a streamed body, has been sent
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _session.reset(token)
+            path = session.save()
+            logger.info(f"Saved profile of {scope['method']} {scope['path']} to {path}")
+
+# Wrap an endpoint so a profiled request enables its profiler in the thread running the endpoint
+def _profiled_call(call):
+    if inspect.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def profiled(*args, **kwargs):
+            session = _session.get()
+            if session is None:
+                return await call(*args, **kwargs)
+            # Other tasks running on the event loop while this one awaits are included as well
+            with session.active():
+                return await call(*args, **kwargs)
+    else:
+        @functools.wraps(call)
+        def profiled(*args, **kwargs):
+            session = _session.get()
+            if session is None:
+                return call(*args, **kwargs)
+            with session.active():
+                return call(*args, **kwargs)
+    return profiled
+
+class ProfilingRoute(APIRoute):
+    def get_route_handler(self):
+        self.dependant.call = _profiled_call(self.dependant.call)
+        return super().get_route_handler()
+
+def _profiled_iterator(iterator, session):
+    iterator = iter(iterator)
+    while True:
+        # Starlette runs every step in a worker thread, possibly a different one each time
+        with session.active():
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+async def _profiled_async_iterator(iterator, session):
+    iterator = iterator.__aiter__()
+    while True:
+        with session.active():
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+        yield item
+
+class StreamingResponse(_StreamingResponse):
+    def __init__(self, content, *args, **kwargs):
+        session = _session.get()
+        if session is not None:
+            if hasattr(content, "__aiter__"):
+                content = _profiled_async_iterator(content, session)
+            else:
+                content = _profiled_iterator(content, session)
+        super().__init__(content, *args, **kwargs)
+
+def profile_path(profile_id: str):
+    if not _PROFILE_ID.fullmatch(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.pstats")
+    return path if os.path.exists(path) else None
+
+def profile_summary(profile_id: str, limit: int = 50):
+    path = profile_path(profile_id)
+    if path is None:
+        return None
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
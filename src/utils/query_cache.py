@@ -0,0 +1,65 @@
+"""
+query_cache.py
+This module provides an in-process LRU cache for graph query results.
+Every cached entry is tagged with the graph generation it was computed at. The generation
+is bumped whenever correlations are written or the database is cleared, so a cached result
+is only ever served while the graph it was read from is unchanged. The generation counter lives in the
+shared store, so a write through one API worker invalidates the cached results of every worker.
+Functions:
+    graph_generation() -> int: Returns the current graph generation.
+    bump_graph_generation() -> int: Marks the graph as changed and returns the new generation.
+    cached_query(name, func, *args): Returns the cached result of func(*args), computing it on a miss.
+    clear_query_cache(): Drops every cached result.
+"""
+from collections import OrderedDict
+import os
+import threading
+from utils.metrics import record_cache
+from utils.shared_store import get_store
+
+# Maximum number of query results kept in memory
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "128"))
+
+GENERATION_KEY = "graph_generation"
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+def graph_generation():
+    return get_store().counter(GENERATION_KEY)
+
+def bump_graph_generation():
+    generation = get_store().incr(GENERATION_KEY)
+    with _lock:
+        # Entries of older generations can never be served again
+        _cache.clear()
+    return generation
+
+def cached_query(name, func, *args):
+    if QUERY_CACHE_SIZE <= 0:
+        return func(*args)
+    generation = graph_generation()
+    key = (name, args)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == generation:
+            _cache.move_to_end(key)
+            record_cache("query", True)
+            return entry[1]
+    record_cache("query", False)
+
+    result = func(*args)
+
+    # Only cache the result if no write happened while it was being computed
+    unchanged = generation == graph_generation()
+    with _lock:
+        if unchanged:
+            _cache[key] = (generation, result)
+            _cache.move_to_end(key)
+            while len(_cache) > QUERY_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return result
+
+def clear_query_cache():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,172 @@
+"""
+responses.py
+This module provides the fast response path of the API: an orjson-based JSON response class and an ASGI
+middleware compressing response bodies with the best encoding the client accepts (brotli when the optional
+brotli package is installed, otherwise gzip).
+Bodies smaller than COMPRESSION_MIN_SIZE are sent as they are. Streaming responses of compressible types
+(e.g. NDJSON) are compressed chunk by chunk and flushed after every chunk, so progress streams still
+arrive as they are produced.
+Classes:
+    FastJSONResponse: JSON response serialized with orjson, accepting numpy values and non-string keys.
+    CompressionMiddleware: Negotiates and applies gzip or brotli content encoding.
+Functions:
+    dumps_line(record) -> bytes: Serializes one NDJSON line with orjson.
+    ndjson_stream(records, batch_size) -> Iterator[bytes]: Encodes records as NDJSON chunks of batch_size lines.
+"""
+import os
+import zlib
+import orjson
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this many bytes are not worth compressing
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+# Brotli quality 4 compresses better than gzip at a similar speed, higher qualities are much slower
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/xml",
+                      "application/javascript", "image/svg+xml")
+
+# Number of NDJSON lines sent per chunk by bulk streams
+NDJSON_BATCH_SIZE = int(os.getenv("NDJSON_BATCH_SIZE", "1000"))
+
+# Dict keys are often corpus ids (ints) and results may hold numpy scalars or arrays
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+def dumps_line(record) -> bytes:
+    return orjson.dumps(record, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+# Batching lines keeps per-chunk overhead (and the compression flush per chunk) off bulk streams;
+# progress streams use batch_size=1 so every update is sent at once
+def ndjson_stream(records, batch_size: int = NDJSON_BATCH_SIZE):
+    chunk = []
+    for record in records:
+        chunk.append(dumps_line(record))
+        if len(chunk) >= batch_size:
+            yield b"".join(chunk)
+            chunk.clear()
+    if chunk:
+        yield b"".join(chunk)
+
+# Pick the accepted encoding with the highest quality value, preferring brotli on ties
+def negotiate_encoding(accept_encoding: str):
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    qualities = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        qualities[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            # wbits 16 + MAX_WBITS writes the gzip header and trailer
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    # Compress a chunk; flush=True emits everything so far so the client can decode it immediately
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + self._brotli.flush() if flush else out
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first body chunk shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or "content-range" in headers
+                        or start_message["status"] in (204, 206, 304)
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                # The encoded bytes differ from the identity representation the ETag was computed for
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["etag"] = f"W/{etag}"
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    body = compressor.compress(body) + compressor.finish()
+                    headers["content-length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            if more_body:
+                chunk = compressor.compress(body, flush=True)
+            else:
+                chunk = compressor.compress(body) + compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
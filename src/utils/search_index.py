@@ -0,0 +1,153 @@
+"""
+search_index.py
+This module keeps a full-text search index over the articles of the last upload.
+The index is an SQLite FTS5 table (an inverted index with BM25 ranking) persisted in the artifacts directory
+next to the uploaded data, so every API worker searches the same index. process_csv resets it when an upload
+starts and adds the articles in small batches as they complete, which keeps the index current while an upload
+runs. Data uploaded before the index existed is indexed from the data artifact on the first search.
+Classes:
+    SearchIndexWriter: Buffers completed articles and adds them to the index in batches.
+Functions:
+    reset_index(): Drops every indexed article.
+    build_index_from_artifact(path) -> int: Indexes the articles of a data CSV and returns their number.
+    search(query, limit) -> list: Returns the best matching articles with highlighted snippets.
+"""
+import os
+import re
+import sqlite3
+import logging
+import pandas as pd
+from utils.shared_store import SQLiteConnections, artifact_path, DATA_ARTIFACT
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_ARTIFACT = "search_index.db"
+# Completed articles buffered before they are written to the index
+SEARCH_INDEX_BATCH_SIZE = int(os.getenv("SEARCH_INDEX_BATCH_SIZE", "50"))
+# Largest number of hits a search returns
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+# Tokens around the matches in a snippet
+SEARCH_SNIPPET_TOKENS = int(os.getenv("SEARCH_SNIPPET_TOKENS", "16"))
+
+# The rowid of an article is its row index in the uploaded CSV. Porter stemming lets "rates" match "rate".
+# The meta table records that the index was built, an empty index of an upload without accessible
+# articles must not be rebuilt from the artifact on every search.
+SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS articles USING fts5(title, summary, content, tokenize = 'porter unicode61');
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# Titles count most, then summaries, then the article text
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+_connections = SQLiteConnections(artifact_path(SEARCH_INDEX_ARTIFACT), SCHEMA)
+
+def _connection():
+    return _connections.get()
+
+def _mark_built(connection):
+    connection.execute("INSERT INTO meta (key, value) VALUES ('built', '1') "
+                       "ON CONFLICT (key) DO UPDATE SET value = excluded.value")
+
+def reset_index():
+    connection = _connection()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute("DELETE FROM articles")
+        _mark_built(connection)
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+# Add (index, title, summary, content) rows in one transaction, replacing articles indexed before
+def _add_articles(rows):
+    if not rows:
+        return
+    connection = _connection()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        # FTS5 has no upsert, so an article indexed again is deleted first
+        connection.executemany("DELETE FROM articles WHERE rowid = ?", [(row[0],) for row in rows])
+        connection.executemany("INSERT INTO articles (rowid, title, summary, content) VALUES (?, ?, ?, ?)", rows)
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+# Indexing is best effort: a failing write is logged and leaves the search results incomplete, but never
+# fails the upload that feeds the index
+class SearchIndexWriter:
+    def __init__(self, batch_size: int = SEARCH_INDEX_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._rows = []
+
+    def reset(self):
+        self._rows = []
+        try:
+            reset_index()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not reset the search index: {e}")
+
+    def add(self, idx: int, title: str, summary: str, content: str):
+        self.buffer(idx, title, summary, content)
+        if self.full:
+            self.flush()
+
+    # Buffer an article without writing a full batch, for callers that flush off the event loop
+    def buffer(self, idx: int, title: str, summary: str, content: str):
+        self._rows.append((idx, title or "", summary or "", content or ""))
+
+    @property
+    def full(self) -> bool:
+        return len(self._rows) >= self.batch_size
+
+    def flush(self):
+        rows, self._rows = self._rows, []
+        try:
+            _add_articles(rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not add {len(rows)} articles to the search index: {e}")
+
+def build_index_from_artifact(path: str = None):
+    path = path or artifact_path(DATA_ARTIFACT)
+    df = pd.read_csv(path)
+    if "Accessibility" in df.columns:
+        df = df[df["Accessibility"] == "Accessible"]
+    columns = [df[name].fillna("").astype(str) if name in df.columns else pd.Series("", index=df.index)
+               for name in ("Title", "Summary", "Content")]
+    # The whole CSV is at hand, so it is written in large batches
+    writer = SearchIndexWriter(batch_size=10_000)
+    writer.reset()
+    for idx, title, summary, content in zip(df.index, *columns):
+        writer.add(int(idx), title, summary, content)
+    writer.flush()
+    return len(df)
+
+def _index_built(connection) -> bool:
+    return connection.execute("SELECT 1 FROM meta WHERE key = 'built'").fetchone() is not None
+
+# Every word of the query must match; words are quoted so FTS5 operators in user input stay plain text
+def _match_expression(query: str):
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"' for word in words)
+
+def search(query: str, limit: int = 10):
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {SEARCH_MAX_LIMIT}")
+    expression = _match_expression(query)
+    if not expression:
+        raise ValueError("The search query must contain at least one word")
+    connection = _connection()
+    if not _index_built(connection) and os.path.exists(artifact_path(DATA_ARTIFACT)):
+        build_index_from_artifact()
+
+    weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+    # snippet() picks the column with the best match when given column -1
+    rows = connection.execute(
+        f"SELECT rowid, title, snippet(articles, -1, '**', '**', '...', ?), bm25(articles, {weights}) AS score "
+        f"FROM articles WHERE articles MATCH ? ORDER BY score LIMIT ?",
+        (SEARCH_SNIPPET_TOKENS, expression, limit))
+    # bm25() is negative with the best match lowest, the API returns positive scores with the best highest
+    return [{"index": idx, "title": title, "snippet": snippet, "score": round(-score, 4)}
+            for idx, title, snippet, score in rows]
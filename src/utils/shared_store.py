@@ -0,0 +1,302 @@
+"""
+shared_store.py
+This module holds the state shared by every API worker process, so the API can run several uvicorn workers
+behind one port: a key/value store for progress, job records and the graph generation counter, the
+directory of the generated artifacts (the processed data CSV and the clustering plots), and the storage of
+the rate limiter.
+The store is selected with the SHARED_STORE_URI environment variable. Other stores (e.g. Redis) can be
+plugged in with register_store.
+Stores:
+    sqlite:///<path> (default sqlite:///shared_state.db): SQLiteStore, a SQLite database file shared by the
+        workers of one host.
+    memory://: MemoryStore, process-local, for a single worker.
+Classes:
+    SharedStore: Interface of the key/value stores.
+    SQLiteLimitStorage: Rate limit storage of the limits package for sqlite:/// URIs.
+    SQLiteConnections: Per-thread connections to a SQLite database file, also used by the search index.
+Functions:
+    get_store() -> SharedStore: Returns the process-wide store.
+    register_store(scheme, factory): Makes a store available under a URI scheme.
+    publish_progress(name, progress, force): Stores a progress update, at most every PROGRESS_PUBLISH_INTERVAL.
+    get_progress(name) -> Optional[dict]: Returns the latest stored progress update.
+    artifact_path(name) -> str: Returns the path of an artifact.
+    writing_artifact(name): Context manager yielding a temporary path that replaces the artifact on success.
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+import time
+import orjson
+from limits.storage import Storage
+from dotenv import load_dotenv
+from utils.responses import ORJSON_OPTIONS
+
+# Load environment variables from .env file
+load_dotenv()
+
+SHARED_STORE_URI = os.getenv("SHARED_STORE_URI", "sqlite:///shared_state.db")
+# Any limits storage URI (e.g. redis://host:6379); by default the limits share the store's database
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", SHARED_STORE_URI)
+ARTIFACTS_DIR = os.getenv("ARTIFACTS_DIR", "artifacts")
+# Minimum number of seconds between two stored updates of the same progress, except status changes
+PROGRESS_PUBLISH_INTERVAL = float(os.getenv("PROGRESS_PUBLISH_INTERVAL", "0.5"))
+# Milliseconds a writer waits for the SQLite write lock held by another worker
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+
+# Artifacts written by the pipeline and served by the API
+DATA_ARTIFACT = "printed_data.csv"
+# The data artifact without the full article content
+DATA_LIGHT_ARTIFACT = "printed_data_light.csv"
+DENDROGRAM_ARTIFACT = "hierarchical_clustering.png"
+LDA_PLOT_ARTIFACT = "lda_clusters.png"
+
+# Values are stored as JSON text; job results may hold numpy values and non-string keys
+def _encode(value) -> str:
+    return orjson.dumps(value, option=ORJSON_OPTIONS).decode("utf-8")
+
+class SharedStore(ABC):
+    # Return the JSON value stored under key, or default
+    @abstractmethod
+    def get(self, key: str, default=None): ...
+
+    @abstractmethod
+    def set(self, key: str, value): ...
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    # Return the (key, value) pairs whose key starts with prefix
+    @abstractmethod
+    def items(self, prefix: str): ...
+
+    # Atomically add amount to an integer counter (0 when missing) and return its new value
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1) -> int: ...
+
+    @abstractmethod
+    def counter(self, key: str) -> int: ...
+
+class MemoryStore(SharedStore):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._counters = {}
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            value = self._values.get(key)
+        # Stored as JSON like the other stores, so callers never share a mutable value
+        return default if value is None else orjson.loads(value)
+
+    def set(self, key: str, value):
+        encoded = _encode(value)
+        with self._lock:
+            self._values[key] = encoded
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def items(self, prefix: str):
+        with self._lock:
+            matches = [(key, value) for key, value in self._values.items() if key.startswith(prefix)]
+        return [(key, orjson.loads(value)) for key, value in matches]
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            return self._counters[key]
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+# Path of the database file of a sqlite:///<path> URI (four slashes for an absolute path)
+def _sqlite_path(uri: str) -> str:
+    if not uri.startswith("sqlite:///"):
+        raise ValueError(f"Invalid SQLite URI '{uri}', expected sqlite:///<path>")
+    return uri[len("sqlite:///"):]
+
+class SQLiteConnections:
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    # Connection of the calling thread, opened again after a fork so workers never share one
+    def get(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Autocommit, transactions are opened explicitly where several statements must be atomic
+            connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT / 1000, isolation_level=None)
+            # WAL lets readers proceed while another worker writes; NORMAL sync does not fsync every commit
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.schema)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+class SQLiteStore(SharedStore):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+
+    def __init__(self, uri: str):
+        self._connections = SQLiteConnections(_sqlite_path(uri), self.SCHEMA)
+
+    def get(self, key: str, default=None):
+        row = self._connections.get().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return default if row is None else orjson.loads(row[0])
+
+    def set(self, key: str, value):
+        self._connections.get().execute(
+            "INSERT INTO kv (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, _encode(value)))
+
+    def delete(self, key: str):
+        self._connections.get().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def items(self, prefix: str):
+        # A range scan on the primary key instead of LIKE, whose wildcards could appear in the prefix
+        rows = self._connections.get().execute(
+            "SELECT key, value FROM kv WHERE key >= ? AND key < ? ORDER BY key", (prefix, prefix + "\uffff"))
+        return [(key, orjson.loads(value)) for key, value in rows]
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        connection = self._connections.get()
+        # IMMEDIATE takes the write lock up front, so the read below sees the value this write updates
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO counters (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = value + excluded.value", (key, amount))
+            value = connection.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()[0]
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return value
+
+    def counter(self, key: str) -> int:
+        row = self._connections.get().execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+        return 0 if row is None else row[0]
+
+# Fixed-window counters of the rate limiter (the strategy slowapi uses), shared through the SQLite file
+class SQLiteLimitStorage(Storage):
+    STORAGE_SCHEME = ["sqlite"]
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL);
+    """
+    # Expired windows are deleted on every this many increments
+    PURGE_EVERY = 1000
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        self._connections = SQLiteConnections(_sqlite_path(uri), self.SCHEMA)
+        self._increments = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        connection = self._connections.get()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # An expired window restarts at amount, elastic windows are extended on every hit
+            connection.execute(
+                "INSERT INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END, "
+                "expires_at = CASE WHEN expires_at <= ? OR ? THEN excluded.expires_at ELSE expires_at END",
+                (key, amount, now + expiry, now, now, elastic_expiry))
+            count = connection.execute("SELECT count FROM rate_limits WHERE key = ?", (key,)).fetchone()[0]
+            self._increments += 1
+            if self._increments % self.PURGE_EVERY == 0:
+                connection.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return count
+
+    def get(self, key: str) -> int:
+        row = self._connections.get().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return 0 if row is None else row[0]
+
+    def get_expiry(self, key: str) -> float:
+        row = self._connections.get().execute(
+            "SELECT expires_at FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None and row[0] > time.time() else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._connections.get().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connections.get().execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str):
+        self._connections.get().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+_STORE_FACTORIES = {
+    "sqlite": SQLiteStore,
+    "memory": lambda uri: MemoryStore(),
+}
+
+# Make a store available under a URI scheme; factory is called with the full URI
+def register_store(scheme: str, factory):
+    _STORE_FACTORIES[scheme] = factory
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store() -> SharedStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            scheme = SHARED_STORE_URI.split("://", 1)[0]
+            if scheme not in _STORE_FACTORIES:
+                raise ValueError(f"Unknown SHARED_STORE_URI scheme '{scheme}', expected one of {list(_STORE_FACTORIES)}")
+            _store = _STORE_FACTORIES[scheme](SHARED_STORE_URI)
+        return _store
+
+_last_published = {}
+
+# Store a progress update under progress:<name>. Updates closer than PROGRESS_PUBLISH_INTERVAL to the
+# previous one are dropped unless force is set (status changes), so hot loops do not write every step.
+def publish_progress(name: str, progress: dict, force: bool = False):
+    now = time.monotonic()
+    if not force and now - _last_published.get(name, float("-inf")) < PROGRESS_PUBLISH_INTERVAL:
+        return
+    _last_published[name] = now
+    get_store().set(f"progress:{name}", progress)
+
+def get_progress(name: str):
+    return get_store().get(f"progress:{name}")
+
+def artifact_path(name: str) -> str:
+    return os.path.join(ARTIFACTS_DIR, name)
+
+# Write an artifact to a private temporary file and move it into place, so other workers serving the
+# artifact never read a partial file
+@contextmanager
+def writing_artifact(name: str):
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    path = artifact_path(name)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{os.path.splitext(name)[1]}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
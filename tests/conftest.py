@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The API runs from src/, so its modules import each other as top-level packages
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+os.environ.setdefault("SHARED_STORE_URI", "memory://")
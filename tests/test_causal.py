@@ -0,0 +1,9 @@
+import math
+from services.causal import sanitize_correlation_record
+
+def test_sanitize_correlation_record_rounds_finite_scores():
+    assert sanitize_correlation_record({"id1": 0, "id2": 1, "correlation": 0.123456789})["correlation"] == 0.12346
+
+def test_sanitize_correlation_record_nulls_non_finite_scores():
+    for corr in (math.nan, math.inf, -math.inf, None):
+        assert sanitize_correlation_record({"correlation": corr})["correlation"] is None
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from scipy.cluster.hierarchy import linkage
+from scipy.spatial.distance import squareform
+import services.cluster as cluster
+from services.cluster import (build_condensed_distances, condensed_distances_from_edges,
+                              estimate_clustering_memory, ids_to_positions, label_propagation,
+                              perform_hierarchical_clustering)
+from services.graph_analytics import modularity
+
+# Symmetric correlation matrix of 6 documents with a unit diagonal
+def _similarity(n=6, seed=0):
+    rng = np.random.default_rng(seed)
+    upper = np.triu(rng.uniform(-1, 1, (n, n)), 1)
+    return upper + upper.T + np.eye(n)
+
+def _edges(similarity, doc_ids=None):
+    n = len(similarity)
+    doc_ids = range(n) if doc_ids is None else doc_ids
+    return [(doc_ids[i], doc_ids[j], float(similarity[i, j])) for i in range(n) for j in range(i + 1, n)]
+
+def test_condensed_distances_match_squareform_of_dense_matrix():
+    similarity = _similarity()
+    ids1, ids2, scores = zip(*_edges(similarity))
+    dense = np.sqrt(np.maximum(2 * (1 - similarity), 0))
+    np.fill_diagonal(dense, 0)
+    condensed = build_condensed_distances(ids1, ids2, scores, len(similarity))
+    np.testing.assert_allclose(condensed, squareform(dense, checks=False))
+
+def test_condensed_distances_ignore_direction_self_pairs_and_missing_scores():
+    condensed = build_condensed_distances([1, 2, 0, 0], [0, 2, 2, 1], [0.5, 1.0, np.nan, 0.5], 3)
+    # Pair (0, 1) from either direction, the NaN pair (0, 2) and the absent pair (1, 2) have similarity 0
+    np.testing.assert_allclose(condensed, [1.0, np.sqrt(2), np.sqrt(2)])
+
+def test_build_condensed_distances_needs_two_documents():
+    with pytest.raises(ValueError):
+        build_condensed_distances([], [], [], 1)
+
+def test_ward_linkage_matches_scipy():
+    similarity = _similarity(8, seed=1)
+    distances = condensed_distances_from_edges(iter(_edges(similarity)), len(similarity), chunk_size=5)
+    dense = np.sqrt(np.maximum(2 * (1 - similarity), 0))
+    np.fill_diagonal(dense, 0)
+    expected = linkage(squareform(dense, checks=False), method="ward")
+    np.testing.assert_allclose(perform_hierarchical_clustering(distances), expected)
+    # A square matrix is still accepted
+    np.testing.assert_allclose(perform_hierarchical_clustering(dense), expected)
+
+def test_ids_to_positions_drops_pairs_with_unknown_ids():
+    doc_ids = np.array([3, 7, 11])
+    pos1, pos2, scores = ids_to_positions(doc_ids, np.array([3, 7, 4, 11, 12]), np.array([11, 3, 7, 20, 7]),
+                                          np.array([0.1, 0.2, 0.3, 0.4, 0.5]))
+    assert pos1.tolist() == [0, 1]
+    assert pos2.tolist() == [2, 0]
+    assert scores.tolist() == [0.1, 0.2]
+
+def test_hierarchical_linkage_orders_leaves_by_corpus_id(monkeypatch):
+    similarity = _similarity(5, seed=2)
+    doc_ids = [10, 12, 15, 21, 30]
+    monkeypatch.setattr(cluster, "stream_corpora", lambda dataset=None: iter(
+        [(corpus_id, f"Article {corpus_id}") for corpus_id in doc_ids]))
+    # Edges to corpora of another dataset are ignored
+    edges = _edges(similarity, doc_ids) + [(10, 99, 0.9)]
+    monkeypatch.setattr(cluster, "stream_correlation_edges", lambda dataset=None: iter(edges))
+    result = cluster.compute_hierarchical_linkage("dataset")
+    assert result["ids"] == doc_ids
+    np.testing.assert_allclose(result["linkage"], perform_hierarchical_clustering(
+        build_condensed_distances(*zip(*_edges(similarity)), len(doc_ids))))
+
+def test_estimate_clustering_memory():
+    # Two float64 copies of the 45 distances and the 9 x 4 float64 linkage matrix
+    assert estimate_clustering_memory(10) == 45 * 8 * 2 + 9 * 4 * 8
+
+def _graph(n, edges):
+    rows, cols = zip(*edges)
+    upper = sp.coo_matrix((np.ones(len(edges)), (rows, cols)), shape=(n, n))
+    return (upper + upper.T).tocsr()
+
+def test_label_propagation_settles_on_a_path():
+    adjacency = _graph(12, [(i, i + 1) for i in range(11)])
+    labels = label_propagation(adjacency)
+    assert modularity(adjacency, labels) >= 0
+    # Communities are runs of the path, not alternating labels
+    assert all(len(np.flatnonzero(labels == label)) >= 2 for label in np.unique(labels))
+
+def test_label_propagation_settles_on_bipartite_graphs():
+    cycle = _graph(8, [(i, (i + 1) % 8) for i in range(8)])
+    complete = _graph(7, [(i, j) for i in range(3) for j in range(3, 7)])
+    for adjacency in (cycle, complete):
+        assert modularity(adjacency, label_propagation(adjacency)) >= 0
+
+def test_label_propagation_recovers_two_cliques_joined_by_a_bridge():
+    edges = [(i, j) for group in (range(5), range(5, 10)) for i in group for j in group if i < j]
+    adjacency = _graph(10, edges + [(4, 5)])
+    labels = label_propagation(adjacency)
+    assert labels.tolist() == [1] * 5 + [2] * 5
+    assert modularity(adjacency, labels) > 0.4
+
+def test_label_propagation_keeps_isolated_nodes_apart():
+    assert label_propagation(sp.csr_matrix((3, 3))).tolist() == [1, 2, 3]
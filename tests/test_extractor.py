@@ -0,0 +1,53 @@
+import asyncio
+import json
+import threading
+import services.extractor as extractor
+
+class RecordingWriter:
+    batch_size = 2
+
+    def __init__(self):
+        self.rows, self._buffer, self.threads = [], [], []
+
+    def reset(self):
+        self.threads.append(threading.get_ident())
+
+    def buffer(self, idx, title, summary, content):
+        self._buffer.append(idx)
+
+    @property
+    def full(self):
+        return len(self._buffer) >= self.batch_size
+
+    def flush(self):
+        self.threads.append(threading.get_ident())
+        self.rows.extend(self._buffer)
+        self._buffer = []
+
+async def fake_parse_html_content(url, queue, idx, ratio=0.1, max_sentences=10):
+    await queue.put((idx, f"Title {idx}", "content", "summary", "Accessible"))
+
+def test_process_csv_writes_the_search_index_off_the_event_loop(monkeypatch):
+    writers, written = [], []
+    def make_writer():
+        writers.append(RecordingWriter())
+        return writers[-1]
+    monkeypatch.setattr(extractor, "SearchIndexWriter", make_writer)
+    monkeypatch.setattr(extractor, "parse_html_content", fake_parse_html_content)
+    monkeypatch.setattr(extractor, "print_data_to_file",
+                        lambda df: written.append(threading.get_ident()) or "Data printed")
+    monkeypatch.setattr(extractor, "publish_progress", lambda *args, **kwargs: None)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        contents = ("URL\n" + "".join(f"http://example.com/{i}\n" for i in range(5))).encode("utf-8")
+        updates = [json.loads(update) async for update in extractor.process_csv(contents)]
+        return loop_thread, updates
+
+    loop_thread, updates = asyncio.run(run())
+    assert updates[-1]["status"] == "complete"
+    writer = writers[0]
+    assert sorted(writer.rows) == [0, 1, 2, 3, 4]
+    # reset, two full batches and the final flush, none of them on the event loop's thread
+    assert len(writer.threads) == 4
+    assert loop_thread not in writer.threads + written
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+import services.graph_analytics as graph_analytics
+from services.graph_analytics import modularity, pagerank, top_k_edges
+
+nx = pytest.importorskip("networkx")
+
+# Weighted graph of two triangles joined by a weak edge, a pendant node and an isolated node
+EDGES = [(0, 1, 0.9), (0, 2, 0.8), (1, 2, 0.7), (2, 3, 0.2), (3, 4, 0.6), (3, 5, 0.9), (4, 5, 0.5), (5, 6, 0.3)]
+N = 8
+
+def _adjacency():
+    rows, cols, weights = zip(*EDGES)
+    upper = sp.coo_matrix((weights, (rows, cols)), shape=(N, N))
+    return (upper + upper.T).tocsr()
+
+def _networkx_graph():
+    graph = nx.Graph()
+    graph.add_nodes_from(range(N))
+    graph.add_weighted_edges_from(EDGES)
+    return graph
+
+def test_modularity_matches_networkx():
+    labels = np.array([0, 0, 0, 1, 1, 1, 1, 2])
+    communities = [set(np.flatnonzero(labels == label)) for label in np.unique(labels)]
+    expected = nx.community.modularity(_networkx_graph(), communities, weight="weight")
+    assert modularity(_adjacency(), labels) == pytest.approx(expected)
+
+def test_pagerank_matches_networkx():
+    expected = nx.pagerank(_networkx_graph(), alpha=0.85, weight="weight", tol=1e-12, max_iter=1000)
+    ranks = pagerank(_adjacency(), damping=0.85, tol=1e-12, max_iter=1000)
+    np.testing.assert_allclose(ranks, [expected[node] for node in range(N)], rtol=1e-6)
+
+def test_top_k_edges_keeps_the_best_pairs_of_either_node():
+    # Node 0 is correlated with every other node, nodes 1-4 only with node 0
+    rows, cols = np.zeros(4, dtype=np.int64), np.arange(1, 5)
+    scores = np.array([0.9, 0.8, 0.7, 0.6], dtype=np.float32)
+    kept = top_k_edges(rows, cols, scores, 5, 1)
+    # Every pair is the best of its second node
+    assert kept[1].tolist() == [1, 2, 3, 4]
+    # With a fifth node linked to 1 and 2 only, the weakest pairs of node 0 now lose on both sides
+    rows = np.array([0, 0, 0, 0, 1, 2])
+    cols = np.array([1, 2, 3, 4, 5, 5])
+    scores = np.array([0.9, 0.2, 0.7, 0.6, 0.95, 0.9], dtype=np.float32)
+    kept_rows, kept_cols, _ = top_k_edges(rows, cols, scores, 6, 1)
+    assert sorted(zip(kept_rows.tolist(), kept_cols.tolist())) == [(0, 1), (0, 3), (0, 4), (1, 5), (2, 5)]
+
+def test_correlation_matrix_keeps_the_threshold_and_top_k(monkeypatch):
+    corpora = [(corpus_id, f"Article {corpus_id}") for corpus_id in (10, 11, 12, 13)]
+    edges = [(10, 11, 0.9), (11, 10, 0.9), (10, 12, 0.5), (10, 13, 0.4), (11, 12, 0.3), (12, 13, None),
+             (12, 12, 1.0), (10, 99, 0.8)]
+    monkeypatch.setattr(graph_analytics, "stream_corpora", lambda dataset=None: iter(corpora))
+    monkeypatch.setattr(graph_analytics, "stream_correlation_edges", lambda dataset=None: iter(edges))
+    graph = graph_analytics._load_correlation_matrix(None, 0.35, 1)
+    matrix = graph["matrix"].toarray()
+    assert graph["ids"] == [10, 11, 12, 13]
+    # 11-12 is below the threshold, and the top-1 graph keeps each node's best pair
+    expected = np.zeros((4, 4), dtype=np.float32)
+    for i, j, score in ((0, 1, 0.9), (0, 2, 0.5), (0, 3, 0.4)):
+        expected[i, j] = expected[j, i] = score
+    np.testing.assert_allclose(matrix, expected)
+    # Without a cap every correlation >= threshold is kept
+    assert graph_analytics._load_correlation_matrix(None, 0.35, 0)["matrix"].nnz == 6
@@ -0,0 +1,41 @@
+import numpy as np
+from sklearn.decomposition import LatentDirichletAllocation
+import utils.lda as lda
+from utils.lda import LDA
+
+WORDS = ["market", "stocks", "bank", "rates", "river", "fish", "boat", "water", "vote", "party"]
+
+def _corpus(n_docs, seed=0):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, 12)) + f" doc{i}" for i in range(n_docs)]
+
+def test_sweep_trains_on_the_rows_it_does_not_hold_out(monkeypatch, tmp_path):
+    monkeypatch.setattr(lda, "LDA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(lda, "LDA_SWEEP_HOLDOUT", 0.2)
+    scores, best = lda.sweep_topic_counts(_corpus(20), [2], max_iter=2, max_workers=1)
+    train_rows, holdout_rows = lda._holdout_split(20, 42)
+    assert best["train_rows"].tolist() == train_rows.tolist()
+    assert len(train_rows) == 16 and not set(train_rows) & set(holdout_rows)
+
+def test_incremental_update_trains_on_documents_held_out_before(monkeypatch, tmp_path):
+    monkeypatch.setattr(lda, "LDA_CACHE_DIR", str(tmp_path))
+    corpus = _corpus(10)
+    model_path = str(tmp_path / "model.joblib")
+    model = LDA(n_topics=2, max_iter=2)
+    model.fit_transform(corpus[:7])
+    # The last three documents were held out, so they are not recorded as seen
+    model.save_state(model_path, corpus[:7])
+
+    fitted = []
+    partial_fit = LatentDirichletAllocation.partial_fit
+    def recording_partial_fit(self, X, y=None):
+        fitted.append(X.shape[0])
+        return partial_fit(self, X, y)
+    monkeypatch.setattr(LatentDirichletAllocation, "partial_fit", recording_partial_fit)
+
+    clusters, _ = LDA(n_topics=2, max_iter=2).partial_fit_transform(corpus, model_path)
+    assert fitted == [3]
+    assert len(clusters) == 10
+    # Every document has been trained on now, a second update has nothing to fold in
+    LDA(n_topics=2, max_iter=2).partial_fit_transform(corpus, model_path)
+    assert fitted == [3]
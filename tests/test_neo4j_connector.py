@@ -0,0 +1,80 @@
+import orjson
+from neo4j import Record
+from utils.neo4j_connector import Neo4jConnector
+from utils.responses import FastJSONResponse
+
+class FakeTransaction:
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+
+    def run(self, query, **parameters):
+        self.queries.append((query, parameters))
+        return iter(self.records)
+
+def test_query_by_title_returns_json_serializable_records():
+    records = [Record(zip(["id", "title", "text"], [3, "Rates rise", "The central bank raised rates."]))]
+    tx = FakeTransaction(records)
+
+    result = Neo4jConnector._query_by_title(tx, "Rates rise")
+
+    assert result == [{"id": 3, "title": "Rates rise", "text": "The central bank raised rates."}]
+    assert tx.queries[0][1] == {"title": "Rates rise"}
+    # The endpoint returns the records through orjson, which rejects neo4j Node objects
+    body = FastJSONResponse({"result": result}).body
+    assert orjson.loads(body) == {"result": result}
+
+def test_clear_queries_do_not_collect_distinct_relationships():
+    for dataset in (None, "default"):
+        for stage in ("edges", "nodes"):
+            assert "DISTINCT" not in Neo4jConnector._clear_match(stage, dataset)
+    assert Neo4jConnector._clear_match("edges", None).startswith("MATCH ()-[r]->()")
+
+class FakeSession:
+    def __init__(self, records_by_query):
+        self.records_by_query = records_by_query
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute_read(self, work, *args):
+        return work(self, *args)
+
+    def run(self, query, **parameters):
+        self.queries.append(query)
+        for fragment, records in self.records_by_query.items():
+            if fragment in query:
+                return iter(records)
+        return iter([])
+
+class FakeDriver:
+    def __init__(self, session):
+        self._session = session
+
+    def session(self):
+        return self._session
+
+def connector_with(session):
+    connector = Neo4jConnector.__new__(Neo4jConnector)
+    connector.driver = FakeDriver(session)
+    return connector
+
+def test_pairwise_causal_falls_back_to_relationships_without_neighbor_lists():
+    keys = ["corpusTitle", "highestCorrelationCorpus", "highestCorrelation"]
+    session = FakeSession({"[r:CORRELATED]": [Record(zip(keys, ["a1", "a2", 0.61]))]})
+
+    result = connector_with(session).query_pairwise_causal()
+
+    assert result == [{"corpusTitle": "a1", "highestCorrelationCorpus": "a2", "highestCorrelation": 0.61}]
+    assert "neighbor_ids" in session.queries[0] and "[r:CORRELATED]" in session.queries[1]
+
+def test_pairwise_causal_reads_materialized_neighbor_lists():
+    keys = ["corpusTitle", "highestCorrelationCorpus", "highestCorrelation"]
+    session = FakeSession({"neighbor_ids": [Record(zip(keys, ["a1", "a2", 0.61]))]})
+
+    assert connector_with(session).query_pairwise_causal()[0]["corpusTitle"] == "a1"
+    assert len(session.queries) == 1
@@ -0,0 +1,47 @@
+import numpy as np
+import services.cluster as cluster
+import services.network as network
+
+# A star around corpus 0 and a chain 3-4-5, each neighbour list stored best first
+CORPORA = [(corpus_id, f"Article {corpus_id}") for corpus_id in range(7)]
+NEIGHBORS = [
+    (0, [1, 2, 3], [0.9, 0.8, 0.7]),
+    (1, [0, 2], [0.9, 0.5]),
+    (2, [0, 1], [0.8, 0.5]),
+    (3, [4, 0], [0.95, 0.7]),
+    (4, [3, 5], [0.95, 0.6]),
+    (5, [4], [0.6]),
+    (6, [], []),
+]
+
+def _patch(monkeypatch):
+    monkeypatch.setattr(network, "stream_corpora", lambda dataset=None: iter(CORPORA))
+    monkeypatch.setattr(cluster, "stream_neighbor_lists", lambda: iter(NEIGHBORS))
+
+def _edge_pairs(result):
+    ids = result["nodes"]["id"]
+    return {(ids[s], ids[t]) for s, t in zip(result["edges"]["source"], result["edges"]["target"])}
+
+def test_network_keeps_only_the_top_k_neighbours(monkeypatch):
+    _patch(monkeypatch)
+    result = network.compute_correlation_network(top_k=1)
+    # Every corpus contributes its best neighbour, in either direction
+    assert _edge_pairs(result) == {(0, 1), (0, 2), (3, 4), (4, 5)}
+    # Corpus 6 has no edge and is dropped
+    assert result["nodes"]["id"] == [0, 1, 2, 3, 4, 5]
+    assert result["total_nodes"] == 7
+
+def test_network_applies_the_threshold(monkeypatch):
+    _patch(monkeypatch)
+    result = network.compute_correlation_network(top_k=3, threshold=0.75)
+    assert _edge_pairs(result) == {(0, 1), (0, 2), (3, 4)}
+
+def test_network_keeps_the_heaviest_max_nodes(monkeypatch):
+    _patch(monkeypatch)
+    result = network.compute_correlation_network(top_k=3, max_nodes=3)
+    # Weighted degrees: 0 -> 2.4, 3 -> 1.65, 4 -> 1.55, 1 -> 1.4, 2 -> 1.3, 5 -> 0.6
+    assert result["nodes"]["id"] == [0, 3, 4]
+    assert _edge_pairs(result) == {(0, 3), (3, 4)}
+    positions = np.column_stack([result["nodes"]["x"], result["nodes"]["y"]])
+    assert positions.shape == (3, 2)
+    assert np.all(np.abs(positions) <= 1)